@@ -0,0 +1,180 @@
+"""
+Per-command metrics of recorded runs.
+
+Rows of a run are split into segments of consecutive rows with the same `command_ind`,
+all metrics are computed for all segments at once with `np.*.reduceat`.
+"""
+from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+import numpy as np
+
+from analysis.runs import CURSOR_COLUMNS, RunData, load_run, run_group_names
+from experiments_common.experiment_catalog import split_experiment_group_name
+
+
+METRICS_COLUMNS = ['timestamp_sec', 'command_ind', 'command_code', 'best_match_command_code', 'target_pix']
+
+
+def command_segments(command_ind: np.ndarray):
+    """Start row of each segment of equal command indexes and rows count, rows with negative index are dropped"""
+    command_ind = command_ind.reshape(-1)
+    rows = np.flatnonzero(command_ind >= 0)
+    if len(rows) == 0:
+        return rows, rows, rows
+    valid_ind = command_ind[rows]
+    starts = np.flatnonzero(np.r_[True, valid_ind[1:] != valid_ind[:-1]])
+    counts = np.diff(np.r_[starts, len(rows)])
+    return rows, starts, counts
+
+
+def compute_command_metrics(timestamps: np.ndarray, command_ind: np.ndarray, command_code: np.ndarray,
+                            best_match_command_code: np.ndarray, target_pix: np.ndarray|None = None,
+                            cursor_pix: np.ndarray|None = None) -> Dict[str, np.ndarray]:
+    """
+    Metrics of each command, one value per command in every returned column:
+        duration_sec - time from first row of the command to first row of the next one
+        time_to_acquire_sec - time until best match command became the target one for the first time, nan if never
+        dwell_density - fraction of rows where best match command is the target one
+        mean_distance_pix - mean distance from cursor to target, over rows where cursor is known
+        path_length_pix - length of cursor path, jumps over rows without cursor are not counted
+    """
+    rows, starts, counts = command_segments(command_ind)
+    timestamps = timestamps.reshape(-1)[rows]
+    code = command_code.reshape(-1)[rows]
+    hit = best_match_command_code.reshape(-1)[rows] == code
+
+    start_time = timestamps[starts]
+    end_time = np.r_[start_time[1:], timestamps[-1:]]
+    result = {
+        'command_ind': command_ind.reshape(-1)[rows][starts],
+        'command_code': code[starts],
+        'start_time': start_time,
+        'duration_sec': end_time - start_time,
+        'num_samples': counts,
+    }
+    if len(starts) == 0:
+        result.update({name: np.zeros(0) for name in ['time_to_acquire_sec', 'dwell_density', 'mean_distance_pix',
+                                                       'path_length_pix', 'cursor_valid_fraction']})
+        return result
+
+    first_hit = np.minimum.reduceat(np.where(hit, np.arange(len(rows)), len(rows)), starts)
+    acquired = first_hit < len(rows)
+    result['time_to_acquire_sec'] = np.where(acquired, timestamps[np.minimum(first_hit, len(rows) - 1)] - start_time, np.nan)
+    result['dwell_density'] = np.add.reduceat(hit, starts) / counts
+
+    if cursor_pix is None or target_pix is None:
+        nan = np.full(len(starts), np.nan)
+        result.update(mean_distance_pix=nan, path_length_pix=nan.copy(), cursor_valid_fraction=nan.copy())
+        return result
+
+    cursor = cursor_pix.reshape(len(command_ind), -1)[rows]
+    target = target_pix.reshape(len(command_ind), -1)[rows]
+    distance = np.linalg.norm(cursor - target, axis=1)
+    valid = ~np.isnan(distance)
+    num_valid = np.add.reduceat(valid, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['mean_distance_pix'] = np.add.reduceat(np.where(valid, distance, 0.), starts) / num_valid
+
+    step = np.r_[0., np.linalg.norm(np.diff(cursor, axis=0), axis=1)]
+    step[starts] = 0. # no step between the last row of previous command and the first row of the next one
+    result['path_length_pix'] = np.add.reduceat(np.nan_to_num(step, nan=0.), starts)
+    result['cursor_valid_fraction'] = num_valid / counts
+    return result
+
+
+def command_executed(command_ind: np.ndarray, command_onsets: np.ndarray|None) -> np.ndarray:
+    """
+    1 if command was executed successfully (next command onset was forced by dwell), 0 if it timed out,
+    -1 if unknown (no `command_onsets` dataset in the record or experiment was interrupted on this command)
+    """
+    executed = np.full(len(command_ind), -1, np.int8)
+    if command_onsets is None or len(command_onsets) == 0:
+        return executed
+    # onset of command k+1 tells how command k ended, the last onset wins if there are several
+    previous_ind = command_onsets['command_ind'].astype(np.int64) - 1
+    order = np.argsort(previous_ind, kind='stable')
+    previous_ind = previous_ind[order]
+    forced = command_onsets['forced'][order].astype(np.int8)
+    pos = np.maximum(np.searchsorted(previous_ind, command_ind, side='right') - 1, 0)
+    found = previous_ind[pos] == command_ind
+    executed[found] = forced[pos[found]]
+    return executed
+
+
+def run_command_metrics(run: RunData) -> Dict[str, np.ndarray]:
+    columns = run.columns
+    cursor_column = CURSOR_COLUMNS.get(run.experiment_tag())
+    return compute_command_metrics(columns['timestamp_sec'], columns['command_ind'], columns['command_code'],
+                                   columns.get('best_match_command_code', np.full(run.num_rows(), -1)),
+                                   columns.get('target_pix'), columns.get(cursor_column))
+
+
+def _analyse_runs(save_file, group_names: List[str]) -> Dict[str, np.ndarray]:
+    results = []
+    for group_name in group_names:
+        experiment_tag, person, run_key = split_experiment_group_name(group_name)
+        run = load_run(save_file, group_name, [*METRICS_COLUMNS, CURSOR_COLUMNS.get(experiment_tag, 'target_pix')])
+        if 'timestamp_sec' not in run.columns or 'command_ind' not in run.columns:
+            continue
+        metrics = run_command_metrics(run)
+        onsets = load_run(save_file, group_name, ['command_onsets']).columns.get('command_onsets')
+        metrics['executed'] = command_executed(metrics['command_ind'], onsets)
+        num = len(metrics['command_ind'])
+        metrics['experiment_tag'] = np.full(num, experiment_tag)
+        metrics['person'] = np.full(num, person)
+        metrics['run_key'] = np.full(num, run_key)
+        metrics['test_id'] = np.full(num, str(run.attrs.get('test_id', '')))
+        metrics['show_cursor'] = np.full(num, int(run.attrs.get('show_cursor', -1)))
+        metrics['sec_per_command'] = np.full(num, float(run.attrs.get('sec_per_command', np.nan)))
+        results.append(metrics)
+    return concatenate_columns(results)
+
+
+def concatenate_columns(tables: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    tables = [table for table in tables if len(table) > 0]
+    if len(tables) == 0:
+        return {}
+    return {name: np.concatenate([table[name] for table in tables]) for name in tables[0]}
+
+
+def analyse_file(save_file, max_workers: int|None = None, **filters) -> Dict[str, np.ndarray]:
+    """
+    Per-command metrics of all runs of the file matching `filters` (see ExperimentCatalog.runs).
+    Runs of each person are processed in a separate process, result is one table of columns
+    with experiment_tag, person, run_key, test_id, show_cursor and sec_per_command of each command.
+    """
+    return analyse_runs(save_file, run_group_names(save_file, **filters), max_workers)
+
+
+def analyse_runs(save_file, group_names: List[str], max_workers: int|None = None) -> Dict[str, np.ndarray]:
+    """Same as analyse_file for given experiment groups, `max_workers=0` processes runs in current process"""
+    by_person = defaultdict(list)
+    for group_name in group_names:
+        experiment_tag, person, _ = split_experiment_group_name(group_name)
+        by_person[person].append(group_name)
+    if max_workers == 0:
+        return concatenate_columns([_analyse_runs(save_file, names) for names in by_person.values()])
+    with ProcessPoolExecutor(max_workers) as executor:
+        tables = list(executor.map(_analyse_runs, [save_file] * len(by_person), by_person.values()))
+    return concatenate_columns(tables)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Per-command metrics of recorded experiments')
+    parser.add_argument('save_file')
+    parser.add_argument('--experiment-tag')
+    parser.add_argument('--person')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', help='save metrics columns to .npz file')
+    args = parser.parse_args()
+
+    table = analyse_file(args.save_file, args.workers, experiment_tag=args.experiment_tag, person=args.person)
+    if args.output:
+        np.savez(args.output, **table)
+    num_commands = len(table.get('command_ind', []))
+    print(f'{num_commands} commands')
+    if num_commands > 0:
+        print('mean time to acquire, s:', np.nanmean(table['time_to_acquire_sec']))
+        print('mean dwell density:', np.nanmean(table['dwell_density']))
@@ -0,0 +1,143 @@
+"""
+Per-session success rates for comparing learning with cursor feedback (show_cursor=1) and without it.
+
+A command counts as executed successfully when the subject held the cursor on the target long enough
+for ExperimentProgressControl to force the next command. Recorded data doesn't store that flag, so it
+is taken from `command_onsets` dataset when the record has it, otherwise it is re-derived from command duration:
+forced commands end before `SUCCESS_DURATION_RATIO * sec_per_command`, timed out ones last the whole `sec_per_command`.
+"""
+from typing import Dict, List
+from pathlib import Path
+import csv
+import numpy as np
+
+from analysis.command_metrics import analyse_runs, concatenate_columns
+from experiments_common.experiment_catalog import list_runs
+
+
+EXPERIMENT_TAGS = ['head', 'hand', 'glasses', 'glasses_callibration']
+SUCCESS_DURATION_RATIO = 0.95
+CACHE_SUFFIX = '.learning_curves.npz'
+
+
+def command_success(duration_sec: np.ndarray, sec_per_command: np.ndarray, executed: np.ndarray|None = None) -> np.ndarray:
+    by_duration = duration_sec < SUCCESS_DURATION_RATIO * sec_per_command
+    if executed is None:
+        return by_duration
+    return np.where(executed >= 0, executed == 1, by_duration)
+
+
+def _segment_nanmean(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.add.reduceat(np.where(valid, values, 0.), starts) / np.add.reduceat(valid, starts)
+
+
+def aggregate_sessions(commands: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """One row per run from per-command metrics of analyse_runs, commands of a run must be consecutive"""
+    if len(commands) == 0 or len(commands['command_ind']) == 0:
+        return {}
+    tag, person, run_key = commands['experiment_tag'], commands['person'], commands['run_key']
+    starts = np.flatnonzero(np.r_[True, (tag[1:] != tag[:-1]) | (person[1:] != person[:-1]) | (run_key[1:] != run_key[:-1])])
+    num_commands = np.diff(np.r_[starts, len(run_key)])
+    num_success = np.add.reduceat(command_success(commands['duration_sec'], commands['sec_per_command'], commands.get('executed')), starts)
+    return {
+        'group_name': np.array([f'/{t}/{p}/{k}' for t, p, k in zip(tag[starts], person[starts], run_key[starts])]),
+        'experiment_tag': tag[starts],
+        'person': person[starts],
+        'run_key': run_key[starts],
+        'test_id': commands['test_id'][starts],
+        'show_cursor': commands['show_cursor'][starts],
+        'start_time': commands['start_time'][starts],
+        'num_commands': num_commands,
+        'num_success': num_success,
+        'success_rate': num_success / num_commands,
+        'mean_time_to_acquire_sec': _segment_nanmean(commands['time_to_acquire_sec'], starts),
+        'mean_dwell_density': _segment_nanmean(commands['dwell_density'], starts),
+        'mean_distance_pix': _segment_nanmean(commands['mean_distance_pix'], starts),
+    }
+
+
+def _take(table: Dict[str, np.ndarray], inds: np.ndarray) -> Dict[str, np.ndarray]:
+    return {name: column[inds] for name, column in table.items()}
+
+
+def _load_cache(cache_file: Path):
+    if not cache_file.exists():
+        return {}, {}
+    with np.load(cache_file) as data:
+        processed = dict(zip(data['processed_group_name'], data['processed_row_count']))
+        sessions = {name[len('session_'):]: data[name] for name in data.files if name.startswith('session_')}
+    return processed, sessions
+
+
+def _save_cache(cache_file: Path, processed: Dict[str, int], sessions: Dict[str, np.ndarray]):
+    np.savez(cache_file,
+             processed_group_name=np.array(list(processed.keys()), dtype=str),
+             processed_row_count=np.array(list(processed.values()), dtype=np.int64),
+             **{f'session_{name}': column for name, column in sessions.items()})
+
+
+def learning_curves(save_file, cache_file=None, max_workers: int|None = None,
+                    experiment_tags: List[str] = EXPERIMENT_TAGS) -> Dict[str, np.ndarray]:
+    """
+    Tidy table with one row per session, sorted by person, experiment_tag, show_cursor, test_id and start time.
+    `session_index` is number of the session among sessions of the person with the same experiment_tag,
+    show_cursor and test_id, i.e. x axis of learning curve.
+
+    Results are cached in `cache_file` (next to `save_file` by default) by experiment group and its row count,
+    so only new or changed runs are read when the file grows.
+    """
+    save_file = Path(save_file)
+    cache_file = Path(cache_file) if cache_file is not None else save_file.with_name(save_file.name + CACHE_SUFFIX)
+    runs = {f"/{run['experiment_tag']}/{run['person']}/{run['run_key']}": run['row_count']
+            for run in list_runs(save_file) if run['experiment_tag'] in experiment_tags}
+
+    processed, sessions = _load_cache(cache_file)
+    sessions.pop('session_index', None)
+    if len(sessions) > 0:
+        keep = np.array([runs.get(name) == processed.get(name) for name in sessions['group_name']], bool)
+        sessions = _take(sessions, np.flatnonzero(keep))
+    processed = {name: row_count for name, row_count in processed.items() if runs.get(name) == row_count}
+
+    new_runs = [name for name in runs if name not in processed]
+    if len(new_runs) > 0:
+        print(f'analysing {len(new_runs)} new runs of {len(runs)}')
+        sessions = concatenate_columns([sessions, aggregate_sessions(analyse_runs(save_file, new_runs, max_workers))])
+        processed.update({name: runs[name] for name in new_runs})
+    if len(sessions) == 0:
+        return {}
+
+    order = np.lexsort((sessions['start_time'], sessions['test_id'], sessions['show_cursor'], sessions['experiment_tag'],
+                        sessions['person']))
+    sessions = _take(sessions, order)
+    group = np.stack([sessions['person'], sessions['experiment_tag'], sessions['show_cursor'].astype(str),
+                      sessions['test_id'].astype(str)], axis=1)
+    group_starts = np.flatnonzero(np.r_[True, np.any(group[1:] != group[:-1], axis=1)])
+    sessions['session_index'] = np.arange(len(group)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(group)]))
+
+    _save_cache(cache_file, processed, sessions)
+    return sessions
+
+
+def write_csv(table: Dict[str, np.ndarray], path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(table.keys()))
+        writer.writerows(zip(*[column.tolist() for column in table.values()]))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Per-session success rates of recorded experiments')
+    parser.add_argument('save_file')
+    parser.add_argument('--cache-file')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--csv', help='write sessions table to csv file')
+    args = parser.parse_args()
+
+    table = learning_curves(args.save_file, args.cache_file, args.workers)
+    if args.csv:
+        write_csv(table, args.csv)
+    for row in zip(*[table[name].tolist() for name in ['person', 'experiment_tag', 'show_cursor', 'test_id', 'session_index', 'success_rate']]):
+        print(*row, sep='\t')
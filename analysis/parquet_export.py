@@ -0,0 +1,126 @@
+"""
+Export of recorded experiments to Parquet dataset partitioned by experiment_tag and person:
+
+    <out_dir>/experiment_tag=<tag>/person=<person>/run_<key>.parquet
+
+Each one-row-per-sample dataset of experiment group becomes a column, fields with data shape (1,)
+become scalar columns, others become (nested) fixed-size list columns, e.g. `hand_landmarks (21, 3)`
+is `fixed_size_list<fixed_size_list<float, 3>, 21>`. Group attrs are stored as json in schema metadata.
+Runs are read and written by `chunk_rows` rows, so memory used doesn't depend on file size.
+
+Requires pyarrow (listed in requirements.txt), imported on export only, so experiments start without it.
+"""
+from typing import List
+from pathlib import Path
+import json
+import h5py
+import numpy as np
+
+from analysis.runs import run_group_names
+from experiments_common.experiment_catalog import split_experiment_group_name
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('Parquet export requires pyarrow==12.0.0 from requirements.txt, install it with `pip install pyarrow==12.0.0`') from e
+    return pyarrow, pyarrow.parquet
+
+
+def _json_value(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, np.ndarray):
+        return [_json_value(val) for val in value.tolist()] if value.dtype.kind in 'OS' else value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(val) for val in value]
+    return value
+
+
+def _row_datasets(group: h5py.Group) -> List[h5py.Dataset]:
+    num_rows = group['timestamp_sec'].len() if 'timestamp_sec' in group else None
+    return [dataset for dataset in group.values()
+            if isinstance(dataset, h5py.Dataset) and dataset.ndim >= 2 and dataset.len() == num_rows]
+
+
+def _column_type(pa, dataset: h5py.Dataset):
+    arrow_type = pa.from_numpy_dtype(dataset.dtype)
+    data_shape = dataset.shape[1:]
+    if data_shape == (1,):
+        return arrow_type
+    for size in reversed(data_shape):
+        arrow_type = pa.list_(arrow_type, size)
+    return arrow_type
+
+
+def _column_array(pa, values: np.ndarray):
+    if values.shape[1:] == (1,):
+        return pa.array(values.reshape(-1))
+    array = pa.array(np.ascontiguousarray(values).reshape(-1))
+    for size in reversed(values.shape[1:]):
+        array = pa.FixedSizeListArray.from_arrays(array, size)
+    return array
+
+
+def run_schema(group: h5py.Group, datasets: List[h5py.Dataset]):
+    pa, _ = _import_pyarrow()
+    fields = [pa.field(dataset.name.rsplit('/', 1)[-1], _column_type(pa, dataset),
+                       metadata={'shape': json.dumps(list(dataset.shape[1:]))})
+              for dataset in datasets]
+    row_names = {dataset.name for dataset in datasets}
+    metadata = {key: json.dumps(_json_value(val), ensure_ascii=False) for key, val in group.attrs.items()}
+    metadata['group_name'] = json.dumps(group.name, ensure_ascii=False)
+    metadata['other_datasets'] = json.dumps([name for name, item in group.items()
+                                             if isinstance(item, h5py.Dataset) and item.name not in row_names],
+                                            ensure_ascii=False)
+    return pa.schema(fields, metadata=metadata)
+
+
+def run_parquet_path(out_dir, group_name: str) -> Path:
+    experiment_tag, person, run_key = split_experiment_group_name(group_name)
+    return Path(out_dir) / f'experiment_tag={experiment_tag}' / f'person={person}' / f'run_{run_key}.parquet'
+
+
+def export_run(save_file, group_name: str, out_dir, chunk_rows: int = 65536, compression: str = 'zstd') -> Path:
+    pa, pq = _import_pyarrow()
+    path = run_parquet_path(out_dir, group_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(str(save_file), 'r') as _file:
+        group = _file[group_name]
+        datasets = _row_datasets(group)
+        schema = run_schema(group, datasets)
+        num_rows = datasets[0].len() if len(datasets) > 0 else 0
+        with pq.ParquetWriter(str(path), schema, compression=compression) as writer:
+            for start in range(0, num_rows, chunk_rows):
+                end = min(start + chunk_rows, num_rows)
+                batch = pa.record_batch([_column_array(pa, dataset[start:end]) for dataset in datasets], schema=schema)
+                writer.write_batch(batch)
+    return path
+
+
+def export_file(save_file, out_dir, chunk_rows: int = 65536, compression: str = 'zstd', **filters) -> List[Path]:
+    """Export runs of the file matching `filters` (see ExperimentCatalog.runs), returns written files"""
+    paths = []
+    for group_name in run_group_names(save_file, **filters):
+        paths.append(export_run(save_file, group_name, out_dir, chunk_rows, compression))
+        print('exported', group_name, '->', paths[-1])
+    return paths
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Export recorded experiments to Parquet dataset')
+    parser.add_argument('save_file')
+    parser.add_argument('out_dir')
+    parser.add_argument('--experiment-tag')
+    parser.add_argument('--person')
+    parser.add_argument('--chunk-rows', type=int, default=65536)
+    parser.add_argument('--compression', default='zstd')
+    args = parser.parse_args()
+
+    export_file(args.save_file, args.out_dir, args.chunk_rows, args.compression,
+                experiment_tag=args.experiment_tag, person=args.person)
@@ -0,0 +1,56 @@
+from typing import Dict, List
+from dataclasses import dataclass
+import h5py
+import numpy as np
+
+from experiments_common.experiment_catalog import list_runs
+
+
+# column with cursor position in screen pixels, recorded by each experiment type
+CURSOR_COLUMNS = {
+    'head': 'intersection_pix',
+    'hand': 'finger_tip_pix',
+    'glasses': 'predicted_intersection_pix',
+}
+
+
+@dataclass
+class RunData:
+    group_name: str
+    attrs: dict
+    columns: Dict[str, np.ndarray]
+
+    def experiment_tag(self):
+        return self.group_name.strip('/').split('/')[0]
+
+    def num_rows(self):
+        return len(self.columns['timestamp_sec']) if 'timestamp_sec' in self.columns else 0
+
+
+def read_column(dataset: h5py.Dataset) -> np.ndarray:
+    """
+    Read whole dataset. Contiguous uncompressed datasets (e.g. after h5repack) are memory mapped,
+    chunked ones are read in one call, HDF5 reads them chunk by chunk.
+    """
+    offset = dataset.id.get_offset()
+    if dataset.chunks is None and offset is not None and dataset.dtype.kind not in 'OV':
+        return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+    return dataset[()]
+
+
+def load_run(save_file, group_name: str, columns: List[str]|None = None) -> RunData:
+    """Read columns of experiment group, all one-row-per-sample datasets if `columns` is None"""
+    with h5py.File(str(save_file), 'r') as _file:
+        group = _file[group_name]
+        if columns is None:
+            num_rows = group['timestamp_sec'].len() if 'timestamp_sec' in group else None
+            columns = [name for name, dataset in group.items()
+                       if isinstance(dataset, h5py.Dataset) and dataset.ndim >= 2 and dataset.len() == num_rows]
+        data = {name: read_column(group[name]) for name in columns if name in group}
+        attrs = {key: val for key, val in group.attrs.items()}
+    return RunData(group_name, attrs, data)
+
+
+def run_group_names(save_file, **filters) -> List[str]:
+    """Names of experiment groups of the file, see ExperimentCatalog.runs for filters"""
+    return [f"/{run['experiment_tag']}/{run['person']}/{run['run_key']}" for run in list_runs(save_file, **filters)]
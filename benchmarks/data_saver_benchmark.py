@@ -0,0 +1,94 @@
+"""
+Reports file size and write throughput of DataSaver per experiment type and storage layout.
+
+Run from the project root:
+    python -m benchmarks.data_saver_benchmark --num-commands 36 --sec-per-command 3
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from experiments_common.data_saver import DataSaver, FieldStorage
+from head_tracker_experiment.head_data_saver import HeadDataSaver
+from hand_tracker_experiment.hand_data_saver import HandDataSaver
+from glasses_tracker_experiment.glasses_data_saver import GlassesDataSaver
+from glasses_tracker_experiment.glasses_calibration_data_saver import GlassesCallibrationDataSaver
+
+
+EXPERIMENTS = {
+    'head': HeadDataSaver,
+    'hand': HandDataSaver,
+    'glasses': GlassesDataSaver,
+    'glasses_callibration': GlassesCallibrationDataSaver,
+}
+
+STORAGE_VARIANTS = {
+    'legacy': FieldStorage(chunk_rows=10000), # layout used before per-field storage options
+    'tuned': None, # per-field options of experiment data saver
+    'lzf': FieldStorage(compression='lzf', shuffle=True),
+}
+
+
+def generate_columns(saver: DataSaver, num_rows: int, num_commands: int, rng: np.random.Generator):
+    """Columns close to recorded ones: command indexes go in runs, coordinates move smoothly"""
+    columns = []
+    for field in saver._save_fields():
+        shape = (num_rows, *field.data_shape)
+        if np.issubdtype(np.dtype(field.dtype), np.integer):
+            values = np.repeat(np.arange(num_commands), int(np.ceil(num_rows / num_commands)))[:num_rows]
+            column = np.broadcast_to(values.reshape(-1, *[1]*len(field.data_shape)), shape).astype(field.dtype)
+        else:
+            column = np.cumsum(rng.normal(0, 1, shape), axis=0).astype(field.dtype)
+            column[rng.random(num_rows) < 0.05] = np.nan # frames with nothing detected
+        columns.append(column)
+    return columns
+
+
+def run_benchmark(experiment_tag: str, variant: str, save_dir: Path, num_commands: int, sec_per_command: float, seed=0):
+    save_file = save_dir / f'{experiment_tag}_{variant}.hdf5'
+    saver: DataSaver = EXPERIMENTS[experiment_tag](save_file)
+    saver.set_storage_override(STORAGE_VARIANTS[variant])
+
+    num_rows = int(saver._expected_sample_rate() * sec_per_command * num_commands)
+    columns = generate_columns(saver, num_rows, num_commands, np.random.default_rng(seed))
+
+    DataSaver.create_person_dataset(saver, 'benchmark', '', True, num_commands, sec_per_command, 1920, 1080, 1920, 1080)
+    start = time.perf_counter()
+    for row_ind in range(num_rows):
+        saver._append_data(*[column[row_ind] for column in columns])
+    append_time = time.perf_counter() - start
+    saver.stop_save(False)
+    total_time = time.perf_counter() - start
+
+    return {
+        'experiment': experiment_tag,
+        'variant': variant,
+        'rows': num_rows,
+        'file_mb': save_file.stat().st_size / 2**20,
+        'rows_per_sec': num_rows / total_time,
+        'append_us_per_row': append_time / num_rows * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-commands', type=int, default=36)
+    parser.add_argument('--sec-per-command', type=float, default=3.)
+    parser.add_argument('--experiments', nargs='*', default=list(EXPERIMENTS))
+    parser.add_argument('--variants', nargs='*', default=list(STORAGE_VARIANTS))
+    args = parser.parse_args()
+
+    print(f'{"experiment":<22}{"variant":<10}{"rows":>8}{"file, MB":>11}{"rows/s":>12}{"append, us":>12}')
+    with tempfile.TemporaryDirectory() as save_dir:
+        for experiment_tag in args.experiments:
+            for variant in args.variants:
+                res = run_benchmark(experiment_tag, variant, Path(save_dir), args.num_commands, args.sec_per_command)
+                print(f'{res["experiment"]:<22}{res["variant"]:<10}{res["rows"]:>8}{res["file_mb"]:>11.3f}'
+                      f'{res["rows_per_sec"]:>12.0f}{res["append_us_per_row"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares time and memory allocated per frame by camera frame -> RGB image conversion paths.
+
+legacy - QVideoFrame.toImage() -> convert_qimage_cv -> BGR2RGB, as hand experiment did before
+mapped - convert_qvideoframe_rgb into a new array
+mapped_out - convert_qvideoframe_rgb into reused output array
+
+Run from the project root:
+    python -m benchmarks.frame_conversion_benchmark --width 1920 --height 1080
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PyQt6.QtGui import QGuiApplication, QImage
+from PyQt6.QtMultimedia import QVideoFrame
+
+from utils.camera_source import convert_qimage_cv, convert_qimage_qvideoframe, convert_qvideoframe_rgb
+
+
+def legacy_conversion(frame: QVideoFrame, out=None):
+    return cv2.cvtColor(convert_qimage_cv(frame.toImage()), cv2.COLOR_BGR2RGB)
+
+
+# conversion, reuse output array, check result against source image
+# (channel order of legacy path depends on QImage format returned by toImage, so it is not checked)
+CONVERSIONS = {
+    'legacy': (legacy_conversion, False, False),
+    'mapped': (convert_qvideoframe_rgb, False, True),
+    'mapped_out': (convert_qvideoframe_rgb, True, True),
+}
+
+
+def make_frame(width: int, height: int, seed=0):
+    rgba = np.random.default_rng(seed).integers(0, 256, (height, width, 4), np.uint8)
+    rgba[:, :, 3] = 255
+    qimage = QImage(rgba.data, width, height, width * 4, QImage.Format.Format_RGBA8888)
+    return convert_qimage_qvideoframe(qimage), rgba[:, :, :3]
+
+
+def run_benchmark(name: str, frame: QVideoFrame, expected_rgb: np.ndarray, num_frames: int):
+    convert, reuse_out, check = CONVERSIONS[name]
+    out = convert(frame) if reuse_out else None
+    if check and not np.array_equal(convert(frame, out), expected_rgb):
+        raise RuntimeError(f'{name} conversion result differs from source image')
+
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        image = convert(frame, out)
+    sec_per_frame = (time.perf_counter() - start) / num_frames
+
+    tracemalloc.start()
+    convert(frame, out)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'conversion': name,
+        'ms_per_frame': sec_per_frame * 1e3,
+        'fps': 1 / sec_per_frame,
+        'allocated_mb': peak_bytes / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--num-frames', type=int, default=100)
+    parser.add_argument('--conversions', nargs='*', default=list(CONVERSIONS))
+    args = parser.parse_args()
+
+    app = QGuiApplication([])
+    frame, expected_rgb = make_frame(args.width, args.height)
+    print(f'{"conversion":<14}{"ms/frame":>10}{"fps":>10}{"allocated, MB":>16}')
+    for name in args.conversions:
+        res = run_benchmark(name, frame, expected_rgb, args.num_frames)
+        print(f'{res["conversion"]:<14}{res["ms_per_frame"]:>10.2f}{res["fps"]:>10.0f}{res["allocated_mb"]:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares low-pass filters of the glasses reader on the same samples: the former per-sample FFT filter over a
+0.1 s buffer (reference) and streaming filters per sample and in blocks.
+
+Reports time per sample of all channels and the largest difference from the reference, in units of sensor values.
+Samples are synthesized by SimulatedTransport or read from a recording, sample rate estimates vary around `--rate`
+as in the reader.
+
+Run from the project root:
+    python -m benchmarks.glasses_filter_benchmark --rate 80 250 1000
+    python -m benchmarks.glasses_filter_benchmark --recording sample_record.hdf5 --cutoff 4.43 --order 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from glasses_tracker_experiment.glasses_transport import SimulatedTransport, parse_line
+from glasses_tracker_experiment.streaming_filters import ButterworthFilter, MovingAverageFilter
+
+
+def low_pass_filter(adata: np.ndarray, bandlimit: int = 1000, sampling_rate: int = 44100) -> np.ndarray:
+    """Former per-sample filter of the reader: zeroes FFT bins above `bandlimit` Hz"""
+    # translate bandlimit from Hz to dataindex according to sampling rate and data size
+    bandlimit_index = int(bandlimit * adata.size / sampling_rate)
+    fsig = np.fft.fft(adata)
+    fsig[bandlimit_index + 1:len(fsig) - bandlimit_index] = 0
+    return np.real(np.fft.ifft(fsig))
+
+
+def reference_filter(samples: np.ndarray, sample_rates: np.ndarray, window_sec=0.1):
+    """Filtering of the reader before streaming filters"""
+    buffer, filtered = [], []
+    for sample, sample_rate in zip(samples, sample_rates):
+        buffer.append(sample)
+        store_elems = int(np.ceil(window_sec * sample_rate))
+        if len(buffer) > store_elems:
+            buffer = buffer[-store_elems:]
+        values = np.asarray(buffer, float)
+        filtered.append([low_pass_filter(values[:, col_ind], 5, sample_rate)[-1] for col_ind in range(values.shape[1])])
+    return np.array(filtered)
+
+
+def estimated_rates(rate: float, num_samples: int, jitter: float, rng: np.random.Generator):
+    """Sample rates estimated by the reader from jittered line arrival times"""
+    dt, rates = 1 / rate, []
+    for _ in range(num_samples):
+        dt = 0.8 * dt + 0.2 * max(0., 1 + jitter * rng.standard_normal()) / rate
+        rates.append(1 / dt)
+    return np.array(rates)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', help='hdf5 file with `data` dataset, synthesized data if not set')
+    parser.add_argument('--rate', type=float, nargs='+', default=[80., 250., 1000.])
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--num-samples', type=int, default=5000)
+    parser.add_argument('--block-size', type=int, default=64)
+    parser.add_argument('--cutoff', type=float, default=4.43, help='Butterworth cutoff, Hz')
+    parser.add_argument('--order', type=int, default=2, help='Butterworth order')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for rate in args.rate:
+        transport = SimulatedTransport(args.recording, rate, realtime=False, seed=args.seed)
+        transport.open()
+        samples = []
+        while len(samples) < args.num_samples and transport.is_open():
+            values = parse_line(transport.read_line())
+            if values is not None:
+                samples.append(values)
+        samples = np.array(samples)
+        rates = estimated_rates(rate, len(samples), args.jitter, rng)
+        blocks = range(0, len(samples), args.block_size)
+
+        # block filters use one sample rate per block, so they are compared at the nominal rate
+        reference, reference_sec = timed(lambda: reference_filter(samples, rates))
+        reference_nominal = reference_filter(samples, np.full(len(samples), rate))
+        moving_average = MovingAverageFilter()
+        butterworth = ButterworthFilter(args.cutoff, args.order)
+        butterworth_block = ButterworthFilter(args.cutoff, args.order)
+        moving_average_block = MovingAverageFilter()
+        results = {
+            'fft reference': (reference, reference_sec, reference),
+            'moving average': (*timed(lambda: np.array([moving_average.process(sample, sample_rate)
+                                                        for sample, sample_rate in zip(samples, rates)])), reference),
+            'moving average block': (*timed(lambda: np.concatenate([moving_average_block.process_block(
+                samples[ind:ind + args.block_size], rate) for ind in blocks])), reference_nominal),
+            'butterworth': (*timed(lambda: np.array([butterworth.process(sample, sample_rate)
+                                                     for sample, sample_rate in zip(samples, rates)])), reference),
+            'butterworth block': (*timed(lambda: np.concatenate([butterworth_block.process_block(
+                samples[ind:ind + args.block_size], rate) for ind in blocks])), reference_nominal),
+        }
+
+        print(f'{rate:.0f} Hz, {len(samples)} samples of {samples.shape[1]} channels, '
+              f'values range {np.ptp(samples, axis=0).max():.1f}')
+        for name, (filtered, elapsed, expected) in results.items():
+            print(f'  {name:<22} {elapsed / len(samples) * 1e6:8.2f} us/sample  '
+                  f'max difference {np.abs(filtered - expected).max():.2e}')
+
+
+if __name__ == '__main__':
+    main()
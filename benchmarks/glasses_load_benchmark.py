@@ -0,0 +1,110 @@
+"""
+Load test of the glasses data path without hardware: SimulatedTransport -> _GlassesReader (parsing, filtering)
+-> GlassesController._glasses_reader_data_changed in the GUI thread.
+
+Reports lines read and rejected as corrupted, reader processing time per line, how late the reader reads lines
+(lag grows if it doesn't keep up with the device rate), time of the controller slot and the maximal number
+of samples waiting in the GUI event queue.
+
+Run from the project root:
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.glasses_load_benchmark --rate 1000 --jitter 0.3 --corrupt-rate 0.01
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.glasses_load_benchmark --recording sample_record.hdf5 --calibrated
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+
+from glasses_tracker_experiment import GlassesTrackerExperiment
+from glasses_tracker_experiment.glasses_callibrator import GlassesCallibrator
+from glasses_tracker_experiment.glasses_transport import SimulatedTransport
+from glasses_tracker_experiment.streaming_filters import ButterworthFilter, MovingAverageFilter
+from utils.experiment_configs_model import CurrentConfig
+
+
+def calibrate(controller, seed=0):
+    """Calibration on synthesized data, so the controller slot predicts cursor positions as in experiments"""
+    transport = SimulatedTransport(realtime=False, seed=seed)
+    transport.open()
+    rng = np.random.default_rng(seed)
+    callibrator = GlassesCallibrator()
+    callibrator.start_callibrate()
+    for command_code in range(9):
+        position = rng.uniform(0, 1000, 2)
+        for _ in range(50):
+            callibrator.add_callibration_data(command_code, position, np.array(transport.read_line().split(), float))
+    controller._glasses_calib_result = callibrator.generate_model()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', help='hdf5 file with `data` dataset, synthesized data if not set')
+    parser.add_argument('--rate', type=float, default=80., help='lines per second')
+    parser.add_argument('--jitter', type=float, default=0.2, help='relative std of intervals between lines')
+    parser.add_argument('--corrupt-rate', type=float, default=0.)
+    parser.add_argument('--duration', type=float, default=10., help='seconds')
+    parser.add_argument('--calibrated', action='store_true')
+    parser.add_argument('--filter', choices=['moving_average', 'butterworth'], default='moving_average')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    config = CurrentConfig(Path('glasses_load_benchmark.hdf5'), 'load', '', 0, 9, 2, True)
+    window = GlassesTrackerExperiment(config)
+    controller = window._controller
+    if args.calibrated:
+        calibrate(controller, args.seed)
+
+    slot_ns = []
+    data_changed = controller._glasses_reader_data_changed
+    def timed_data_changed(data):
+        start_ns = time.perf_counter_ns()
+        data_changed(data)
+        slot_ns.append(time.perf_counter_ns() - start_ns)
+    controller._glasses_reader_data_changed = timed_data_changed
+
+    transport = SimulatedTransport(args.recording, args.rate, args.jitter, args.corrupt_rate, seed=args.seed)
+    filter_class = MovingAverageFilter if args.filter == 'moving_average' else ButterworthFilter
+    controller.setup_glasses_reader(None, lambda: transport, filter_class)
+    reader = controller.glasses_reader()
+
+    max_backlog = 0
+    def sample_backlog():
+        nonlocal max_backlog
+        max_backlog = max(max_backlog, reader.counters().get('emitted', 0) - len(slot_ns))
+    backlog_timer = QTimer()
+    backlog_timer.timeout.connect(sample_backlog)
+    backlog_timer.start(50)
+
+    counters = {}
+    def finish():
+        counters.update(reader.counters())
+        backlog_timer.stop()
+        reader.close()
+        # samples emitted before closing are still handled
+        QTimer.singleShot(200, app.quit)
+    QTimer.singleShot(int(args.duration * 1000), finish)
+
+    start = time.perf_counter()
+    app.exec()
+    elapsed = time.perf_counter() - start
+
+    stats = transport.stats()
+    print(f'{transport.name()}: {stats.lines_sent} lines in {elapsed:.1f} s ({stats.lines_sent / elapsed:.0f} lines/s), '
+          f'{stats.corrupted_sent} corrupted')
+    print(f'reader: {counters.get("lines", 0)} lines, {counters.get("corrupted", 0)} rejected, '
+          f'{counters.get("emitted", 0)} emitted, '
+          f'{counters.get("process_ns", 0) / max(counters.get("emitted", 0), 1) / 1e3:.1f} us per line')
+    print(f'read lag      p50 {stats.lag_ms_p50:7.2f} ms  p95 {stats.lag_ms_p95:7.2f} ms  max {stats.lag_ms_max:7.2f} ms')
+    if slot_ns:
+        p50, p95 = np.percentile(np.asarray(slot_ns) / 1e3, [50, 95])
+        print(f'controller    p50 {p50:7.1f} us  p95 {p95:7.1f} us, {len(slot_ns)} samples handled, '
+              f'max backlog {max_backlog}')
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
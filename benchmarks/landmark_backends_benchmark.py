@@ -0,0 +1,126 @@
+"""
+Compares landmark backends on the same video clip.
+
+Reference pass runs mediapipe landmarker on full frames in video mode. Regions of interest for each frame are
+predicted by RoiTracker from reference landmarks of previous frames, so every backend processes the same crops.
+For each backend the throughput (crops per second) and mean distance of its landmarks from reference ones
+(in frame pixels) are reported. TFLite/ONNX backends run landmark models in batches with given number of threads.
+
+Run from the project root:
+    python -m benchmarks.landmark_backends_benchmark clip.mp4 --kind face --threads 1 4 --batch-sizes 1 8
+    python -m benchmarks.landmark_backends_benchmark clip.mp4 --kind hand --onnx hand_landmarks.onnx
+"""
+import argparse
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+from experiments_common.landmark_backends import (FACE_LANDMARKER_TASK, FACE_LANDMARKS_MODEL, HAND_LANDMARKER_TASK,
+                                                  HAND_LANDMARKS_MODEL, LandmarkBackend, MediapipeLandmarkBackend,
+                                                  OnnxLandmarkBackend, TFLiteLandmarkBackend, extract_task_model)
+from utils.roi_tracker import RoiCrop, RoiTracker
+
+
+def read_clip(video_path: str, max_frames: int):
+    """RGB frames and timestamps (ms) of the clip"""
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    capture.release()
+    timestamps_ms = (np.arange(len(frames)) * 1000 / fps).astype(int)
+    return frames, timestamps_ms
+
+
+def reference_pass(kind: str, frames, timestamps_ms):
+    """Reference landmarks of full frames and crops predicted from previous frames (None where tracking is lost)"""
+    backend = MediapipeLandmarkBackend(kind)
+    tracker = RoiTracker()
+    reference, crops = [], []
+    start = time.perf_counter()
+    for frame, timestamp in zip(frames, timestamps_ms):
+        crop = tracker.crop(frame, timestamp)
+        result = backend.detect(frame, timestamp)
+        reference.append(result.landmarks)
+        crops.append(None if crop.is_full_frame() else crop)
+        tracker.update(RoiCrop(frame, 0, 0, frame.shape[1], frame.shape[0], frame.shape[1], frame.shape[0]),
+                       result.landmarks, timestamp)
+    elapsed = time.perf_counter() - start
+    backend.close()
+    return reference, crops, len(frames) / elapsed
+
+
+def landmarks_error_pix(crop: RoiCrop, landmarks: np.ndarray|None, reference: np.ndarray|None):
+    if landmarks is None or reference is None:
+        return np.nan
+    frame_landmarks = crop.to_frame_normalized(landmarks)[:, :2] * [crop.frame_width, crop.frame_height]
+    reference_pix = reference[:, :2] * [crop.frame_width, crop.frame_height]
+    return float(np.mean(np.linalg.norm(frame_landmarks - reference_pix, axis=1)))
+
+
+def run_backend(backend: LandmarkBackend, crops: List[RoiCrop], timestamps_ms, reference, batch_size: int):
+    start = time.perf_counter()
+    results = []
+    for batch_start in range(0, len(crops), batch_size):
+        batch = crops[batch_start:batch_start + batch_size]
+        results.extend(backend.detect_batch([crop.image for crop in batch], timestamps_ms[batch_start:batch_start + batch_size]))
+    elapsed = time.perf_counter() - start
+    errors = [landmarks_error_pix(crop, result.landmarks, ref) for crop, result, ref in zip(crops, results, reference)]
+    return {
+        'backend': backend.name(),
+        'batch': batch_size,
+        'crops_per_sec': len(crops) / elapsed,
+        'found': np.mean([result.found() for result in results]),
+        'error_pix': np.nanmean(errors) if np.isfinite(errors).any() else np.nan,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--kind', choices=['face', 'hand'], default='face')
+    parser.add_argument('--max-frames', type=int, default=600)
+    parser.add_argument('--threads', type=int, nargs='*', default=[1, 4])
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 8])
+    parser.add_argument('--tflite', help='landmark model, extracted from mediapipe .task bundle if not given')
+    parser.add_argument('--onnx', help='landmark model converted to ONNX, ONNX backend is skipped if not given')
+    parser.add_argument('--skip-tflite', action='store_true')
+    args = parser.parse_args()
+
+    frames, timestamps_ms = read_clip(args.video, args.max_frames)
+    reference, crops, reference_fps = reference_pass(args.kind, frames, timestamps_ms)
+    tracked = [i for i, crop in enumerate(crops) if crop is not None]
+    print(f'{len(frames)} frames, mediapipe full frame: {reference_fps:.1f} frames/s, {len(tracked)} frames with ROI')
+    if len(tracked) == 0:
+        return
+    crops = [crops[i] for i in tracked]
+    crop_timestamps = timestamps_ms[tracked]
+    crop_reference = [reference[i] for i in tracked]
+
+    # crops move between frames, so mediapipe detects them as images
+    backends = [(MediapipeLandmarkBackend(args.kind, video_mode=False), [1])]
+    if not args.skip_tflite:
+        tflite_path = args.tflite or extract_task_model(FACE_LANDMARKER_TASK if args.kind == 'face' else HAND_LANDMARKER_TASK,
+                                                        FACE_LANDMARKS_MODEL if args.kind == 'face' else HAND_LANDMARKS_MODEL)
+        backends += [(TFLiteLandmarkBackend(tflite_path, args.kind, threads, max(args.batch_sizes)), args.batch_sizes)
+                     for threads in args.threads]
+    if args.onnx:
+        backends += [(OnnxLandmarkBackend(args.onnx, args.kind, threads, max(args.batch_sizes)), args.batch_sizes)
+                     for threads in args.threads]
+
+    print(f'{"backend":<22}{"batch":>6}{"crops/s":>10}{"found":>8}{"error, px":>11}')
+    for backend, batch_sizes in backends:
+        for batch_size in batch_sizes:
+            res = run_backend(backend, crops, crop_timestamps, crop_reference, batch_size)
+            print(f'{res["backend"]:<22}{res["batch"]:>6}{res["crops_per_sec"]:>10.1f}{res["found"]:>8.2f}{res["error_pix"]:>11.2f}')
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
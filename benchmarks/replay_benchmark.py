@@ -0,0 +1,70 @@
+"""
+Runs head or hand experiment window headless on a recorded video and reports tracking throughput and latency.
+
+Frames come from VideoFileSource:
+realtime - at video rate, frames not processed in time are dropped as with a camera;
+fast - as soon as they are decoded, shows maximal throughput of the pipeline (newest frames win);
+step - next frame is emitted after the previous one is processed, so every frame is tracked.
+
+Run from the project root:
+    QT_QPA_PLATFORM=offscreen python -m benchmarks.replay_benchmark session.mp4 --experiment head --mode step
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+
+from utils.experiment_configs_model import CurrentConfig
+from utils.video_file_source import PlaybackMode, VideoFileSource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--experiment', choices=['head', 'hand'], default='head')
+    parser.add_argument('--mode', choices=[mode.value for mode in PlaybackMode], default=PlaybackMode.STEP.value)
+    parser.add_argument('--mirror', action='store_true')
+    args = parser.parse_args()
+
+    app = QApplication([])
+    source = VideoFileSource(args.video, PlaybackMode(args.mode))
+    if not source.is_available():
+        raise SystemExit(f'cannot open {args.video}')
+    source.set_mirrored(args.mirror)
+
+    # experiments import mediapipe and models, so only the selected one is loaded
+    if args.experiment == 'head':
+        from head_tracker_experiment import HeadTrackerExperiment as Experiment
+    else:
+        from hand_tracker_experiment import HandTrackerExperiment as Experiment
+    config = CurrentConfig(Path('replay_benchmark.hdf5'), 'replay', '', 0, 2, 0.5, False)
+    experiment = Experiment(source, config)
+
+    processor = experiment._frame_processor
+    if source.mode() == PlaybackMode.STEP:
+        processor.result.connect(lambda *_: source.step())
+        processor.error.connect(lambda *_: source.step())
+    # let the last frames be processed before quitting
+    source.playback_finished.connect(lambda: QTimer.singleShot(500, app.quit))
+
+    start = time.perf_counter()
+    QTimer.singleShot(0, source.start if source.mode() != PlaybackMode.STEP else source.step)
+    app.exec()
+    elapsed = time.perf_counter() - start
+
+    counters = processor.counters()
+    print(f'{source.frame_index() + 1} frames of {source.num_frames()} ({source.fps():.1f} fps video) in {elapsed:.1f} s')
+    print(', '.join(f'{name}: {value}' for name, value in counters.items()),
+          f'| processed {counters["processed"] / elapsed:.1f} frames/s')
+    for span in experiment._tracer.spans():
+        percentiles = experiment._tracer.percentiles_ms(span)
+        if percentiles is not None and np.isfinite(percentiles).all():
+            print(f'{span:<10} p50 {percentiles[0]:7.1f} ms  p95 {percentiles[1]:7.1f} ms')
+    experiment.close()
+
+
+if __name__ == '__main__':
+    main()
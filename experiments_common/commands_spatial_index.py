@@ -0,0 +1,37 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class CommandsSpatialIndex:
+    """Nearest command lookup, `query` returns index of the nearest center for each of (N, 2) points"""
+    def query(self, points: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+
+class GridCellIndex(CommandsSpatialIndex):
+    """
+    Centers of regular rows x cols grid lie in the middle of equal cells, so nearest center is the center
+    of the cell containing the point (or of the nearest border cell for points outside the grid).
+    Centers are expected in row-major order.
+    """
+    def __init__(self, left: float, top: float, width: float, height: float, rows: int, cols: int) -> None:
+        self._origin = np.array([left, top], float)
+        self._cell_size = np.array([width / cols, height / rows], float)
+        self._rows = rows
+        self._cols = cols
+
+    def query(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((np.asarray(points, float).reshape(-1, 2) - self._origin) / self._cell_size)
+        cols = np.clip(np.nan_to_num(cells[:, 0]), 0, self._cols - 1).astype(int)
+        rows = np.clip(np.nan_to_num(cells[:, 1]), 0, self._rows - 1).astype(int)
+        return rows * self._cols + cols
+
+
+class KDTreeIndex(CommandsSpatialIndex):
+    """Nearest center of arbitrary layout"""
+    def __init__(self, centers: np.ndarray) -> None:
+        self._tree = cKDTree(np.asarray(centers, float).reshape(-1, 2))
+
+    def query(self, points: np.ndarray) -> np.ndarray:
+        _, inds = self._tree.query(np.asarray(points, float).reshape(-1, 2))
+        return np.asarray(inds, int)
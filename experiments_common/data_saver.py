@@ -1,36 +1,477 @@
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List, Tuple
+from collections import deque
+from enum import Enum
 import h5py
 from datetime import datetime
 import numpy as np
 from PyQt6.QtCore import QObject, QThreadPool, QMutexLocker, QMutex
 from dataclasses import dataclass, replace 
 from utils.threading import Worker
+from experiments_common.record_log import RecordLog, iter_record_log, read_record_log_header, record_log_paths
+from experiments_common.experiment_catalog import ExperimentCatalog, last_experiment_key, update_last_experiment_key
+import atexit
+import os
+import queue
+import tempfile
+import threading
 import time
+import traceback
 from datetime import datetime
 
 
+@dataclass(frozen=True)
+class FieldStorage:
+    compression: str|None = None # 'gzip', 'lzf' or None
+    compression_opts: int|None = None # gzip level
+    shuffle: bool = False
+    store_dtype: str|np.dtype|None = None # dtype of dataset in file if differs from Field.dtype, e.g. float32 for landmarks
+    chunk_rows: int|None = None # fixed number of rows in chunk, derived from expected record length if None
+
+
+DEFAULT_FIELD_STORAGE = FieldStorage(compression='gzip', compression_opts=4, shuffle=True)
+
+
 @dataclass(frozen=True)
 class Field:
     name: str # name for data array in h5py dataset
     data_shape: np.ndarray|tuple # data shape in one line record
     dtype: str|np.dtype|None
     default_value: Any|Callable = np.nan
+    storage: FieldStorage|None = None # DataSaver default storage is used if None
+
 
 @dataclass(frozen=True)
-class FieldWithArrays:
-    field: Field
-    tmp_array: list
+class FlushPolicy:
+    """Buffered records are flushed when any of the limits is reached"""
+    max_rows: int = 10000
+    max_bytes: int = 8 << 20
+    max_age_sec: float = 2. # age of the oldest buffered record
+
+    def flush_reason(self, rows: int, num_bytes: int, age_sec: float) -> str|None:
+        if rows >= self.max_rows:
+            return 'rows'
+        if num_bytes >= self.max_bytes:
+            return 'bytes'
+        if age_sec >= self.max_age_sec:
+            return 'age'
+        return None
+
+
+class FieldBuffer:
+    """
+    Preallocated typed block of `capacity` records of one field with write cursor.
+
+    Filled part of the block is handed to the writer by `take()` as a view, without copying.
+    Block is returned to the buffer by `recycle()` after being written, so blocks are reused in ring.
+    """
+    def __init__(self, field: Field, capacity: int = 10000, max_free_blocks: int = 2) -> None:
+        self.field = field
+        self._capacity = capacity
+        self._max_free_blocks = max_free_blocks
+        self._free_blocks = deque()
+        self._block = self._new_block()
+        self._cursor = 0
+
+    def _new_block(self) -> np.ndarray:
+        if len(self._free_blocks) > 0:
+            return self._free_blocks.popleft()
+        return np.empty((self._capacity, *self.field.data_shape), dtype=self.field.dtype)
+
+    def capacity(self):
+        return self._capacity
+
+    def __len__(self):
+        return self._cursor
+
+    def is_full(self):
+        return self._cursor >= self._capacity
+
+    def append(self, value):
+        if value is None:
+            default_value = self.field.default_value
+            value = default_value() if callable(default_value) else default_value
+        self._block[self._cursor] = value
+        self._cursor += 1
+
+    def take(self) -> np.ndarray:
+        filled = self._block[:self._cursor]
+        self._block = self._new_block()
+        self._cursor = 0
+        return filled
+
+    def recycle(self, array: np.ndarray):
+        block = array if array.base is None else array.base
+        if block.shape[0] == self._capacity and len(self._free_blocks) < self._max_free_blocks:
+            self._free_blocks.append(block)
+
+    def clear(self):
+        self._cursor = 0
+
+
+class DataWriterSession:
+    """
+    Keeps results file and experiment group opened while one person record is written.
+
+    Dataset handles are resolved once and cached, file buffers are flushed to disk
+    not more often than once in `flush_interval_sec` (or after `flush_every_appends` appends).
+    Session is closed on `close()` or at interpreter exit, so HDF5 file is not left opened after crash.
+    """
+    def __init__(self, save_file, flush_interval_sec: float = 5., flush_every_appends: int = 10) -> None:
+        self._save_file = save_file
+        self._flush_interval_sec = flush_interval_sec
+        self._flush_every_appends = flush_every_appends
+
+        self._lock = threading.RLock()
+        self._file = h5py.File(str(save_file), 'a')
+        self._group: h5py.Group = None
+        self._datasets: Dict[str, h5py.Dataset] = {}
+        self._num_rows = 0
+        self._appends_since_flush = 0
+        self._last_flush_time = time.monotonic()
+
+        atexit.register(self.close)
+
+    def file(self) -> h5py.File:
+        return self._file
+
+    def group(self) -> h5py.Group:
+        return self._group
+
+    def set_group(self, group: h5py.Group):
+        with self._lock:
+            self._group = group
+            self._datasets = {}
+            self._num_rows = 0
+
+    def is_open(self):
+        return self._file is not None
+
+    def num_rows(self):
+        return self._num_rows
+
+    def create_field_dataset(self, field: Field, storage: FieldStorage, chunk_rows: int):
+        with self._lock:
+            dataset = self._group.create_dataset(str(field.name),
+                                                 (0, *field.data_shape),
+                                                 maxshape=(None, *field.data_shape),
+                                                 dtype=storage.store_dtype or field.dtype,
+                                                 chunks=(chunk_rows, *field.data_shape),
+                                                 compression=storage.compression,
+                                                 compression_opts=storage.compression_opts,
+                                                 shuffle=storage.shuffle)
+            self._datasets[str(field.name)] = dataset
+            return dataset
+
+    def open_field_datasets(self, datasets_names: List[str]):
+        """Cache handles of already existing datasets of the group"""
+        with self._lock:
+            self._datasets = {name: self._group[name] for name in datasets_names}
+            self._num_rows = min(dataset.len() for dataset in self._datasets.values())
+
+    def create_dataset(self, name, data, dtype=None, compression=None):
+        with self._lock:
+            return self._group.create_dataset(name, data=data, dtype=dtype, compression=compression)
+
+    def set_attrs(self, **kw_args):
+        with self._lock:
+            for key, val in kw_args.items():
+                self._group.attrs[key] = val
+
+    def append(self, datasets_names: List[str], arrays: List[np.ndarray]):
+        if len(arrays) == 0 or len(arrays[0]) == 0:
+            return
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f'Writer session for {self._save_file} is already closed')
+            current_size = self._num_rows
+            desired_size = current_size + len(arrays[0])
+            for name, array in zip(datasets_names, arrays):
+                dataset = self._datasets[name]
+                dataset.resize(desired_size, axis=0)
+                dataset[current_size:desired_size] = array
+            self._num_rows = desired_size
+            self._appends_since_flush += 1
+            self._flush_if_scheduled()
+
+    def _flush_if_scheduled(self):
+        if self._appends_since_flush >= self._flush_every_appends or \
+            time.monotonic() - self._last_flush_time >= self._flush_interval_sec:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            self._appends_since_flush = 0
+            self._last_flush_time = time.monotonic()
+
+    def delete_group(self):
+        with self._lock:
+            if self._group is not None:
+                del self._file[self._group.name]
+            self._group = None
+            self._datasets = {}
+            self._num_rows = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.flush()
+                self._file.close()
+            finally:
+                self._file = None
+                self._group = None
+                self._datasets = {}
+                atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kw_args):
+        self.close()
+
+
+class BackpressurePolicy(Enum):
+    BLOCK = 0 # wait in the caller thread until writer takes queued chunk
+    DROP  = 1 # drop chunk and count dropped rows
+    SPILL = 2 # save chunk to temporary file and write it after queued chunks
+
+
+@dataclass(frozen=True)
+class WriteChunk:
+    sink: DataWriterSession|RecordLog # anything with append(datasets_names, arrays)
+    datasets_names: List[str]
+    arrays: List[np.ndarray]
+    buffers: List[FieldBuffer]
+    reason: str = '' # what triggered the flush, one of FlushPolicy reasons
+
+    def num_rows(self):
+        return 0 if len(self.arrays) == 0 else len(self.arrays[0])
+
+    def num_bytes(self):
+        return sum(array.nbytes for array in self.arrays)
+
+    def recycle(self):
+        for buffer, array in zip(self.buffers, self.arrays):
+            buffer.recycle(array)
+
+
+@dataclass(frozen=True)
+class FlushRecord:
+    reason: str
+    rows: int
+    bytes: int
+    duration_sec: float # time spent by writer thread on writing the chunk
+    finished_at: float # time.monotonic() when chunk was written
+
+
+@dataclass(frozen=True)
+class DataWriterStats:
+    queue_depth: int
+    max_queue_depth: int
+    chunks_written: int
+    rows_written: int
+    chunks_dropped: int
+    rows_dropped: int
+    chunks_spilled: int
+    write_errors: int
+    last_write_latency_sec: float
+    mean_write_latency_sec: float
+    max_write_latency_sec: float
+    bytes_written: int
+    recent_flushes: Tuple[FlushRecord, ...]
+
+
+class DataWriter:
+    """
+    Dedicated writer thread of one DataSaver.
+
+    Chunks are written one after another in the order they were put, queue of pending chunks is bounded
+    by `max_queue_size`, `policy` defines what to do with new chunk when writer falls behind.
+    """
+    _STOP = object()
+
+    def __init__(self, max_queue_size: int = 8, policy: BackpressurePolicy = BackpressurePolicy.SPILL,
+                 recent_flushes_len: int = 256) -> None:
+        self._policy = policy
+        self._queue = queue.Queue(max_queue_size)
+        self._spilled = deque()
+        self._put_lock = threading.Lock()
+        self._pending_cond = threading.Condition()
+        self._num_pending = 0
+
+        self._max_queue_depth = 0
+        self._chunks_written = 0
+        self._rows_written = 0
+        self._chunks_dropped = 0
+        self._rows_dropped = 0
+        self._chunks_spilled = 0
+        self._write_errors = 0
+        self._last_write_latency = 0.
+        self._total_write_latency = 0.
+        self._max_write_latency = 0.
+        self._bytes_written = 0
+        self._recent_flushes = deque(maxlen=recent_flushes_len)
+
+        self._threadpool = QThreadPool()
+        self._threadpool.setMaxThreadCount(1)
+        self._worker = Worker(self._run)
+        self._threadpool.start(self._worker)
+        self._stopped = False
+        atexit.register(self.stop)
+
+    def policy(self):
+        return self._policy
+
+    def queue_depth(self):
+        return self._queue.qsize() + len(self._spilled)
+
+    def stats(self) -> DataWriterStats:
+        num_written = max(self._chunks_written, 1)
+        return DataWriterStats(self.queue_depth(), self._max_queue_depth,
+                               self._chunks_written, self._rows_written,
+                               self._chunks_dropped, self._rows_dropped,
+                               self._chunks_spilled, self._write_errors,
+                               self._last_write_latency, self._total_write_latency / num_written,
+                               self._max_write_latency, self._bytes_written,
+                               tuple(self._recent_flushes))
+
+    def put(self, chunk: WriteChunk):
+        with self._put_lock:
+            match self._policy:
+                case BackpressurePolicy.BLOCK:
+                    self._add_pending()
+                    self._queue.put(chunk)
+                case BackpressurePolicy.DROP:
+                    try:
+                        self._add_pending()
+                        self._queue.put_nowait(chunk)
+                    except queue.Full:
+                        self._chunks_dropped += 1
+                        self._rows_dropped += chunk.num_rows()
+                        chunk.recycle()
+                        self._done_pending()
+                case BackpressurePolicy.SPILL:
+                    self._add_pending()
+                    # once spilling is started, next chunks are spilled too to keep writing order
+                    if len(self._spilled) > 0 or self._queue.full():
+                        self._spilled.append(self._spill(chunk))
+                        self._chunks_spilled += 1
+                    else:
+                        self._queue.put_nowait(chunk)
+            self._max_queue_depth = max(self._max_queue_depth, self.queue_depth())
+
+    def _spill(self, chunk: WriteChunk):
+        fd, path = tempfile.mkstemp(suffix='.npz', prefix='data_saver_spill_')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, *chunk.arrays)
+        chunk.recycle()
+        return chunk.sink, chunk.datasets_names, chunk.reason, path
+
+    def _load_spilled(self, spilled) -> WriteChunk:
+        sink, datasets_names, reason, path = spilled
+        try:
+            with np.load(path) as data:
+                arrays = [data[f'arr_{i}'] for i in range(len(datasets_names))]
+        finally:
+            os.remove(path)
+        return WriteChunk(sink, datasets_names, arrays, [], reason)
+
+    def _add_pending(self):
+        with self._pending_cond:
+            self._num_pending += 1
+
+    def _done_pending(self):
+        with self._pending_cond:
+            self._num_pending -= 1
+            if self._num_pending == 0:
+                self._pending_cond.notify_all()
+
+    def drain(self, timeout: float|None = None) -> bool:
+        """Wait until all put chunks are written. Returns False on timeout"""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._num_pending == 0, timeout)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self.drain()
+        self._queue.put(DataWriter._STOP)
+        self._threadpool.waitForDone()
+        atexit.unregister(self.stop)
+
+    def _write(self, chunk: WriteChunk):
+        start = time.perf_counter()
+        try:
+            if chunk.num_rows() > 0 and len(chunk.datasets_names) > 0:
+                chunk.sink.append(chunk.datasets_names, chunk.arrays)
+                latency = time.perf_counter() - start
+                self._chunks_written += 1
+                self._rows_written += chunk.num_rows()
+                self._bytes_written += chunk.num_bytes()
+                self._recent_flushes.append(FlushRecord(chunk.reason, chunk.num_rows(), chunk.num_bytes(),
+                                                        latency, time.monotonic()))
+        except Exception:
+            traceback.print_exc()
+            self._write_errors += 1
+        finally:
+            chunk.recycle()
+            latency = time.perf_counter() - start
+            self._last_write_latency = latency
+            self._total_write_latency += latency
+            self._max_write_latency = max(self._max_write_latency, latency)
+            self._done_pending()
+
+    def _run(self):
+        while True:
+            try:
+                # spilled chunks may appear while waiting, so queue is polled
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                chunk = None
+            if chunk is DataWriter._STOP:
+                return
+            if chunk is not None:
+                self._write(chunk)
+            while self._queue.empty() and len(self._spilled) > 0:
+                try:
+                    chunk = self._load_spilled(self._spilled[0])
+                except Exception:
+                    traceback.print_exc()
+                    self._write_errors += 1
+                    self._spilled.popleft()
+                    self._done_pending()
+                    continue
+                self._write(chunk)
+                self._spilled.popleft()
 
 
 class DataSaver:
-    def __init__(self, save_file, experiment_tag) -> None:
+    def __init__(self, save_file, experiment_tag, max_queue_size: int = 8,
+                 backpressure_policy: BackpressurePolicy = BackpressurePolicy.SPILL,
+                 use_record_log: bool = True, flush_policy: FlushPolicy = FlushPolicy()) -> None:
         print('saving', save_file)
         self._save_file = save_file
         
         self._current_person = None
         self._current_person_id = None
-        self._fields_with_array: List[FieldWithArrays] = []
+        self._field_buffers: List[FieldBuffer] = []
         self._experiment_tag = experiment_tag
+        self._session: DataWriterSession = None
+        self._writer: DataWriter = None
+        # live records are written only to the log, log is compacted into HDF5 file on stop_save
+        self._use_record_log = use_record_log
+        self._record_log: RecordLog = None
+        self._max_queue_size = max_queue_size
+        self._backpressure_policy = backpressure_policy
+        self._storage_override: FieldStorage = None
+        self._flush_policy = flush_policy
+        self._row_bytes = 0
+        self._first_buffered_time: float = None
 
         self._mutex_lock = QMutexLocker(QMutex())
     
@@ -48,7 +489,7 @@ class DataSaver:
         return group
     
     def _get_person_group_last_experiment_key(self, person_group: h5py.Group) -> int:
-        return max([int(key) for key in [-1, *person_group.keys()]])
+        return last_experiment_key(person_group)
     
     def _get_person_group_last_experiment_group(self, person_group: h5py.Group) -> h5py.Group:
         key = self._get_person_group_last_experiment_key(person_group)
@@ -60,145 +501,186 @@ class DataSaver:
         group = person_group.create_group(str(new_key))
         return group
 
+    def _expected_sample_rate(self) -> float:
+        """Expected number of records per second, used to choose chunk layout"""
+        return 30.
+
+    def set_storage_override(self, storage: FieldStorage|None):
+        """Use `storage` for all fields of next records instead of per-field options"""
+        self._storage_override = storage
+
+    def _field_storage(self, field: Field) -> FieldStorage:
+        if self._storage_override is not None:
+            return self._storage_override
+        return field.storage or DEFAULT_FIELD_STORAGE
+
+    def _field_chunk_rows(self, field: Field, storage: FieldStorage, num_commands: int, sec_per_command: float,
+                          min_rows: int = 64, max_chunk_bytes: int = 1 << 20) -> int:
+        if storage.chunk_rows is not None:
+            return storage.chunk_rows
+        expected_rows = int(np.ceil(self._expected_sample_rate() * sec_per_command * num_commands))
+        row_bytes = np.dtype(storage.store_dtype or field.dtype).itemsize * int(np.prod(field.data_shape))
+        return int(np.clip(expected_rows, min_rows, max(min_rows, max_chunk_bytes // row_bytes)))
+
+    def _close_session(self):
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+        if self._record_log is not None:
+            self._record_log.close()
+            self._record_log = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def create_person_dataset(self, person_name:str, person_test_id:str, show_cursor:bool, num_commands:int, sec_per_command:float,
                               scene_width:int, scene_height:int, view_width:int, view_height:int, **meta_args):
         with self._mutex_lock:
-            with h5py.File(str(self._save_file), 'a') as _file:
-                self._current_person = person_name
-                self._current_person_id = person_test_id
-                person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
-                experiment_group = self._get_person_group_new_experiment_group(person_group)
-
-
-                experiment_group.attrs['test_timestamp'] = datetime.now().isoformat()
-                experiment_group.attrs['test_id'] = person_test_id
-                experiment_group.attrs['show_cursor'] = 1 if show_cursor else 0
-                experiment_group.attrs['start_time'] = datetime.now().timestamp()
-                experiment_group.attrs['num_commands'] = num_commands
-                experiment_group.attrs['sec_per_command'] = sec_per_command
-                experiment_group.attrs['scene_width'] = int(scene_width)
-                experiment_group.attrs['scene_height'] = int(scene_height)
-                experiment_group.attrs['view_width'] = int(view_width)
-                experiment_group.attrs['view_height'] = int(view_height)
-                
-                
-                for key, arg in meta_args.items():
-                    experiment_group.attrs[key] = arg
-                # self._flush_data()
-
-                fields = self._save_fields()
-                fields.insert(0, Field('timestamp_sec', (1,), float, time.time))
-                self._fields_with_array = []
-
-                print('creating datasets at', experiment_group)
-                for field in fields:
-                    experiment_group.create_dataset(str(field.name), 
-                                                (0, *field.data_shape), 
-                                                maxshape=(None, *field.data_shape), 
-                                                dtype=field.dtype, 
-                                                chunks=(10000, *field.data_shape))
-                    
-                    self._fields_with_array.append(FieldWithArrays(field, []))
-
-    def save_dataset(self, name, data, dtype=None):
+            self._close_session()
+            self._session = DataWriterSession(self._save_file)
+            self._writer = DataWriter(self._max_queue_size, self._backpressure_policy)
+            _file = self._session.file()
+
+            self._current_person = person_name
+            self._current_person_id = person_test_id
+            person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
+            experiment_group = self._get_person_group_new_experiment_group(person_group)
+            self._session.set_group(experiment_group)
+
+            experiment_group.attrs['test_timestamp'] = datetime.now().isoformat()
+            experiment_group.attrs['test_id'] = person_test_id
+            experiment_group.attrs['show_cursor'] = 1 if show_cursor else 0
+            experiment_group.attrs['start_time'] = datetime.now().timestamp()
+            experiment_group.attrs['num_commands'] = num_commands
+            experiment_group.attrs['sec_per_command'] = sec_per_command
+            experiment_group.attrs['scene_width'] = int(scene_width)
+            experiment_group.attrs['scene_height'] = int(scene_height)
+            experiment_group.attrs['view_width'] = int(view_width)
+            experiment_group.attrs['view_height'] = int(view_height)
+            
+            
+            for key, arg in meta_args.items():
+                experiment_group.attrs[key] = arg
+            # self._flush_data()
+
+            fields = self._save_fields()
+            fields.insert(0, Field('timestamp_sec', (1,), float, time.time))
+            self._field_buffers = []
+
+            print('creating datasets at', experiment_group)
+            for field in fields:
+                storage = self._field_storage(field)
+                self._session.create_field_dataset(field, storage, 
+                                                   self._field_chunk_rows(field, storage, num_commands, sec_per_command))
+                self._field_buffers.append(FieldBuffer(field, self._flush_policy.max_rows))
+            self._row_bytes = sum(np.dtype(field.dtype).itemsize * int(np.prod(field.data_shape)) for field in fields)
+            self._first_buffered_time = None
+            ExperimentCatalog(_file).add_run(experiment_group)
+            self._session.flush()
+            if self._use_record_log:
+                self._record_log = RecordLog(self._save_file, experiment_group.name, fields)
+
+    def save_dataset(self, name, data, dtype=None, compression=None):
+        with self._mutex_lock:
+            self._session.create_dataset(name, data=data, dtype=dtype, compression=compression)
+
+    def record_name(self) -> str|None:
+        """Name of HDF5 group of current record"""
         with self._mutex_lock:
-            with h5py.File(str(self._save_file), 'a') as _file:
-                person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
-                experiment_group = self._get_person_group_last_experiment_group(person_group)
-                experiment_group.create_dataset(name, data=data, dtype=dtype)
+            if self._session is None or self._session.group() is None:
+                return None
+            return self._session.group().name
+
+    def save_video_recording(self, recording):
+        """
+        Timestamps of frames of utils.video_recorder.VideoRecording are saved as `video_frame_timestamp_ms`
+        and `video_frame_time_sec` datasets, video file path relative to results file and counters as attributes
+        """
+        with self._mutex_lock:
+            self._session.create_dataset('video_frame_timestamp_ms', data=recording.frame_timestamps_ms)
+            self._session.create_dataset('video_frame_time_sec', data=recording.frame_times_sec)
+            self._session.set_attrs(video_file=os.path.relpath(recording.path, os.path.dirname(os.path.abspath(self._save_file))),
+                                    video_fourcc=recording.fourcc,
+                                    video_fps=recording.fps,
+                                    video_frames_written=recording.stats.frames_written,
+                                    video_frames_dropped=recording.stats.frames_dropped,
+                                    video_frames_failed=recording.stats.frames_failed)
 
 
     def _save_fields(self) -> List[Field]:
         raise NotImplementedError()
 
-    def __write_to_file_in_thread(self, current_person:str, datasets_names:List[str], tmp_arrays_copy: List[np.ndarray]):
-        if len(tmp_arrays_copy) == 0 or len(datasets_names) == 0:
-            return
-        if len(tmp_arrays_copy[0]) == 0:
-            return
-        
-        with h5py.File(str(self._save_file), 'a') as _file:
-            person_group = self._get_person_experiment_group(_file, self._experiment_tag, current_person)
-            experiment_group = self._get_person_group_last_experiment_group(person_group)
-            print(experiment_group)
-            datasets = []
-
-            print(experiment_group.keys())
-
-            for name in datasets_names:
-                datasets.append(experiment_group[name])
-
-            current_size = datasets[0].len()
-            desired_size = current_size + len(tmp_arrays_copy[0])
-
-            for dataset in datasets:
-                dataset.resize(desired_size, axis=0)
-
-            for dataset, tmp_array, name in zip(datasets, tmp_arrays_copy, datasets_names):
-                # print(dataset, name, tmp_array, tmp_array.dtype)
-                dataset[current_size:] = tmp_array
-
-    def _flush_data(self):
+    def _flush_data(self, reason='stop'):
         with self._mutex_lock:
-            datasets_names = list(map(lambda f_a: str(f_a.field.name), self._fields_with_array))
-            # do reshape on data to make ndims>=2 on final array, because h5py.Dataset can't resize arrays with ndims=1
-            tmp_arrays = []
-            for f_a in self._fields_with_array:
-                try:
-                    tmp_arrays.append(np.array(f_a.tmp_array, dtype=f_a.field.dtype).reshape(-1, *f_a.field.data_shape))
-                except Exception as e:
-                    print(f_a)
-                    raise e
+            self._first_buffered_time = None
+            datasets_names = [str(buffer.field.name) for buffer in self._field_buffers]
+            # filled views of (n, *data_shape) blocks, ndims>=2 on each array, because h5py.Dataset can't resize arrays with ndims=1
+            arrays = [buffer.take() for buffer in self._field_buffers]
             
-            if self._current_person is not None:
-                w = Worker(self.__write_to_file_in_thread, self._current_person, datasets_names, tmp_arrays)
-                QThreadPool.globalInstance().start(w)
-            for f_a in self._fields_with_array:
-                f_a.tmp_array.clear()
+            if self._current_person is not None and self._writer is not None:
+                sink = self._record_log if self._record_log is not None else self._session
+                self._writer.put(WriteChunk(sink, datasets_names, arrays, list(self._field_buffers), reason))
+
+    def _compact_record_log(self):
+        if self._record_log is None:
+            return
+        self._record_log.close()
+        for datasets_names, arrays in iter_record_log(self._record_log.path()):
+            self._session.append(datasets_names, arrays)
+        self._session.flush()
+        self._record_log.remove()
+        self._record_log = None
+
+    def drain(self, timeout: float|None = None) -> bool:
+        if self._writer is None:
+            return True
+        return self._writer.drain(timeout)
+
+    def writer_stats(self) -> DataWriterStats|None:
+        """Queue, latency and per-flush statistics of current record, may be polled from UI"""
+        if self._writer is None:
+            return None
+        return self._writer.stats()
+
+    def flush_policy(self):
+        return self._flush_policy
 
     def _append_data(self, *args):
         if self._current_person is None:
             return
         args = [None, *args]
         with self._mutex_lock:
-            if len(args) != len(self._fields_with_array):
-                raise ValueError(f'number of arguments mismatch, expected {len(self._fields_with_array)}, got {len(args)}.\n args={args}\nfield={self._fields_with_array}')
-            for arg, f_a in zip(args, self._fields_with_array):
-                if arg is None:
-                    if f_a.field.data_shape == (1,):
-                        if callable(f_a.field.default_value):
-                            arg = f_a.field.default_value()
-                        else:
-                            arg = f_a.field.default_value
-                    else:
-                        arg = np.full(f_a.field.data_shape, 
-                                      f_a.field.default_value() if callable(f_a.field.default_value) else f_a.field.default_value,
-                                      dtype=f_a.field.dtype)
-                f_a.tmp_array.append(arg)
+            if len(args) != len(self._field_buffers):
+                raise ValueError(f'number of arguments mismatch, expected {len(self._field_buffers)}, got {len(args)}.\n args={args}\nfields={[buffer.field for buffer in self._field_buffers]}')
+            for arg, buffer in zip(args, self._field_buffers):
+                buffer.append(arg)
+            now = time.monotonic()
+            if self._first_buffered_time is None:
+                self._first_buffered_time = now
+            rows = len(self._field_buffers[0])
+            reason = self._flush_policy.flush_reason(rows, rows * self._row_bytes, now - self._first_buffered_time)
+        
+        if reason is not None:
+            self._flush_data(reason)
         
     def append_attrs(self, **kw_args):
         with self._mutex_lock:
-            with h5py.File(str(self._save_file), 'a') as _file:
-                person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
-                experiment_group = self._get_person_group_last_experiment_group(person_group)
-                for key, val in kw_args.items():
-                    experiment_group.attrs[key] = val
-
-
-        if len(self._fields_with_array) > 0:
-            if len(self._fields_with_array[0].tmp_array) > 10000:
-                self._flush_data()
+            self._session.set_attrs(**kw_args)
 
-    def stop_save(self, early_stop):
+    def stop_save(self, early_stop, command_onsets: np.ndarray|None = None):
+        """`command_onsets` of ExperimentProgressControl are saved as `command_onsets` dataset of the record"""
         self._flush_data()
+        self.drain()
         with self._mutex_lock:
-            with h5py.File(str(self._save_file), 'a') as _file:
-                person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
-                experiment_group = self._get_person_group_last_experiment_group(person_group)
-
-                if self._current_person is not None:
-                    experiment_group.attrs['early_stop'] = 1 if early_stop else 0
+            if self._current_person is not None and self._session is not None:
+                self._compact_record_log()
+                if command_onsets is not None:
+                    self._session.create_dataset('command_onsets', data=command_onsets)
+                self._session.set_attrs(early_stop=1 if early_stop else 0)
+                ExperimentCatalog(self._session.file()).update_run(self._session.group().name,
+                                                                   early_stop=1 if early_stop else 0,
+                                                                   row_count=self._session.num_rows())
+            self._close_session()
             
             self._current_person = None
             self._person_gr = None
@@ -207,23 +689,54 @@ class DataSaver:
         return self._current_person is not None
     
     def delete_current_record(self):
+        self.drain()
         with self._mutex_lock:
-            if self._current_person is not None:
-                with h5py.File(str(self._save_file), 'a') as _file:
-                    person_group = self._get_person_experiment_group(_file, self._experiment_tag, self._current_person)
-                    experiment_group = self._get_person_group_last_experiment_group(person_group)
-                    del _file[experiment_group.name]
+            if self._current_person is not None and self._session is not None and self._session.group() is not None:
+                group_name = self._session.group().name
+                person_group = self._session.group().parent
+                # catalog row of the run is found by attrs of its group
+                ExperimentCatalog(self._session.file()).remove_run(group_name)
+                self._session.delete_group()
+                update_last_experiment_key(person_group)
+            if self._record_log is not None:
+                self._record_log.remove()
+            self._close_session()
 
             self._current_person = None
             self._current_person_id = None
 
-            for f_a in self._fields_with_array:
-                f_a.tmp_array.clear()
-
-    # def close(self):
-    #     with self._mutex_lock:
-    #         if self._file is not None:
-    #             self._file.close()
-    #             self._file = None
+            for buffer in self._field_buffers:
+                buffer.clear()
 
-        
\ No newline at end of file
+    def close(self):
+        with self._mutex_lock:
+            self._close_session()
+
+
+def recover_record_logs(save_file) -> List[str]:
+    """
+    Compact record logs left after crash into experiment groups of `save_file`.
+    Should be called before any DataSaver starts writing to `save_file`. Returns names of recovered groups
+    """
+    recovered = []
+    for log_path in record_log_paths(save_file):
+        try:
+            header, _ = read_record_log_header(log_path)
+            with DataWriterSession(save_file) as session:
+                group = session.file().get(header['group'])
+                if group is not None:
+                    session.set_group(group)
+                    session.open_field_datasets([f['name'] for f in header['fields']])
+                    for datasets_names, arrays in iter_record_log(log_path):
+                        session.append(datasets_names, arrays)
+                    session.set_attrs(recovered_from_log=1)
+                    if 'early_stop' not in group.attrs:
+                        session.set_attrs(early_stop=1)
+                    ExperimentCatalog(session.file()).update_run(group.name,
+                                                                 early_stop=int(group.attrs['early_stop']),
+                                                                 row_count=session.num_rows())
+                    recovered.append(header['group'])
+            log_path.unlink()
+        except Exception:
+            traceback.print_exc()
+    return recovered
@@ -6,8 +6,8 @@ def draw_experiment_layout(image: np.ndarray, marker_r, commands_generator: Grid
     w, h = image.shape[1], image.shape[0]
 
     centers = commands_generator.centers()
-    vlines = commands_generator.row_separators()
-    hlines = commands_generator.column_separators()
+    vlines = commands_generator.column_separators()
+    hlines = commands_generator.row_separators()
 
     for coord in vlines:
         cv2.line(image, (int(coord*w), 0), (int(coord*w), h), (200, 220, 200), 10)
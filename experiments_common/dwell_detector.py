@@ -0,0 +1,64 @@
+from collections import Counter, deque
+import time
+
+
+class DwellDetector:
+    """
+    Detects that cursor was held on the target command long enough.
+
+    Keeps best match commands of the last `window_sec` seconds in a deque together with running count
+    of samples per command code, so each sample is processed in amortized O(1).
+    Dwell is detected when the window spans at least `min_period_ratio * window_sec` seconds
+    and at least `min_density` of samples in it are the target command.
+    """
+    def __init__(self, window_sec: float, min_period_ratio: float = 0.95, min_density: float = 0.9) -> None:
+        self._window_sec = window_sec
+        self._min_period_ratio = min_period_ratio
+        self._min_density = min_density
+        self._samples = deque()
+        self._counts = Counter()
+        self._target_code = None
+
+    def window_sec(self):
+        return self._window_sec
+
+    def set_window_sec(self, window_sec: float):
+        self._window_sec = window_sec
+        self.reset(self._target_code)
+
+    def target_code(self):
+        return self._target_code
+
+    def reset(self, target_code: int|None = None):
+        self._samples.clear()
+        self._counts.clear()
+        self._target_code = target_code
+
+    def __len__(self):
+        return len(self._samples)
+
+    def density(self):
+        if len(self._samples) == 0:
+            return 0.
+        return self._counts[self._target_code] / len(self._samples)
+
+    def period(self):
+        if len(self._samples) == 0:
+            return 0.
+        return self._samples[-1][0] - self._samples[0][0]
+
+    def add(self, code: int, timestamp: float|None = None) -> bool:
+        """Add best match command sample, `timestamp` is monotonic time in seconds. Returns True if dwell is detected"""
+        if self._target_code is None or self._window_sec <= 0:
+            return False
+        now = time.monotonic() if timestamp is None else timestamp
+        samples = self._samples
+        while len(samples) > 0 and now - samples[0][0] >= self._window_sec:
+            _, old_code = samples.popleft()
+            self._counts[old_code] -= 1
+        samples.append((now, code))
+        self._counts[code] += 1
+
+        if self.period() < self._window_sec * self._min_period_ratio:
+            return False
+        return self.density() >= self._min_density
@@ -0,0 +1,216 @@
+from typing import List
+import h5py
+import numpy as np
+
+
+CATALOG_DATASET = '_catalog'
+LAST_KEY_ATTR = 'last_experiment_key'
+ROW_ATTR = 'catalog_row' # index of the run in catalog, kept in attrs of run group
+# root groups which are not experiment tags, e.g. results of reprocess_videos.py
+REPROCESSED_GROUP = 'reprocessed'
+NON_EXPERIMENT_GROUPS = {REPROCESSED_GROUP}
+
+# strings are stored utf-8 encoded in fixed-size fields, so catalog can be filtered with numpy
+CATALOG_DTYPE = np.dtype([
+    ('experiment_tag', 'S64'),
+    ('person', 'S256'),
+    ('run_key', 'i8'),
+    ('test_id', 'S256'),
+    ('start_time', 'f8'),
+    ('show_cursor', 'i8'),
+    ('num_commands', 'i8'),
+    ('early_stop', 'i8'), # -1 while record is being written
+    ('row_count', 'i8'),
+])
+
+
+def _encode(value) -> bytes:
+    return str(value).encode('utf-8')
+
+
+def decode(value: bytes) -> str:
+    return value.decode('utf-8')
+
+
+def split_experiment_group_name(group_name: str):
+    """'/head/person/3' -> ('head', 'person', 3)"""
+    experiment_tag, person, run_key = group_name.strip('/').split('/')
+    return experiment_tag, person, int(run_key)
+
+
+class ExperimentCatalog:
+    """
+    Compact table of all experiment records of results file, stored as `_catalog` dataset in the file root.
+
+    Table is updated incrementally by DataSaver, so runs can be listed and filtered without visiting
+    `experiment_tag/person/run_key` groups. Files written before catalog existed are indexed by `rebuild()`.
+    """
+    def __init__(self, _file: h5py.File) -> None:
+        self._file = _file
+
+    def _dataset(self, create=True) -> h5py.Dataset|None:
+        dataset = self._file.get(CATALOG_DATASET)
+        if dataset is None and create:
+            dataset = self._file.create_dataset(CATALOG_DATASET, (0,), maxshape=(None,), dtype=CATALOG_DTYPE, chunks=(256,))
+            self._fill(dataset)
+        return dataset
+
+    def exists(self):
+        return CATALOG_DATASET in self._file
+
+    def _run_index(self, dataset: h5py.Dataset, experiment_tag: str, person: str, run_key: int,
+                   scan: bool = True) -> int|None:
+        """Row of the run, found by index in run group attrs. With `scan` runs without valid index are searched in the table"""
+        group = self._file.get(f'{experiment_tag}/{person}/{run_key}')
+        if group is not None and ROW_ATTR in group.attrs:
+            ind = int(group.attrs[ROW_ATTR])
+            if ind < dataset.len():
+                row = dataset[ind]
+                if (row['experiment_tag'], row['person'], row['run_key']) == \
+                        (_encode(experiment_tag), _encode(person), run_key):
+                    return ind
+        if not scan:
+            return None
+        # index is missing or stale, e.g. catalog was written by older version or run group is deleted
+        table = dataset[()]
+        inds = np.flatnonzero((table['experiment_tag'] == _encode(experiment_tag)) &
+                              (table['person'] == _encode(person)) &
+                              (table['run_key'] == run_key))
+        if len(inds) == 0:
+            return None
+        if group is not None:
+            group.attrs[ROW_ATTR] = int(inds[-1])
+        return int(inds[-1])
+
+    def _append(self, dataset: h5py.Dataset, rows: np.ndarray):
+        size = dataset.len()
+        dataset.resize(size + len(rows), axis=0)
+        dataset[size:] = rows
+        for ind, row in enumerate(rows, size):
+            self._set_row_attr(row, ind)
+
+    def _set_row_attr(self, row: np.void, ind: int):
+        group = self._file.get(f'{decode(row["experiment_tag"])}/{decode(row["person"])}/{row["run_key"]}')
+        if group is not None:
+            group.attrs[ROW_ATTR] = ind
+
+    def add_run(self, experiment_group: h5py.Group, row_count: int = 0):
+        dataset = self._dataset()
+        experiment_tag, person, run_key = split_experiment_group_name(experiment_group.name)
+        # _fill of just created catalog already indexed the group, new groups have no index
+        if self._run_index(dataset, experiment_tag, person, run_key, scan=False) is None:
+            self._append(dataset, self._group_row(experiment_group, row_count))
+        person_group = experiment_group.parent
+        person_group.attrs[LAST_KEY_ATTR] = max(run_key, int(person_group.attrs.get(LAST_KEY_ATTR, -1)))
+
+    def update_run(self, experiment_group_name: str, **values):
+        dataset = self._dataset()
+        ind = self._run_index(dataset, *split_experiment_group_name(experiment_group_name))
+        if ind is None:
+            return
+        row = dataset[ind]
+        for key, val in values.items():
+            row[key] = _encode(val) if CATALOG_DTYPE[key].kind == 'S' else val
+        dataset[ind] = row
+
+    def remove_run(self, experiment_group_name: str):
+        dataset = self._dataset()
+        ind = self._run_index(dataset, *split_experiment_group_name(experiment_group_name))
+        if ind is None:
+            return
+        last = dataset.len() - 1
+        if ind != last:
+            dataset[ind] = moved = dataset[last]
+            self._set_row_attr(moved, ind)
+        dataset.resize(last, axis=0)
+
+    def runs(self, experiment_tag: str|None = None, person: str|None = None, test_id: str|None = None,
+             show_cursor: bool|None = None, finished_only=False) -> np.ndarray:
+        """Catalog rows sorted by start time, filtered by not None arguments"""
+        dataset = self._dataset(create=False)
+        if dataset is None:
+            table = self._scan()
+        else:
+            table = dataset[()]
+        mask = np.ones(len(table), bool)
+        if experiment_tag is not None:
+            mask &= table['experiment_tag'] == _encode(experiment_tag)
+        if person is not None:
+            mask &= table['person'] == _encode(person)
+        if test_id is not None:
+            mask &= table['test_id'] == _encode(test_id)
+        if show_cursor is not None:
+            mask &= table['show_cursor'] == int(bool(show_cursor))
+        if finished_only:
+            mask &= table['early_stop'] >= 0
+        table = table[mask]
+        return table[np.argsort(table['start_time'], kind='stable')]
+
+    def last_run_key(self, experiment_tag: str, person: str) -> int:
+        """Key of the latest run of the person, -1 if there are no runs"""
+        person_group = self._file.get(f'{experiment_tag}/{person}')
+        if person_group is None:
+            return -1
+        return last_experiment_key(person_group)
+
+    def rebuild(self):
+        """Index all experiment groups of the file from scratch"""
+        if self.exists():
+            del self._file[CATALOG_DATASET]
+        self._dataset()
+
+    def _fill(self, dataset: h5py.Dataset):
+        table = self._scan()
+        if len(table) > 0:
+            self._append(dataset, table)
+
+    def _scan(self) -> np.ndarray:
+        rows = []
+        for experiment_tag, tag_group in self._file.items():
+            if not isinstance(tag_group, h5py.Group) or experiment_tag in NON_EXPERIMENT_GROUPS:
+                continue
+            for person, person_group in tag_group.items():
+                if not isinstance(person_group, h5py.Group):
+                    continue
+                for run_key, experiment_group in person_group.items():
+                    if isinstance(experiment_group, h5py.Group) and run_key.isdigit():
+                        rows.append(self._group_row(experiment_group))
+        if len(rows) == 0:
+            return np.zeros(0, CATALOG_DTYPE)
+        return np.concatenate(rows)
+
+    def _group_row(self, experiment_group: h5py.Group, row_count: int|None = None) -> np.ndarray:
+        experiment_tag, person, run_key = split_experiment_group_name(experiment_group.name)
+        attrs = experiment_group.attrs
+        if row_count is None:
+            row_count = experiment_group['timestamp_sec'].len() if 'timestamp_sec' in experiment_group else 0
+        row = np.zeros(1, CATALOG_DTYPE)
+        row['experiment_tag'] = _encode(experiment_tag)
+        row['person'] = _encode(person)
+        row['run_key'] = run_key
+        row['test_id'] = _encode(attrs.get('test_id', ''))
+        row['start_time'] = attrs.get('start_time', np.nan)
+        row['show_cursor'] = attrs.get('show_cursor', -1)
+        row['num_commands'] = attrs.get('num_commands', -1)
+        row['early_stop'] = attrs.get('early_stop', -1)
+        row['row_count'] = row_count
+        return row
+
+
+def last_experiment_key(person_group: h5py.Group) -> int:
+    if LAST_KEY_ATTR in person_group.attrs:
+        return int(person_group.attrs[LAST_KEY_ATTR])
+    return max([int(key) for key in [-1, *person_group.keys()]])
+
+
+def update_last_experiment_key(person_group: h5py.Group):
+    """Recompute key of the latest run after run was deleted"""
+    person_group.attrs[LAST_KEY_ATTR] = max([int(key) for key in [-1, *person_group.keys()]])
+
+
+def list_runs(save_file, **filters) -> List[dict]:
+    """Runs of results file as dicts with decoded strings, see ExperimentCatalog.runs for filters"""
+    with h5py.File(str(save_file), 'r') as _file:
+        table = ExperimentCatalog(_file).runs(**filters)
+    return [{name: decode(row[name]) if CATALOG_DTYPE[name].kind == 'S' else row[name].item()
+             for name in CATALOG_DTYPE.names} for row in table]
@@ -1,13 +1,28 @@
 import typing
-from PyQt6.QtCore import QObject, QTimer, pyqtSlot, pyqtSignal
-from dataclasses import dataclass
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSlot, pyqtSignal
 from utils.experiment_configs_model import CurrentConfig
-from time import time
+from experiments_common.dwell_detector import DwellDetector
+import numpy as np
+import time
 
-@dataclass(frozen=True)
-class CommandRecord:
-    time_recorder: float
-    code: int
+
+# one row per command onset, times in ns are time.perf_counter_ns,
+# `forced` is 1 if onset happened because previous command was executed successfully,
+# `rescheduled` is 1 if onset was later than the deadline of the command itself (e.g. GUI stalled),
+# then the command is shown for a full period from its onset instead of being skipped at once.
+# After last command of finished experiment one more row with command_ind == num_commands marks experiment end
+COMMAND_ONSET_DTYPE = np.dtype([
+    ('command_ind', 'i8'),
+    ('scheduled_ns', 'i8'),
+    ('onset_ns', 'i8'),
+    ('latency_sec', 'f8'),
+    ('wall_time_sec', 'f8'),
+    ('forced', 'i1'),
+    ('rescheduled', 'i1'),
+])
+
+# timer is re-armed if it fired earlier than this before the deadline
+_EARLY_WAKEUP_NS = 500_000
 
 
 class ExperimentProgressControl(QObject):
@@ -19,43 +34,82 @@ class ExperimentProgressControl(QObject):
     def __init__(self, parent: QObject | None =None) -> None:
         super().__init__(parent)
         self._timer = QTimer()
-        self._timer.timeout.connect(self._progress)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._deadline_timeout)
         self._command_ind = 0
         self._last_running_experiment_config:CurrentConfig = None
-        self._recorded_commands: typing.List[CommandRecord] = []
-        self._recording_command_code = None
+        self._dwell_detector = DwellDetector(0.)
         self._num_commands_forced = 0
-    
+        self._running = False
+        # absolute deadline of current command, next one is counted from it, so timer slips don't accumulate
+        self._deadline_ns = 0
+        self._command_period_ns = 0
+        self._command_onsets: typing.List[tuple] = []
+
     def start(self, experiment_config: CurrentConfig):
         self._command_ind = -1
         self._num_commands_forced = 0
         self._last_running_experiment_config = experiment_config
-        self._timer.setSingleShot(True)
-        self._timer.setInterval(int(experiment_config.command_time*1000))
-        self._timer.start()
+        self._dwell_detector.set_window_sec(experiment_config.command_capture_time)
+        self._command_onsets = []
+        self._command_period_ns = int(experiment_config.command_time * 1e9)
+        self._deadline_ns = time.perf_counter_ns() + self._command_period_ns
+        self._running = True
+        self._arm_timer()
         self.experiment_started.emit(experiment_config)
 
     def interrupt(self):
         self._stop(True)
 
     def is_running(self):
-        return self._timer.isActive()
-    
-    def _progress(self):
+        return self._running and self._timer.isActive()
+
+    def command_onsets(self) -> np.ndarray:
+        """Onsets of commands of the last started experiment, see COMMAND_ONSET_DTYPE"""
+        return np.array(self._command_onsets, dtype=COMMAND_ONSET_DTYPE)
+
+    def _arm_timer(self):
+        remaining_ns = self._deadline_ns - time.perf_counter_ns()
+        self._timer.start(max(0, int(np.ceil(remaining_ns / 1e6))))
+
+    def _deadline_timeout(self):
+        if not self._running:
+            return
+        if self._deadline_ns - time.perf_counter_ns() > _EARLY_WAKEUP_NS:
+            self._arm_timer()
+            return
+        self._progress(self._deadline_ns, False)
+
+    def _record_onset(self, scheduled_ns: int, onset_ns: int, forced: bool, rescheduled: bool):
+        self._command_onsets.append((self._command_ind, scheduled_ns, onset_ns, (onset_ns - scheduled_ns) / 1e9,
+                                     time.time(), 1 if forced else 0, 1 if rescheduled else 0))
+
+    def _progress(self, scheduled_ns: int, forced: bool):
         configs = self._last_running_experiment_config
         self._command_ind += 1
+        onset_ns = time.perf_counter_ns()
+        # deadline of the new command, slips shorter than a period are absorbed by the next command
+        deadline_ns = scheduled_ns + self._command_period_ns
+        rescheduled = deadline_ns <= onset_ns
+        if rescheduled:
+            # stall longer than a period, otherwise next commands would be shown back to back
+            deadline_ns = onset_ns + self._command_period_ns
+        self._record_onset(scheduled_ns, onset_ns, forced, rescheduled)
         if self._command_ind >= configs.num_commands:
             print('self._command_ind >= configs.num_commands', self._command_ind >= configs.num_commands, self._command_ind, configs.num_commands)
             self._stop(False)
         else:
             print(self._command_ind, configs.num_commands)
+            self._deadline_ns = deadline_ns
             self.experiment_progressed.emit(self._command_ind, configs.num_commands)
-            self._timer.start()
-    
+            if self._running:
+                self._arm_timer()
+
     def _force_next_command(self):
         self._num_commands_forced += 1
         self._timer.stop()
-        self._progress()
+        self._progress(time.perf_counter_ns(), True)
 
     def num_commands_timeouted(self):
         if self._last_running_experiment_config is None and self._command_ind >= 0:
@@ -68,55 +122,26 @@ class ExperimentProgressControl(QObject):
         return self._num_commands_forced
 
     def update_recording_command(self, command_code: int|None):
-        self._recorded_commands = []
-        self._recording_command_code = command_code
-    
+        self._dwell_detector.reset(command_code)
+
     def add_best_match_command(self, command_code: int):
         if not self.is_running():
             return
         if command_code is None:
             return
-        
-        now = time()
-        timeout = self._last_running_experiment_config.command_capture_time
-        recording_command_code = self._recording_command_code
-        
-        if recording_command_code is None:
-            return
-        if timeout == 0:
-            # При выставлении значения удержания == 0, не проводим анализ плотности удержания команды
-            return
-        
-        recorded_commands = list(filter(lambda com: now - com.time_recorder < timeout, self._recorded_commands))
-        recorded_commands.append(CommandRecord(now, command_code))
-        density = sum(map(lambda com: com.code == recording_command_code, recorded_commands))
-        if len(recorded_commands) == 0:
-            density = 0
-        else:
-            density /= len(recorded_commands)
-        
-        timeperiod = now - min(map(lambda com: com.time_recorder, recorded_commands))
-        self._recorded_commands = recorded_commands
-
-        # print('timeperiod =', timeperiod, 'density =', density, end='')
 
-        if timeperiod < timeout * 0.95:
-            # print(f'bad time period, {timeperiod} < {timeout * 0.95}')
-            return
+        # При выставлении значения удержания == 0, не проводим анализ плотности удержания команды,
+        # детектор в этом случае всегда возвращает False
+        if self._dwell_detector.add(command_code):
+            self._force_next_command()
 
-        if density < 0.9:
-            # print(f'bad density {density}')
-            return
-        
-        self._force_next_command()    
-        
     def _stop(self, early_stopping:bool):
-        if self._timer.remainingTime() > 0:
+        self._running = False
+        if self._timer.isActive():
             self._timer.stop()
-        self._recorded_commands = []
-        self._recording_command_code = None
-        
+        self._dwell_detector.reset()
+
         if early_stopping:
             self.experiment_interrupted.emit()
         else:
-            self.experiment_finished.emit()
\ No newline at end of file
+            self.experiment_finished.emit()
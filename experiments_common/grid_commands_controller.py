@@ -1,4 +1,5 @@
-from typing import List
+from typing import Dict, List
+from experiments_common.commands_spatial_index import CommandsSpatialIndex
 from experiments_common.grid_commands_generator import GridCommand, GridCommandsGenerator
 from experiments_common.grid_experiment_drawer import GridExperimentDrawer, Marker, MarkerRole
 from PyQt6.QtCore import QPointF, QObject, QSize, pyqtSlot
@@ -12,9 +13,17 @@ class GridCommandsController(QObject):
         self._commands_generator: GridCommandsGenerator = GridCommandsGenerator(0)
         self._grid_drawer: GridExperimentDrawer = None
         self._centers_markers: List[Marker] = []
+        self._code2marker: Dict[int, Marker] = {}
+        self._target_code: int|None = None
+        self._best_match_code: int|None = None
         self._cursor_marker: Marker = None
         self._do_show_best_match_command = True
         self._drawer_size_changed_connection = None
+        # commands geometry in drawer pixels, recomputed only when generator or drawer size changes
+        self._commands: List[GridCommand] = []
+        self._commands_codes = np.zeros(0, int)
+        self._commands_centers_pix = np.zeros((0, 2), float)
+        self._commands_index: CommandsSpatialIndex = None
 
     def is_show_best_match_command(self):
         return self._do_show_best_match_command
@@ -22,9 +31,7 @@ class GridCommandsController(QObject):
     def set_show_best_match_command(self, value: bool):
         self._do_show_best_match_command = bool(value)
         if not self._do_show_best_match_command:
-            for marker in self._centers_markers:
-                if marker.role() == MarkerRole.TARGET_BEST_MATCH:
-                    marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
+            self._remove_best_match_command()
     
     def set_show_cursor(self, value: bool):
         self._do_show_cursor = bool(value)
@@ -57,20 +64,30 @@ class GridCommandsController(QObject):
             if self._cursor_marker is not None:
                 self._grid_drawer.remove_marker(self._cursor_marker)
             self._centers_markers.clear()
+            self._code2marker.clear()
             self._cursor_marker = None
+            self._target_code = None
+            self._best_match_code = None
+
+    def _update_commands_geometry(self):
+        self._commands = self._commands_generator.grid_commands()
+        size = self._grid_drawer.drawing_surface_size()
+        self._commands_codes = np.array([com.code for com in self._commands], int)
+        self._commands_centers_pix = np.array([[com.x_rel, com.y_rel] for com in self._commands], float).reshape(-1, 2) \
+                                     * [size.width(), size.height()]
+        self._commands_index = self._commands_generator.spatial_index(size.width(), size.height())
 
     def _configure_drawer(self):
         if self._grid_drawer is None:
             return
         self._clear_markers()
-        centers_commands = self._commands_generator.grid_commands()
+        self._update_commands_geometry()
         size = self._grid_drawer.drawing_surface_size()
         # print(size)
-        centers = [self._grid_drawer.create_marker(center.code,\
-                                                   QPointF(center.x_rel*size.width(), center.y_rel*size.height()),\
-                                                   MarkerRole.TARGET_NOT_ACTIVE
-                                                   ) for center in centers_commands]
+        centers = [self._grid_drawer.create_marker(code, QPointF(*center), MarkerRole.TARGET_NOT_ACTIVE)
+                   for code, center in zip(self._commands_codes.tolist(), self._commands_centers_pix.tolist())]
         self._centers_markers.extend(centers)
+        self._code2marker = {marker.code(): marker for marker in centers}
         self._cursor_marker = self._grid_drawer.create_marker(-1, QPointF(0,0), MarkerRole.CURSOR_REAL)
         # self._cursor_marker.set_visible(False)
 
@@ -80,17 +97,27 @@ class GridCommandsController(QObject):
         
         # self._target_changed_connection = self.grid_commands_generator().target_command_changed.connect(self._set_target_command)
 
-    def _set_target_command(self, command: GridCommand|None):
-        if command is None:
-            for marker in self._centers_markers:
-                if marker.role == MarkerRole.TARGET_ACTIVE:
-                    marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
+    def _update_marker_role(self, code: int|None):
+        marker = self._code2marker.get(code)
+        if marker is None:
+            return
+        is_target = code == self._target_code
+        is_best_match = code == self._best_match_code
+        if is_target and is_best_match:
+            marker.set_role(MarkerRole.TARGET_ACTIVE_AND_BEST_MATCH)
+        elif is_target:
+            marker.set_role(MarkerRole.TARGET_ACTIVE)
+        elif is_best_match:
+            marker.set_role(MarkerRole.TARGET_BEST_MATCH)
         else:
-            for marker in self._centers_markers:
-                if marker.code() == command.code:
-                    marker.set_role(MarkerRole.TARGET_ACTIVE)
-                elif marker.role() != MarkerRole.TARGET_BEST_MATCH:
-                    marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
+            marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
+
+    def _set_target_command(self, command: GridCommand|None):
+        # only markers which role changes are updated
+        previous_code = self._target_code
+        self._target_code = None if command is None else int(command.code)
+        self._update_marker_role(previous_code)
+        self._update_marker_role(self._target_code)
 
     def update_target_command_ind(self, command_ind: int|None):
         self._commands_generator.update_command_ind(command_ind)
@@ -108,41 +135,28 @@ class GridCommandsController(QObject):
             return
         if cursor_center is None:
             return
-        best_command = self.best_match_command(cursor_center)
-        for marker in self._centers_markers:
-            if marker.code() != best_command.code:
-                if marker.role() == MarkerRole.TARGET_BEST_MATCH:
-                    marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
-                elif marker.role() == MarkerRole.TARGET_ACTIVE_AND_BEST_MATCH:
-                    marker.set_role(MarkerRole.TARGET_ACTIVE)
-        for marker in self._centers_markers:
-            if marker.code() == best_command.code:
-                if marker.role() in (MarkerRole.TARGET_ACTIVE, MarkerRole.TARGET_ACTIVE_AND_BEST_MATCH):
-                    marker.set_role(MarkerRole.TARGET_ACTIVE_AND_BEST_MATCH)
-                else:
-                    marker.set_role(MarkerRole.TARGET_BEST_MATCH)
-                
+        best_code = int(self.best_match_command(cursor_center).code)
+        if best_code != self._best_match_code:
+            previous_code = self._best_match_code
+            self._best_match_code = best_code
+            self._update_marker_role(previous_code)
+            self._update_marker_role(best_code)
 
     def _remove_best_match_command(self):
-        for marker in self._centers_markers:
-            if marker.role() == MarkerRole.TARGET_BEST_MATCH:
-                marker.set_role(MarkerRole.TARGET_NOT_ACTIVE)
-            elif marker.role() == MarkerRole.TARGET_ACTIVE_AND_BEST_MATCH:
-                marker.set_role(MarkerRole.TARGET_ACTIVE)
+        previous_code = self._best_match_code
+        self._best_match_code = None
+        self._update_marker_role(previous_code)
 
     def best_match_command(self, cursor_center: QPointF):
-        # centers_rel = self._commands_generator.centers()
-        size = self._grid_drawer.drawing_surface_size()
-        w, h = size.width(), size.height()
-        # centers_pix = np.array([[center[0]*w, center[1]*h] for center in centers_rel], dtype=float)
-        commands = self._commands_generator.grid_commands()
-        centers_p = [self.get_command_position(com) for com in commands]
-        centers_pix = np.array(list(map(lambda p: (p.x(), p.y()), centers_p)))
-        distances = np.linalg.norm(centers_pix - [cursor_center.x(), cursor_center.y()], axis=1)
-        # print(np.argmin(distances))
-        best_command:GridCommand = commands[np.argmin(distances)]
+        ind = self._commands_index.query([cursor_center.x(), cursor_center.y()])[0]
+        best_command:GridCommand = self._commands[ind]
         return best_command
 
+    def best_match_commands(self, points: np.ndarray):
+        """Codes (N,) and pixel positions (N, 2) of commands nearest to each of (N, 2) cursor points"""
+        inds = self._commands_index.query(points)
+        return self._commands_codes[inds], self._commands_centers_pix[inds]
+
     def get_command_position(self, command: GridCommand):
         size = self._grid_drawer.drawing_surface_size()
         if command is not None:
@@ -1,6 +1,7 @@
 import numpy as np
 from dataclasses import dataclass
 from PyQt6.QtCore import QSize, QObject, pyqtSignal
+from experiments_common.commands_spatial_index import CommandsSpatialIndex, GridCellIndex, KDTreeIndex
 
 
 @dataclass(frozen=True)
@@ -25,15 +26,20 @@ class GridCommandsGenerator:
 
 class GridCommandsGenerator(QObject):
     def __init__(self, max_commands, offset_l=0, offset_r=0,
-                                   offset_u=0, offset_b=0) -> None:
+                                   offset_u=0, offset_b=0,
+                                   rows=3, cols=3, codes_layout=None) -> None:
+        """
+        `rows` x `cols` grid of commands, `codes_layout` is (rows, cols) array of command codes,
+        by default 3x3 grid uses legacy codes layout and larger grids are numbered row by row
+        """
         super().__init__()
         self._command_ind, self._current_target = None, None
 
+        assert rows > 0 and cols > 0
+        self._rows = int(rows)
+        self._cols = int(cols)
+        self._codes_layout = None if codes_layout is None else np.asarray(codes_layout, int).reshape(self._rows, self._cols)
         self._max_commands = max_commands
-        if max_commands % 9 == 0:
-            n_repeats = int(max_commands // 9)
-        else:
-            n_repeats = int(max_commands // 9) + 1
         
         self._offset_l = offset_l
         self._offset_r = offset_r
@@ -73,11 +79,18 @@ class GridCommandsGenerator(QObject):
     def max_commands(self):
         return self._max_commands
 
+    def rows(self):
+        return self._rows
+
+    def cols(self):
+        return self._cols
+
     def generate_commands_sequence(self, n_commands):
-        if n_commands % 9 == 0:
-            n_repeats = int(n_commands // 9)
+        num_cells = self._rows * self._cols
+        if n_commands % num_cells == 0:
+            n_repeats = int(n_commands // num_cells)
         else:
-            n_repeats = int(n_commands // 9) + 1
+            n_repeats = int(n_commands // num_cells) + 1
         
         if n_repeats == 0:
             inds_shuffled = []
@@ -109,17 +122,15 @@ class GridCommandsGenerator(QObject):
     def _vertical_span(self):
         return self._bottom_line() - self._up_line()
 
+    def grid_centers(self):
+        """Centers of grid cells, row by row"""
+        xs = self._left_line() + self._horizontal_span() * (np.arange(self._cols) + 0.5) / self._cols
+        ys = self._up_line() + self._vertical_span() * (np.arange(self._rows) + 0.5) / self._rows
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        return np.stack([grid_x.reshape(-1), grid_y.reshape(-1)], axis=1)
+
     def centers(self):
-        v_span = self._vertical_span()
-        h_span = self._horizontal_span()
-        start_x = self._left_line()
-        start_y = self._up_line()
-        centers = []
-        for j in range(3):
-            for i in range(3):
-                centers.append((start_x + h_span * (1/6 + i/3), start_y + v_span * (1/6 + j / 3)))
-        centers = np.array(centers, float)
-        return centers
+        return self.grid_centers()
     
     def codes(self):
         """
@@ -127,8 +138,11 @@ class GridCommandsGenerator(QObject):
         1 0 2
         6 4 8
         """
-        return np.array([5, 3, 7, 1, 0, 2, 6, 4, 8])
-        return np.arange(9)
+        if self._codes_layout is not None:
+            return self._codes_layout.reshape(-1)
+        if self._rows == 3 and self._cols == 3:
+            return np.array([5, 3, 7, 1, 0, 2, 6, 4, 8])
+        return np.arange(self._rows * self._cols)
     
     def grid_commands(self):
         codes = self.codes()
@@ -138,16 +152,21 @@ class GridCommandsGenerator(QObject):
         return commands
 
     def row_separators(self):
-        h_span = self._horizontal_span()
-        start_x = self._left_line()
-
-        return start_x + h_span * np.array([1/3, 2/3])
+        """Relative y of horizontal lines between rows"""
+        return self._up_line() + self._vertical_span() * np.arange(1, self._rows) / self._rows
     
     def column_separators(self):
-        v_span = self._vertical_span()
-        start_y = self._up_line()
+        """Relative x of vertical lines between columns"""
+        return self._left_line() + self._horizontal_span() * np.arange(1, self._cols) / self._cols
 
-        return start_y + v_span * np.array([1/3, 2/3])
+    def spatial_index(self, width: float, height: float) -> CommandsSpatialIndex:
+        """Index of nearest command in pixels of `width` x `height` surface, in order of grid_commands()"""
+        centers = self.centers()
+        if centers.shape == (self._rows * self._cols, 2) and np.allclose(centers, self.grid_centers()):
+            return GridCellIndex(self._left_line() * width, self._up_line() * height,
+                                 self._horizontal_span() * width, self._vertical_span() * height,
+                                 self._rows, self._cols)
+        return KDTreeIndex(centers * [width, height])
     
     # def target_window_size(self, size: QSize):
     #     assert isinstance(size, QSize)
@@ -0,0 +1,300 @@
+"""
+Landmark detectors behind one interface, so experiments and offline reprocessing can switch inference runtime.
+
+MediapipeLandmarkBackend - mediapipe tasks FaceLandmarker/HandLandmarker (detection + landmarks on full image)
+TFLiteLandmarkBackend, OnnxLandmarkBackend - landmark model only, run directly by the runtime with configurable
+    number of threads and batches of images. The model has no detection stage, so images should contain
+    the face/hand filling most of the image, i.e. RoiTracker crops. Full frames (no region yet or the target is lost)
+    are processed by the seed backend of `create_seed_backend`, its landmarks seed the region of RoiTracker.
+    Landmark models of mediapipe .task bundles can be extracted by `extract_task_model`.
+
+tflite_runtime (or tensorflow) and onnxruntime are imported only when the corresponding backend is created.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Sequence
+import tempfile
+import zipfile
+import cv2
+import numpy as np
+
+
+FACE_LANDMARKER_TASK = Path(__file__).parent.parent / 'head_tracker_experiment' / 'processing' / 'face_landmarker.task'
+HAND_LANDMARKER_TASK = Path(__file__).parent.parent / 'hand_tracker_experiment' / 'hand_landmarker.task'
+
+# landmark models inside mediapipe .task bundles
+FACE_LANDMARKS_MODEL = 'face_landmarks_detector.tflite'
+HAND_LANDMARKS_MODEL = 'hand_landmarks_detector.tflite'
+
+NUM_LANDMARKS = {'face': 478, 'hand': 21}
+
+
+@dataclass(frozen=True)
+class LandmarkResult:
+    landmarks: np.ndarray|None # (N, 3) x, y normalized to image size, z normalized by image width as in mediapipe
+    world_landmarks: np.ndarray|None = None # (N, 3) metric landmarks if model provides them
+    transform: np.ndarray|None = None # 4x4 facial transformation matrix of mediapipe face landmarker
+    score: float = 1.
+
+    def found(self):
+        return self.landmarks is not None
+
+
+NOT_FOUND = LandmarkResult(None, score=0.)
+
+
+def landmark_objects(landmarks: np.ndarray) -> List[SimpleNamespace]:
+    """Landmarks as objects with x, y, z like in mediapipe results, e.g. for mediapipe drawing utils"""
+    return [SimpleNamespace(x=x, y=y, z=z) for x, y, z in np.asarray(landmarks, float).tolist()]
+
+
+def extract_task_model(task_path, member: str, out_dir=None) -> Path:
+    """Extracts tflite model from mediapipe .task bundle (zip archive) into `out_dir` (temporary dir if None)"""
+    out_dir = Path(tempfile.mkdtemp(prefix='landmark_models_') if out_dir is None else out_dir)
+    with zipfile.ZipFile(task_path) as bundle:
+        return Path(bundle.extract(member, out_dir))
+
+
+class LandmarkBackend:
+    """Detects landmarks of one face/hand on RGB uint8 images"""
+    kind = 'face'
+    # False for landmark models which expect the target filling the image, see create_seed_backend
+    has_detection = True
+
+    def name(self):
+        return type(self).__name__
+
+    def detect(self, image: np.ndarray, timestamp_ms: int|None = None) -> LandmarkResult:
+        raise NotImplementedError()
+
+    def detect_batch(self, images: Sequence[np.ndarray], timestamps_ms: Sequence[int]|None = None) -> List[LandmarkResult]:
+        """Images of one video must be passed in time order. Backends without batching process images one by one"""
+        if timestamps_ms is None:
+            timestamps_ms = [None] * len(images)
+        return [self.detect(image, timestamp) for image, timestamp in zip(images, timestamps_ms)]
+
+    def close(self):
+        pass
+
+
+class MediapipeLandmarkBackend(LandmarkBackend):
+    """
+    mediapipe tasks landmarker. In video mode (`timestamps` are passed to detect) landmarker tracks the target
+    between frames, timestamps must increase. Image mode should be used for RoiTracker crops, which move between
+    frames. Mediapipe runs images one by one, there is no batching.
+    """
+    def __init__(self, kind: str = 'face', model_path=None, video_mode: bool = True) -> None:
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+        from mediapipe.tasks.python.vision.core import vision_task_running_mode
+        import mediapipe as mp
+        self._mp = mp
+        self.kind = kind
+        self._video_mode = video_mode
+        running_mode = vision_task_running_mode.VisionTaskRunningMode
+        running_mode = running_mode.VIDEO if video_mode else running_mode.IMAGE
+        if kind == 'face':
+            base_options = python.BaseOptions(model_asset_path=str(model_path or FACE_LANDMARKER_TASK))
+            options = vision.FaceLandmarkerOptions(base_options=base_options,
+                                                   output_face_blendshapes=False,
+                                                   output_facial_transformation_matrixes=True,
+                                                   num_faces=1, running_mode=running_mode)
+            self.detector = vision.FaceLandmarker.create_from_options(options)
+        elif kind == 'hand':
+            base_options = python.BaseOptions(model_asset_path=str(model_path or HAND_LANDMARKER_TASK))
+            options = vision.HandLandmarkerOptions(base_options=base_options,
+                                                   num_hands=1, running_mode=running_mode)
+            self.detector = vision.HandLandmarker.create_from_options(options)
+        else:
+            raise ValueError(f'unknown landmarks kind {kind}')
+        self._last_timestamp_ms = -1
+
+    def name(self):
+        return f'mediapipe_{self.kind}'
+
+    def detect(self, image: np.ndarray, timestamp_ms: int|None = None) -> LandmarkResult:
+        mp_image = self._mp.Image(self._mp.ImageFormat.SRGB, np.ascontiguousarray(image))
+        if self._video_mode:
+            # landmarker fails on repeated timestamps
+            timestamp_ms = max(int(timestamp_ms if timestamp_ms is not None else 0), self._last_timestamp_ms + 1)
+            self._last_timestamp_ms = timestamp_ms
+            result = self.detector.detect_for_video(mp_image, timestamp_ms)
+        else:
+            result = self.detector.detect(mp_image)
+
+        if self.kind == 'face':
+            if not result.face_landmarks:
+                return NOT_FOUND
+            transforms = result.facial_transformation_matrixes
+            return LandmarkResult(np.array([(lm.x, lm.y, lm.z) for lm in result.face_landmarks[0]]),
+                                  transform=np.array(transforms[0]) if transforms else None)
+        if not result.hand_landmarks:
+            return NOT_FOUND
+        return LandmarkResult(np.array([(lm.x, lm.y, lm.z) for lm in result.hand_landmarks[0]]),
+                              np.array([(lm.x, lm.y, lm.z) for lm in result.hand_world_landmarks[0]]))
+
+    def close(self):
+        self.detector.close()
+
+
+def create_seed_backend(backend: LandmarkBackend, roi_tracker) -> LandmarkBackend|None:
+    """
+    Backend for full frames of RoiTracker if `backend` has no detection stage, None if it has one.
+    Landmarks found by the seed backend start tracking, then `backend` processes the crops.
+    """
+    if backend.has_detection:
+        return None
+    if roi_tracker is None:
+        raise ValueError(f'{backend.name()} has no detection stage, it is used only with RoiTracker')
+    # full frames are not consecutive, tracking starts on them after the target is lost
+    return MediapipeLandmarkBackend(backend.kind, video_mode=False)
+
+
+class _LandmarkModelBackend(LandmarkBackend):
+    """
+    Common pre- and postprocessing of mediapipe landmark models: input is RGB scaled to [0, 1] and resized to
+    model input size, landmarks output is (num_landmarks * 3) coordinates in input pixels, presence output is
+    one score. Outputs are recognised by size in order of their names, second landmarks-sized output (hand model)
+    is world landmarks.
+    """
+    has_detection = False
+
+    def __init__(self, kind: str, min_score: float, presence_is_logit: bool, max_batch_size: int) -> None:
+        self.kind = kind
+        self._num_landmarks = NUM_LANDMARKS[kind]
+        self._min_score = min_score
+        self._presence_is_logit = presence_is_logit
+        self._max_batch_size = max_batch_size
+        self._input_height = 0
+        self._input_width = 0
+        self._channels_first = False
+
+    def _run(self, batch: np.ndarray) -> List[np.ndarray]:
+        """Outputs of model for (B, H, W, 3) float32 batch, ordered by output name"""
+        raise NotImplementedError()
+
+    def _preprocess(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        batch = np.empty((len(images), self._input_height, self._input_width, 3), np.float32)
+        for i, image in enumerate(images):
+            if image.shape[:2] != (self._input_height, self._input_width):
+                image = cv2.resize(image, (self._input_width, self._input_height), interpolation=cv2.INTER_AREA)
+            np.multiply(image, 1 / 255, out=batch[i], casting='unsafe')
+        return batch
+
+    def _postprocess(self, outputs: List[np.ndarray], batch_size: int) -> List[LandmarkResult]:
+        outputs = [output.reshape(batch_size, -1) for output in outputs]
+        landmark_outputs = [output for output in outputs if output.shape[1] == self._num_landmarks * 3]
+        score_outputs = [output for output in outputs if output.shape[1] == 1]
+        landmarks = landmark_outputs[0].reshape(batch_size, self._num_landmarks, 3) \
+                    / [self._input_width, self._input_height, self._input_width]
+        world_landmarks = landmark_outputs[1].reshape(batch_size, self._num_landmarks, 3) if len(landmark_outputs) > 1 else None
+        if len(score_outputs) > 0:
+            scores = score_outputs[0][:, 0].astype(float)
+            if self._presence_is_logit:
+                scores = 1 / (1 + np.exp(-scores))
+        else:
+            scores = np.ones(batch_size)
+
+        results = []
+        for i in range(batch_size):
+            if scores[i] < self._min_score:
+                results.append(LandmarkResult(None, score=float(scores[i])))
+            else:
+                results.append(LandmarkResult(landmarks[i], None if world_landmarks is None else world_landmarks[i],
+                                              score=float(scores[i])))
+        return results
+
+    def detect(self, image: np.ndarray, timestamp_ms: int|None = None) -> LandmarkResult:
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: Sequence[np.ndarray], timestamps_ms: Sequence[int]|None = None) -> List[LandmarkResult]:
+        results = []
+        for start in range(0, len(images), self._max_batch_size):
+            chunk = images[start:start + self._max_batch_size]
+            batch = self._preprocess(chunk)
+            if self._channels_first:
+                batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+            results.extend(self._postprocess(self._run(batch), len(chunk)))
+        return results
+
+
+def _import_tflite_interpreter():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tensorflow.lite.python.interpreter import Interpreter
+        except ImportError as e:
+            raise ImportError('TFLite backend requires tflite-runtime or tensorflow, '
+                              'install it with `pip install tflite-runtime`') from e
+    return Interpreter
+
+
+class TFLiteLandmarkBackend(_LandmarkModelBackend):
+    def __init__(self, model_path, kind: str = 'face', num_threads: int = 1, max_batch_size: int = 8,
+                 min_score: float = 0.5, presence_is_logit: bool|None = None) -> None:
+        # face model returns face flag logit, hand model returns presence probability
+        super().__init__(kind, min_score, kind == 'face' if presence_is_logit is None else presence_is_logit,
+                         max_batch_size)
+        Interpreter = _import_tflite_interpreter()
+        self._num_threads = num_threads
+        self._interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        _, self._input_height, self._input_width, _ = [int(size) for size in self._input['shape']]
+        self._outputs = sorted(self._interpreter.get_output_details(), key=lambda output: output['name'])
+        self._batch_size = 0
+
+    def name(self):
+        return f'tflite_{self.kind}_t{self._num_threads}'
+
+    def _run(self, batch: np.ndarray) -> List[np.ndarray]:
+        if len(batch) != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input['index'], batch.shape)
+            self._interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+        self._interpreter.set_tensor(self._input['index'], batch)
+        self._interpreter.invoke()
+        return [self._interpreter.get_tensor(output['index']) for output in self._outputs]
+
+
+def _import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError('ONNX backend requires onnxruntime, install it with `pip install onnxruntime`') from e
+    return onnxruntime
+
+
+class OnnxLandmarkBackend(_LandmarkModelBackend):
+    """Landmark model converted to ONNX (e.g. by tf2onnx from the tflite model), NHWC and NCHW inputs are supported"""
+    def __init__(self, model_path, kind: str = 'face', num_threads: int = 1, max_batch_size: int = 8,
+                 min_score: float = 0.5, presence_is_logit: bool|None = None) -> None:
+        super().__init__(kind, min_score, kind == 'face' if presence_is_logit is None else presence_is_logit,
+                         max_batch_size)
+        onnxruntime = _import_onnxruntime()
+        self._num_threads = num_threads
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        self._input = self._session.get_inputs()[0]
+        shape = self._input.shape
+        self._channels_first = shape[1] == 3
+        self._input_height, self._input_width = (shape[2], shape[3]) if self._channels_first else (shape[1], shape[2])
+        if isinstance(shape[0], int):
+            # model exported with fixed batch dimension
+            self._max_batch_size = shape[0]
+        self._fixed_batch_size = shape[0] if isinstance(shape[0], int) else None
+        self._output_names = sorted(output.name for output in self._session.get_outputs())
+
+    def name(self):
+        return f'onnx_{self.kind}_t{self._num_threads}'
+
+    def _run(self, batch: np.ndarray) -> List[np.ndarray]:
+        batch_size = len(batch)
+        if self._fixed_batch_size is not None and batch_size < self._fixed_batch_size:
+            padding = np.zeros((self._fixed_batch_size - batch_size, *batch.shape[1:]), batch.dtype)
+            batch = np.concatenate([batch, padding])
+        outputs = self._session.run(self._output_names, {self._input.name: batch})
+        return [output[:batch_size] for output in outputs]
@@ -0,0 +1,118 @@
+from typing import Iterator, List, Tuple
+from pathlib import Path
+from uuid import uuid4
+import numpy as np
+import json
+import os
+import struct
+import threading
+import time
+
+
+LOG_MAGIC = b'PAERLOG1'
+LOG_SUFFIX = '.reclog'
+
+
+def record_dtype(fields) -> np.dtype:
+    """Fixed-size record with one subarray per field, `fields` are DataSaver fields"""
+    return np.dtype([(str(field.name), np.dtype(field.dtype), tuple(field.data_shape)) for field in fields])
+
+
+def record_log_paths(save_file) -> List[Path]:
+    """Logs of records which were not yet compacted into `save_file`"""
+    save_file = Path(save_file)
+    return sorted(save_file.parent.glob(f'{save_file.name}.*{LOG_SUFFIX}'))
+
+
+class RecordLog:
+    """
+    Append-only binary sidecar log of one experiment record.
+
+    Log starts with header describing HDF5 experiment group and records layout, followed by fixed-size records.
+    Data is fsync'ed in batches, not more rarely than once in `fsync_interval_sec`, so after crash at most
+    last batch is lost and log may end with partially written record, which is skipped on reading.
+    """
+    def __init__(self, save_file, group_name: str, fields, fsync_interval_sec: float = 1.) -> None:
+        save_file = Path(save_file)
+        self._path = save_file.parent / f'{save_file.name}.{uuid4().hex}{LOG_SUFFIX}'
+        self._dtype = record_dtype(fields)
+        self._fsync_interval_sec = fsync_interval_sec
+        self._lock = threading.Lock()
+        self._num_records = 0
+
+        header = json.dumps({
+            'save_file': save_file.name,
+            'group': group_name,
+            'fields': [{'name': str(field.name), 'shape': list(field.data_shape), 'dtype': np.dtype(field.dtype).str}
+                       for field in fields],
+            'record_size': self._dtype.itemsize,
+        }).encode('utf-8')
+
+        self._file = open(self._path, 'wb')
+        self._file.write(LOG_MAGIC)
+        self._file.write(struct.pack('<I', len(header)))
+        self._file.write(header)
+        self._sync()
+
+    def path(self) -> Path:
+        return self._path
+
+    def num_records(self):
+        return self._num_records
+
+    def append(self, datasets_names: List[str], arrays: List[np.ndarray]):
+        if len(arrays) == 0 or len(arrays[0]) == 0:
+            return
+        records = np.empty(len(arrays[0]), self._dtype)
+        for name, array in zip(datasets_names, arrays):
+            records[name] = array.reshape(records[name].shape)
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f'Record log {self._path} is already closed')
+            self._file.write(records.tobytes())
+            self._num_records += len(records)
+            if time.monotonic() - self._last_sync_time >= self._fsync_interval_sec:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync_time = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if self._path.exists():
+            self._path.unlink()
+
+
+def read_record_log_header(log_path) -> Tuple[dict, int]:
+    """Returns header and offset of first record"""
+    with open(log_path, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError(f'{log_path} is not a record log')
+        header_len, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, len(LOG_MAGIC) + 4 + header_len
+
+
+def iter_record_log(log_path, block_records: int = 65536) -> Iterator[Tuple[List[str], List[np.ndarray]]]:
+    """Yields (datasets_names, arrays) blocks of complete records of the log"""
+    header, offset = read_record_log_header(log_path)
+    dtype = np.dtype([(f['name'], np.dtype(f['dtype']), tuple(f['shape'])) for f in header['fields']])
+    num_records = (os.path.getsize(log_path) - offset) // dtype.itemsize
+    if num_records == 0:
+        return
+    records = np.memmap(log_path, dtype=dtype, mode='r', offset=offset, shape=(num_records,))
+    names = list(dtype.names)
+    for start in range(0, num_records, block_records):
+        block = records[start:start + block_records]
+        yield names, [np.ascontiguousarray(block[name]) for name in names]
+    del records
@@ -10,7 +10,9 @@ from PyQt6.QtWidgets import QWidget, QMessageBox
 from PyQt6.QtMultimedia import QMediaDevices, QCameraDevice, QCamera, QVideoFrame
 from head_tracker_experiment import HeadTrackerExperiment
 from utils.camera_source import CameraSource
+from utils.video_file_source import PlaybackMode, VideoFileSource
 from utils.experiment_configs_model import CurrentConfig, ExperimentConfigsModel
+from experiments_common.data_saver import recover_record_logs
 # from 
 
 class ExperimentsMainWidget(QWidget):
@@ -28,6 +30,10 @@ class ExperimentsMainWidget(QWidget):
         self.glasses_experiment_window: GlassesTrackerExperiment = None
         self.experiment_config_tracker = ExperimentConfigsModel(self)
         self.experiment_config_tracker.restore_from_file()
+        # records interrupted by crash are left in logs beside results file
+        recovered = recover_record_logs(self.experiment_config_tracker.config().save_path)
+        if len(recovered) > 0:
+            print('recovered records', recovered)
 
         self._ui.cam_select_btn.clicked.connect(self._open_camera_select)
         self._ui.head_experiment_btn.clicked.connect(self._open_head_experiment)
@@ -43,7 +49,7 @@ class ExperimentsMainWidget(QWidget):
 
     @pyqtSlot()
     def _video_inputs_changed(self):
-        can_use_camera = len(QMediaDevices.videoInputs()) > 0
+        can_use_camera = len(QMediaDevices.videoInputs()) > 0 or isinstance(self.camera_source, VideoFileSource)
         self._ui.hands_experiment_btn.setEnabled(can_use_camera)
         self._ui.head_experiment_btn.setEnabled(can_use_camera)
 
@@ -71,13 +77,21 @@ class ExperimentsMainWidget(QWidget):
     #     self.camera_source.camera.errorOccurred.connect(self._show_camera_error)
     #     # self.camera_source.suspend()
 
-    @pyqtSlot(CameraSource)
-    def _camera_source_selected(self, camera_source: CameraSource):
+    @pyqtSlot(QtCore.QObject)
+    def _camera_source_selected(self, camera_source: CameraSource|VideoFileSource):
         self.camera_source = camera_source
         print('camera selected')
 
     # Processing expriments' windows
 
+    def _start_camera_source(self):
+        # experiment windows can't step frames, step mode is for looking through the video in the selection window
+        if isinstance(self.camera_source, VideoFileSource) and self.camera_source.mode() == PlaybackMode.STEP:
+            self.camera_source.set_mode(PlaybackMode.REALTIME)
+        # camera keeps running after selection, recorded video is replayed for each experiment
+        if not self.camera_source.is_running():
+            self.camera_source.start()
+
     def _check_and_warn_if_camera_not_selected(self):
         if self.camera_source is None:
             mb = QMessageBox()
@@ -88,7 +102,7 @@ class ExperimentsMainWidget(QWidget):
             mb.exec()
             return False
         
-        if not self.camera_source.camera.isAvailable():
+        if not self.camera_source.is_available():
             mb = QMessageBox()
             mb.setIcon(QMessageBox.Icon.Critical)
             mb.setInformativeText('Выбранная камера не доступна')
@@ -106,6 +120,7 @@ class ExperimentsMainWidget(QWidget):
 
         self.head_experiment_window = HeadTrackerExperiment(self.camera_source,
                                                             self.experiment_config_tracker.config())
+        self._start_camera_source()
         self.head_experiment_window.show()
         self.hide()
         self.head_experiment_window.window_closing.connect(self._process_experiment_close)
@@ -119,6 +134,7 @@ class ExperimentsMainWidget(QWidget):
 
         self.hand_experiment_window = HandTrackerExperiment(self.camera_source,
                                                             self.experiment_config_tracker.config())
+        self._start_camera_source()
         self.hand_experiment_window.show()
         self.hide()
         self.hand_experiment_window.window_closing.connect(self._process_experiment_close)
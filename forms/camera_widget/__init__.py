@@ -26,7 +26,7 @@ class CameraWidget(QWidget):
 
     def set_camera_source(self, camera_source:CameraSource):
         if camera_source is None:
-            if self.camera_source is not None:
+            if isinstance(self.camera_source, CameraSource):
                 del self.connection_error
                 del self.connection_active_changed
             self._show_image_page()
@@ -37,8 +37,9 @@ class CameraWidget(QWidget):
         
             self.camera_source = camera_source
             self.camera_source.set_video_output(self._ui.video_widget)        
-            self.connection_error = self.camera_source.camera.errorOccurred.connect(self._display_camera_error)
-            self.connection_active_changed = self.camera_source.camera.activeChanged.connect(self._display_normal)
+            if isinstance(self.camera_source, CameraSource):
+                self.connection_error = self.camera_source.camera.errorOccurred.connect(self._display_camera_error)
+                self.connection_active_changed = self.camera_source.camera.activeChanged.connect(self._display_normal)
     
     def set_image_to_videowidget(self, qimage: QImage):
         frame = convert_qimage_qvideoframe(qimage)
@@ -47,6 +47,10 @@ class ConfigureExperimentWidget(QWidget):
         self._ui.command_time.setValue(cached_config.command_time)
         self._ui.command_capture_time.setValue(cached_config.command_capture_time)
         self._ui.show_cursor.setChecked(cached_config.show_cursor)
+        self._ui.grid_rows.setValue(cached_config.grid_rows)
+        self._ui.grid_cols.setValue(cached_config.grid_cols)
+        self._ui.save_frame_latency.setChecked(cached_config.save_frame_latency)
+        self._ui.record_video.setChecked(cached_config.record_video)
     
     def experiment_config(self):
         save_path = Path(self._ui.save_path.text())
@@ -56,4 +60,9 @@ class ConfigureExperimentWidget(QWidget):
         command_time = self._ui.command_time.value()
         command_capture_time = self._ui.command_capture_time.value()
         show_cursor = self._ui.show_cursor.isChecked()
-        return CurrentConfig(save_path, person_name, test_id, num_commands, command_time, command_capture_time, show_cursor)
\ No newline at end of file
+        grid_rows = self._ui.grid_rows.value()
+        grid_cols = self._ui.grid_cols.value()
+        save_frame_latency = self._ui.save_frame_latency.isChecked()
+        record_video = self._ui.record_video.isChecked()
+        return CurrentConfig(save_path, person_name, test_id, num_commands, command_time, command_capture_time, show_cursor,
+                             grid_rows, grid_cols, save_frame_latency, record_video)
\ No newline at end of file
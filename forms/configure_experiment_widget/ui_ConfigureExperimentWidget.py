@@ -107,6 +107,42 @@ class Ui_ConfigureExperimentWidget(object):
         self.label_5 = QtWidgets.QLabel(parent=self.widget_2)
         self.label_5.setObjectName("label_5")
         self.gridLayout_2.addWidget(self.label_5, 4, 0, 1, 1)
+        self.label_8 = QtWidgets.QLabel(parent=self.widget_2)
+        self.label_8.setObjectName("label_8")
+        self.gridLayout_2.addWidget(self.label_8, 7, 0, 1, 1)
+        self.save_frame_latency = QtWidgets.QCheckBox(parent=self.widget_2)
+        self.save_frame_latency.setText("")
+        self.save_frame_latency.setObjectName("save_frame_latency")
+        self.gridLayout_2.addWidget(self.save_frame_latency, 7, 1, 1, 1)
+        self.label_9 = QtWidgets.QLabel(parent=self.widget_2)
+        self.label_9.setObjectName("label_9")
+        self.gridLayout_2.addWidget(self.label_9, 8, 0, 1, 1)
+        self.record_video = QtWidgets.QCheckBox(parent=self.widget_2)
+        self.record_video.setText("")
+        self.record_video.setObjectName("record_video")
+        self.gridLayout_2.addWidget(self.record_video, 8, 1, 1, 1)
+        self.label_10 = QtWidgets.QLabel(parent=self.widget_2)
+        self.label_10.setObjectName("label_10")
+        self.gridLayout_2.addWidget(self.label_10, 9, 0, 1, 1)
+        self.grid_rows = QtWidgets.QSpinBox(parent=self.widget_2)
+        self.grid_rows.setMaximumSize(QtCore.QSize(100, 16777215))
+        self.grid_rows.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+        self.grid_rows.setMinimum(1)
+        self.grid_rows.setMaximum(10)
+        self.grid_rows.setProperty("value", 3)
+        self.grid_rows.setObjectName("grid_rows")
+        self.gridLayout_2.addWidget(self.grid_rows, 9, 1, 1, 1)
+        self.label_11 = QtWidgets.QLabel(parent=self.widget_2)
+        self.label_11.setObjectName("label_11")
+        self.gridLayout_2.addWidget(self.label_11, 10, 0, 1, 1)
+        self.grid_cols = QtWidgets.QSpinBox(parent=self.widget_2)
+        self.grid_cols.setMaximumSize(QtCore.QSize(100, 16777215))
+        self.grid_cols.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
+        self.grid_cols.setMinimum(1)
+        self.grid_cols.setMaximum(10)
+        self.grid_cols.setProperty("value", 3)
+        self.grid_cols.setObjectName("grid_cols")
+        self.gridLayout_2.addWidget(self.grid_cols, 10, 1, 1, 1)
         self.gridLayout.addWidget(self.widget_2, 0, 0, 1, 1)
 
         self.retranslateUi(ConfigureExperimentWidget)
@@ -128,3 +164,7 @@ class Ui_ConfigureExperimentWidget(object):
         self.command_time.setSuffix(_translate("ConfigureExperimentWidget", " сек"))
         self.label_2.setText(_translate("ConfigureExperimentWidget", "Ф.И.О"))
         self.label_5.setText(_translate("ConfigureExperimentWidget", "Время команды"))
+        self.label_9.setText(_translate("ConfigureExperimentWidget", "Записывать видео с камеры"))
+        self.label_8.setText(_translate("ConfigureExperimentWidget", "Сохранять задержки кадров"))
+        self.label_11.setText(_translate("ConfigureExperimentWidget", "Столбцов в сетке"))
+        self.label_10.setText(_translate("ConfigureExperimentWidget", "Строк в сетке"))
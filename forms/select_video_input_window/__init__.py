@@ -1,10 +1,12 @@
 import typing
 from PyQt6 import QtCore, QtGui
 from PyQt6.QtCore import pyqtSlot, pyqtSignal
-from PyQt6.QtWidgets import QMainWindow, QMessageBox, QApplication
+from PyQt6.QtCore import QObject
+from PyQt6.QtWidgets import QMainWindow, QMessageBox, QApplication, QFileDialog
 from PyQt6.QtGui import QActionGroup, QAction
 
 from utils.camera_source import CameraSource
+from utils.video_file_source import PlaybackMode, VideoFileSource
 try:
     from .ui_SelectVideoInputWindow import Ui_SelectVideoInputWindow
 except ImportError:
@@ -91,13 +93,16 @@ from PyQt6.QtMultimedia import (QAudioInput, QCamera, QCameraDevice,
             
 class SelectVideoInputWindow(QMainWindow):
     camera_selected = pyqtSignal(QCameraDevice, QVideoFrame.RotationAngle, bool)
-    camera_source_selected = pyqtSignal(CameraSource)
+    camera_source_selected = pyqtSignal(QObject) # CameraSource or VideoFileSource
     window_closing = pyqtSignal()
 
     def __init__(self, ) -> None:
         super().__init__()
         self.setup_ui()
         self.camera_source = CameraSource(QMediaDevices.defaultVideoInput())
+        self.video_file_source: VideoFileSource = None
+        # source shown in the window and selected on confirmation
+        self._video_source = self.camera_source
         self.connection = self.camera_source.frame_captured.connect(self.frame_captured)
 
         # self.camera_source.frame_captured.connect(self._ui.video_widget.videoSink().setVideoFrame)
@@ -111,9 +116,20 @@ class SelectVideoInputWindow(QMainWindow):
         self._devices.videoInputsChanged.connect(self.update_cameras)
         self.update_cameras()
 
-        self._ui.action_rotate_clockwise.triggered.connect(self.camera_source.rotate_clockwise)
-        self._ui.action_rotate_counter_clockwise.triggered.connect(self.camera_source.rotate_counter_clockwise)
-        self._ui.action_mirror.toggled.connect(self.camera_source.set_mirrored)
+        self._ui.action_rotate_clockwise.triggered.connect(lambda: self._video_source.rotate_clockwise())
+        self._ui.action_rotate_counter_clockwise.triggered.connect(lambda: self._video_source.rotate_counter_clockwise())
+        self._ui.action_mirror.toggled.connect(lambda mirrored: self._video_source.set_mirrored(mirrored))
+
+        self._playback_modes_group = QActionGroup(self)
+        self._playback_modes_group.setExclusive(True)
+        for action, mode in [(self._ui.action_play_realtime, PlaybackMode.REALTIME),
+                             (self._ui.action_play_fast, PlaybackMode.FAST),
+                             (self._ui.action_play_step, PlaybackMode.STEP)]:
+            action.setData(mode)
+            self._playback_modes_group.addAction(action)
+        self._playback_modes_group.triggered.connect(self._set_playback_mode)
+        self._ui.action_open_video_file.triggered.connect(self._open_video_file)
+        self._ui.action_next_frame.triggered.connect(self._next_frame)
 
         self._ui.action_confirm_select.triggered.connect(self._confirmed)
 
@@ -136,10 +152,52 @@ class SelectVideoInputWindow(QMainWindow):
 
     @pyqtSlot()
     def _confirmed(self):
-        if not self.camera_source.camera.cameraDevice().isNull():
+        if self._video_source is self.video_file_source:
+            # experiments replay the file from the beginning
+            self.video_file_source.stop()
+            self.camera_source_selected.emit(self.video_file_source)
+        elif not self.camera_source.camera.cameraDevice().isNull():
             self.camera_source_selected.emit(self.camera_source)
         self.close()
 
+    def _set_video_source(self, video_source: QObject):
+        if video_source is self._video_source:
+            return
+        self.disconnect(self.connection)
+        self._video_source.stop()
+        if self._video_source is self.video_file_source:
+            self.video_file_source = None
+        self._video_source = video_source
+        self._video_source.set_mirrored(self._ui.action_mirror.isChecked())
+        self.connection = self._video_source.frame_captured.connect(self.frame_captured)
+
+    @pyqtSlot()
+    def _open_video_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Открыть видеофайл', '',
+                                              'Видео (*.mp4 *.avi *.mkv *.mov *.webm);;Все файлы (*)')
+        if path == '':
+            return
+        video_file_source = VideoFileSource(path, self._playback_modes_group.checkedAction().data())
+        if not video_file_source.is_available():
+            QMessageBox.warning(self, 'Ошибка видеофайла', f'Не удалось открыть видеофайл {path}')
+            return
+        self._set_video_source(video_file_source)
+        self.video_file_source = video_file_source
+        for action in self._video_devices_group.actions():
+            action.setChecked(False)
+        self.video_file_source.start()
+        if self.video_file_source.mode() == PlaybackMode.STEP:
+            self.video_file_source.step()
+
+    def _set_playback_mode(self, action: QAction):
+        if self.video_file_source is not None:
+            self.video_file_source.set_mode(action.data())
+
+    @pyqtSlot()
+    def _next_frame(self):
+        if self.video_file_source is not None and self.video_file_source.mode() == PlaybackMode.STEP:
+            self.video_file_source.step()
+
     @pyqtSlot()
     def update_cameras(self):
         available_cameras = QMediaDevices.videoInputs()
@@ -162,6 +220,7 @@ class SelectVideoInputWindow(QMainWindow):
 
     @pyqtSlot(QCameraDevice)
     def set_camera(self, camera_device):
+        self._set_video_source(self.camera_source)
         self.camera_source.set_camera(camera_device)
         self.camera_source.start()
         
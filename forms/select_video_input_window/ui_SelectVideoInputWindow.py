@@ -32,6 +32,8 @@ class Ui_SelectVideoInputWindow(object):
         self.menubar.setObjectName("menubar")
         self.menu_devices = QtWidgets.QMenu(parent=self.menubar)
         self.menu_devices.setObjectName("menu_devices")
+        self.menu_video_file = QtWidgets.QMenu(parent=self.menubar)
+        self.menu_video_file.setObjectName("menu_video_file")
         self.menu_actions = QtWidgets.QMenu(parent=self.menubar)
         self.menu_actions.setObjectName("menu_actions")
         self.menu = QtWidgets.QMenu(parent=self.menubar)
@@ -49,11 +51,32 @@ class Ui_SelectVideoInputWindow(object):
         self.action_mirror = QtGui.QAction(parent=SelectVideoInputWindow)
         self.action_mirror.setCheckable(True)
         self.action_mirror.setObjectName("action_mirror")
+        self.action_open_video_file = QtGui.QAction(parent=SelectVideoInputWindow)
+        self.action_open_video_file.setObjectName("action_open_video_file")
+        self.action_play_realtime = QtGui.QAction(parent=SelectVideoInputWindow)
+        self.action_play_realtime.setCheckable(True)
+        self.action_play_realtime.setChecked(True)
+        self.action_play_realtime.setObjectName("action_play_realtime")
+        self.action_play_fast = QtGui.QAction(parent=SelectVideoInputWindow)
+        self.action_play_fast.setCheckable(True)
+        self.action_play_fast.setObjectName("action_play_fast")
+        self.action_play_step = QtGui.QAction(parent=SelectVideoInputWindow)
+        self.action_play_step.setCheckable(True)
+        self.action_play_step.setObjectName("action_play_step")
+        self.action_next_frame = QtGui.QAction(parent=SelectVideoInputWindow)
+        self.action_next_frame.setObjectName("action_next_frame")
+        self.menu_video_file.addAction(self.action_open_video_file)
+        self.menu_video_file.addSeparator()
+        self.menu_video_file.addAction(self.action_play_realtime)
+        self.menu_video_file.addAction(self.action_play_fast)
+        self.menu_video_file.addAction(self.action_play_step)
+        self.menu_video_file.addAction(self.action_next_frame)
         self.menu_actions.addAction(self.action_confirm_select)
         self.menu.addAction(self.action_rotate_clockwise)
         self.menu.addAction(self.action_rotate_counter_clockwise)
         self.menu.addAction(self.action_mirror)
         self.menubar.addAction(self.menu_devices.menuAction())
+        self.menubar.addAction(self.menu_video_file.menuAction())
         self.menubar.addAction(self.menu.menuAction())
         self.menubar.addAction(self.menu_actions.menuAction())
 
@@ -64,10 +87,17 @@ class Ui_SelectVideoInputWindow(object):
         _translate = QtCore.QCoreApplication.translate
         SelectVideoInputWindow.setWindowTitle(_translate("SelectVideoInputWindow", "Выбор видеовхода"))
         self.menu_devices.setTitle(_translate("SelectVideoInputWindow", "Устройства"))
+        self.menu_video_file.setTitle(_translate("SelectVideoInputWindow", "Видеофайл"))
         self.menu_actions.setTitle(_translate("SelectVideoInputWindow", "Действия"))
         self.menu.setTitle(_translate("SelectVideoInputWindow", "Изменение изображения"))
         self.action_confirm_select.setText(_translate("SelectVideoInputWindow", "Подтвердить выбор"))
         self.action_rotate_clockwise.setText(_translate("SelectVideoInputWindow", "Поворот по часовой"))
         self.action_rotate_counter_clockwise.setText(_translate("SelectVideoInputWindow", "Поворот против часовой"))
         self.action_mirror.setText(_translate("SelectVideoInputWindow", "Отразить зеркально"))
+        self.action_open_video_file.setText(_translate("SelectVideoInputWindow", "Открыть видеофайл..."))
+        self.action_play_realtime.setText(_translate("SelectVideoInputWindow", "В реальном времени"))
+        self.action_play_fast.setText(_translate("SelectVideoInputWindow", "С максимальной скоростью"))
+        self.action_play_step.setText(_translate("SelectVideoInputWindow", "Покадрово"))
+        self.action_next_frame.setText(_translate("SelectVideoInputWindow", "Следующий кадр"))
+        self.action_next_frame.setShortcut(_translate("SelectVideoInputWindow", "Right"))
 from PyQt6.QtMultimediaWidgets import QVideoWidget
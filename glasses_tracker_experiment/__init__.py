@@ -202,8 +202,8 @@ class GlassesController(QObject):
     def available_ports_info(self):
         return QSerialPortInfo.availablePorts()
 
-    def setup_glasses_reader(self, port_info: QSerialPortInfo):
-        self._reader = GlassesReader(port_info=port_info)
+    def setup_glasses_reader(self, port_info: QSerialPortInfo|None, transport_factory=None, filter_factory=None):
+        self._reader = GlassesReader(port_info=port_info, transport_factory=transport_factory, filter_factory=filter_factory)
         self._reader.started.connect(self._glasses_reader_started)
         self._reader.data_changed.connect(self._glasses_reader_data_changed)
         self._reader.finished.connect(self._glasses_reader_finished)
@@ -335,7 +335,7 @@ class GlassesController(QObject):
         
         self._glasses_calib_result = model_result = self._callibrator.generate_model()
         self._glasses_calibration_data_saver.add_callibration_result(model_result)
-        self._glasses_calibration_data_saver.stop_save(False)
+        self._glasses_calibration_data_saver.stop_save(False, self._experiment_control.command_onsets())
 
         # todo allow form to run experiment
         self._state = ControllerState.FREE_RUN
@@ -349,7 +349,9 @@ class GlassesController(QObject):
         print(experiment_config)
 
         self._experiment_control.start(experiment_config)
-        self._commands_controller.set_grid_commands_generator(GridCommandsGenerator(experiment_config.num_commands))
+        self._commands_controller.set_grid_commands_generator(GridCommandsGenerator(experiment_config.num_commands,
+                                                                                    rows=experiment_config.grid_rows,
+                                                                                    cols=experiment_config.grid_cols))
 
         target_size_pix = self._drawer.drawing_surface_size()
         view_size = self._drawer.view_size()
@@ -364,6 +366,8 @@ class GlassesController(QObject):
                                               view_size.width(),
                                               view_size.height(),
                                               self._last_calibration_id)
+        self._glasses_experiment_data_saver.append_attrs(grid_rows=experiment_config.grid_rows,
+                                                         grid_cols=experiment_config.grid_cols)
         
     
     def is_experiment_running(self):
@@ -378,7 +382,8 @@ class GlassesController(QObject):
             if not do_save_if_early and early_stop:
                 self._glasses_experiment_data_saver.delete_current_record()
             else:
-                self._glasses_experiment_data_saver.stop_save(early_stop=early_stop)
+                self._glasses_experiment_data_saver.stop_save(early_stop=early_stop,
+                                                                command_onsets=self._experiment_control.command_onsets())
                 
         # todo allow form to run other stuff
         self._state = ControllerState.FREE_RUN
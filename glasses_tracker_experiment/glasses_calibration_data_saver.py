@@ -13,6 +13,9 @@ class GlassesCallibrationDataSaver(DataSaver):
     def __init__(self, save_file) -> None:
         super().__init__(save_file, 'glasses_callibration')
 
+    def _expected_sample_rate(self) -> float:
+        return 80.
+
     def _save_fields(self) -> List[Field]:
         fields = [
             Field('command_ind', (1,), 'i8', -1),
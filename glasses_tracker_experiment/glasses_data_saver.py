@@ -21,6 +21,9 @@ class GlassesDataSaver(DataSaver):
                                               view_width, view_height,
                                               **{'calibration_dataset_id': calibration_dataset_id})
 
+    def _expected_sample_rate(self) -> float:
+        return 80.
+
     def _save_fields(self) -> List[Field]:
         fields = [
             Field('command_ind', (1,), 'i8', -1),
@@ -1,12 +1,12 @@
 from dataclasses import dataclass
 import typing
-import serial
 import numpy as np
 from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot, QThreadPool, QIODeviceBase
 from PyQt6.QtSerialPort import QSerialPort, QSerialPortInfo
 from utils.threading import Worker
-from serial import Serial 
-from time import time
+from glasses_tracker_experiment.glasses_transport import GlassesTransport, SerialTransport, parse_line
+from glasses_tracker_experiment.streaming_filters import MovingAverageFilter, StreamingFilter
+from time import time, perf_counter_ns
 # from scipy.signal import butter, lfilter
 # from scipy.signal import freqs
 
@@ -21,22 +21,6 @@ from time import time
 #     y = lfilter(b, a, data)
 #     return y
 
-def low_pass_filter(adata: np.ndarray, bandlimit: int = 1000, sampling_rate: int = 44100) -> np.ndarray:
-    # translate bandlimit from Hz to dataindex according to sampling rate and data size
-    bandlimit_index = int(bandlimit * adata.size / sampling_rate)
-
-    fsig = np.fft.fft(adata)
-    
-    for i in range(bandlimit_index + 1, len(fsig) - bandlimit_index ):
-        fsig[i] = 0
-        
-    adata_filtered = np.fft.ifft(fsig)
-
-    return np.real(adata_filtered)
-
-from sklearn.linear_model import LinearRegression
-from skforecast.ForecasterAutoreg import ForecasterAutoreg
-
 
 class _GlassesReader(QObject):
     started = pyqtSignal()
@@ -44,29 +28,38 @@ class _GlassesReader(QObject):
     finished = pyqtSignal()
     error_occured = pyqtSignal(Exception, str)
 
-    def __init__(self, port_name: str) -> None:
+    def __init__(self, transport: GlassesTransport, low_pass: StreamingFilter|None = None) -> None:
         super().__init__()
-        self._port_name = port_name
-        self._serial_port = None
+        self._transport = transport
         self._stopping = False
+        self._num_lines = 0
+        self._num_corrupted = 0
+        self._num_emitted = 0
+        self._process_ns = 0
 
         self._runing_dt = 1/80
         self._last_ts = None
-        self._values_buffer = []
         self._store_data_time = 0.1
+        self._low_pass = MovingAverageFilter(self._store_data_time) if low_pass is None else low_pass
 
         self._num_lags = 10
         # self._forecast_model = ForecasterAutoreg(LinearRegression(), lags=self._num_lags)
 
     
     def is_running(self) -> bool:
-        if self._serial_port is None:
-            return False
-        return self._serial_port.is_open
+        return self._transport.is_open()
+
+    def counters(self):
+        return {
+            'lines': self._num_lines,
+            'corrupted': self._num_corrupted,
+            'emitted': self._num_emitted,
+            'process_ns': self._process_ns, # parsing and filtering of emitted lines
+        }
 
     def start(self):
         try:
-            self._serial_port = Serial(self._port_name, 115200, timeout=0.1, inter_byte_timeout=0.1)
+            self._transport.open()
             self.started.emit()
         except Exception as e:
             import traceback
@@ -76,8 +69,7 @@ class _GlassesReader(QObject):
     def stop(self):
         self._stopping = True
         try:
-            if self._serial_port is not None and self._serial_port.is_open:
-                self._serial_port.close()
+            self._transport.close()
         except Exception as e:
             import traceback
             self.error_occured.emit(e, traceback.format_exc())
@@ -91,17 +83,21 @@ class _GlassesReader(QObject):
         self.stop()
 
     def start_read_data(self):
-        if self._serial_port is None or not self._serial_port.is_open:
+        if not self._transport.is_open():
             raise ValueError('Serial should be opened first')
         try:
-            while self._serial_port.is_open:
+            while self._transport.is_open():
                 # print('a', end='\t')
-                line = self._serial_port.read_until().decode()
+                line = self._transport.read_line()
                 # print(line)
-                if line.count('\t') != 3:
+                if not line:
+                    continue
+                self._num_lines += 1
+                start_ns = perf_counter_ns()
+                elems = parse_line(line)
+                if elems is None:
+                    self._num_corrupted += 1
                     continue
-                line = line.replace('\r', '').replace('\n', '')
-                elems = np.array(list(map(float, line.split())), dtype=float)
 
                 ts = time()
                 if self._last_ts is None:
@@ -113,31 +109,10 @@ class _GlassesReader(QObject):
                 self._runing_dt = 0.8 * self._runing_dt + 0.2 * dt
                 self._last_ts = ts
                 
-
-                self._values_buffer.append(elems)
-                store_elems = int(np.ceil(self._store_data_time * (1 / self._runing_dt)))
-                if len(self._values_buffer) > store_elems:
-                    self._values_buffer = self._values_buffer[-store_elems:]
-
-                # print('self._runing_dt', round(self._runing_dt, 3), ', len_buffer', len(self._values_buffer))
-
-
-                vals_arr = np.asarray(self._values_buffer, float)
-                # print(vals_arr)
-                filtered_values = np.array([low_pass_filter(vals_arr[:, col_ind], 5, 1/self._runing_dt) for col_ind in range(vals_arr.shape[1])]).T
-                # filtered_values = low_pass_filter(self._values_buffer, 10, 1/self._runing_dt)
-
-                # self._values_buffer.append(elems)
-
-                # store_elems = self._store_data_time * self._runing_dt
-                # if len(self._values_buffer) > self._store_data_time * self._runing_dt:
-                #     store_elems
-                # self._values_buffer = self._values_buffer[-self._num_lags:]
-                # if len(self._values_buffer) == self._num_lags:
-                #     reg = LinearRegression.fit()
-
-                final_elems = filtered_values[-1]
+                final_elems = self._low_pass.process(elems, 1 / self._runing_dt)
                 # print(final_elems)
+                self._process_ns += perf_counter_ns() - start_ns
+                self._num_emitted += 1
                 self.data_changed.emit(final_elems)
                 # self.data_changed.emit(elems)
         except Exception as e:
@@ -181,9 +156,14 @@ class GlassesReader(QObject):
     data_changed = pyqtSignal(np.ndarray)
     finished = pyqtSignal()
     error_occured = pyqtSignal(str)
-    def __init__(self, port_info: QSerialPortInfo):
+    def __init__(self, port_info: QSerialPortInfo|None, transport_factory: typing.Callable[[], GlassesTransport]|None = None,
+                 filter_factory: typing.Callable[[], StreamingFilter]|None = None):
         super().__init__()
+        # transport_factory replaces serial port of port_info, e.g. with SimulatedTransport
         self._port_info = port_info
+        self._transport_factory = transport_factory
+        # low-pass filter of sensor values, moving average over 0.1 s if None
+        self._filter_factory = filter_factory
         self._threadpool = QThreadPool()
         self._worker = None
         self._reader = None
@@ -206,7 +186,11 @@ class GlassesReader(QObject):
     def open(self):
         if self.is_running():
             return
-        self._reader = _GlassesReader(self._port_info.portName())
+        if self._transport_factory is None:
+            transport = SerialTransport(self._port_info.portName())
+        else:
+            transport = self._transport_factory()
+        self._reader = _GlassesReader(transport, None if self._filter_factory is None else self._filter_factory())
         self._reader.started.connect(self.started.emit)
         self._reader.data_changed.connect(lambda data: (self.data_changed.emit(data)))#, print(data)))
         self._reader.finished.connect(self.finished.emit)
@@ -223,6 +207,9 @@ class GlassesReader(QObject):
     def is_running(self):
         return self._reader is not None and self._reader.is_running()
     
+    def counters(self):
+        return {} if self._reader is None else self._reader.counters()
+
     def is_correct(self):
         return not self._error_occured
 
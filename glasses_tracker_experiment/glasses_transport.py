@@ -0,0 +1,230 @@
+"""
+Line sources of glasses sensor data read by _GlassesReader.
+
+The device sends one line per sample: 3 sensor values, each followed by a tab, ended by '\\r\\n'.
+SerialTransport - the device on a serial port (pyserial)
+SimulatedTransport - in-process device without hardware: replays a recording (`data` dataset of
+    record_glasses_pure.py files) or synthesizes eye movements, at a configurable rate with jitter of
+    line arrival times and a share of corrupted lines. Used for load tests, see benchmarks/glasses_load_benchmark.py
+
+`open_transport` selects transport by port name: 'sim' - synthesized data, 'sim:<file.hdf5>' - replay, else serial port.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+import threading
+import time
+
+import h5py
+import numpy as np
+from serial import Serial
+
+
+NUM_VALUES = 3
+SIMULATED_PORT = 'sim'
+
+
+def parse_line(line: bytes) -> np.ndarray|None:
+    """Sensor values of a device line, None for incomplete or corrupted lines"""
+    text = line.decode(errors='replace')
+    if text.count('\t') != NUM_VALUES:
+        return None
+    try:
+        values = np.array(text.split(), dtype=float)
+    except ValueError:
+        return None
+    if values.shape != (NUM_VALUES,):
+        return None
+    return values
+
+
+def format_line(values: np.ndarray) -> bytes:
+    return (''.join(f'{value:.2f}\t' for value in values) + '\r\n').encode()
+
+
+class GlassesTransport:
+    """Source of device lines, opened and read in the thread of _GlassesReader, closed from any thread"""
+
+    def name(self):
+        return type(self).__name__
+
+    def open(self):
+        raise NotImplementedError()
+
+    def close(self):
+        raise NotImplementedError()
+
+    def is_open(self) -> bool:
+        raise NotImplementedError()
+
+    def read_line(self) -> bytes:
+        """Next line with its ending, incomplete line or b'' if nothing came in time"""
+        raise NotImplementedError()
+
+
+class SerialTransport(GlassesTransport):
+    def __init__(self, port_name: str, baudrate: int = 115200, timeout: float = 0.1) -> None:
+        self._port_name = port_name
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._serial: Serial = None
+
+    def name(self):
+        return self._port_name
+
+    def open(self):
+        self._serial = Serial(self._port_name, self._baudrate, timeout=self._timeout, inter_byte_timeout=self._timeout)
+
+    def close(self):
+        if self._serial is not None and self._serial.is_open:
+            self._serial.close()
+
+    def is_open(self):
+        return self._serial is not None and self._serial.is_open
+
+    def read_line(self):
+        return self._serial.read_until()
+
+
+@dataclass(frozen=True)
+class SimulatedTransportStats:
+    lines_sent: int
+    corrupted_sent: int
+    # how late lines were read relative to their arrival time, grows if the reader doesn't keep up
+    lag_ms_p50: float
+    lag_ms_p95: float
+    lag_ms_max: float
+
+
+class SimulatedTransport(GlassesTransport):
+    """
+    Glasses device simulated in the reading thread.
+
+    Line arrival times follow `rate_hz`, each interval is scaled by (1 + jitter * N(0, 1)), so lines come in bursts
+    like from a USB serial adapter, while the mean rate stays the same. `corrupt_rate` is the share of corrupted lines:
+    cut (glued to the next line), garbage bytes, wrong number of values or empty.
+    With `realtime=False` lines are returned as fast as they are read.
+    """
+    _CORRUPTIONS = ('cut', 'garbage', 'values', 'empty')
+
+    def __init__(self, recording: str|Path|None = None, rate_hz: float = 80., jitter: float = 0.,
+                 corrupt_rate: float = 0., loop: bool = True, realtime: bool = True, timeout: float = 0.1,
+                 dataset: str = 'data', seed: int|None = None) -> None:
+        self._recording = None if recording is None else Path(recording)
+        self._rate_hz = rate_hz
+        self._jitter = jitter
+        self._corrupt_rate = corrupt_rate
+        self._loop = loop
+        self._realtime = realtime
+        self._timeout = timeout
+        self._rng = np.random.default_rng(seed)
+        self._closed = threading.Event()
+        self._closed.set()
+
+        self._data = None
+        if self._recording is not None:
+            with h5py.File(self._recording, 'r') as f:
+                self._data = np.asarray(f[dataset], float).reshape(-1, NUM_VALUES)
+        self._index = 0
+        self._gaze = np.zeros(2)
+        self._target = np.zeros(2)
+        self._fixation_end = 0.
+        # sensor responses to gaze movement, values stay in 10-bit ADC range
+        self._offsets = np.array([512., 480., 540.])
+        self._gains = np.array([[180., 40.], [-120., 150.], [-60., -170.]])
+        self._cut = b''
+
+        self._next_due = 0.
+        self._lines_sent = 0
+        self._corrupted_sent = 0
+        self._lags_ms = []
+
+    def name(self):
+        return SIMULATED_PORT if self._recording is None else f'{SIMULATED_PORT}:{self._recording}'
+
+    def open(self):
+        self._index = 0
+        self._cut = b''
+        self._next_due = time.perf_counter()
+        self._closed.clear()
+
+    def close(self):
+        self._closed.set()
+
+    def is_open(self):
+        return not self._closed.is_set()
+
+    def read_line(self):
+        if self._closed.is_set():
+            return b''
+        if self._realtime:
+            wait = self._next_due - time.perf_counter()
+            if wait > self._timeout:
+                self._closed.wait(self._timeout)
+                return b''
+            if wait > 0:
+                # closing interrupts waiting
+                if self._closed.wait(wait):
+                    return b''
+            else:
+                self._lags_ms.append(-wait * 1000)
+            self._next_due += max(0., 1 + self._jitter * self._rng.standard_normal()) / self._rate_hz
+
+        values = self._next_values()
+        if values is None:
+            self.close()
+            return b''
+        # beginning of a line cut on the previous read comes glued to this one
+        prefix, self._cut = self._cut, b''
+        line = self._corrupt(format_line(values)) if self._rng.random() < self._corrupt_rate else format_line(values)
+        self._lines_sent += 1
+        if self._cut:
+            # nothing arrives until the next line
+            self._cut = prefix + self._cut
+            return b''
+        return prefix + line
+
+    def stats(self) -> SimulatedTransportStats:
+        lags = np.asarray(self._lags_ms) if self._lags_ms else np.zeros(1)
+        p50, p95 = np.percentile(lags, [50, 95])
+        return SimulatedTransportStats(self._lines_sent, self._corrupted_sent, float(p50), float(p95), float(lags.max()))
+
+    def _next_values(self):
+        if self._data is not None:
+            if self._index >= len(self._data):
+                if not self._loop or len(self._data) == 0:
+                    return None
+                self._index = 0
+            values = self._data[self._index]
+            self._index += 1
+            return values
+
+        # fixations at random gaze points joined by fast movements
+        t = self._lines_sent / self._rate_hz
+        if t >= self._fixation_end:
+            self._target = self._rng.uniform(-1, 1, 2)
+            self._fixation_end = t + self._rng.uniform(0.3, 1.5)
+        self._gaze += (self._target - self._gaze) * min(1., 25 / self._rate_hz)
+        return self._offsets + self._gains @ self._gaze + self._rng.normal(0, 3, NUM_VALUES)
+
+    def _corrupt(self, line: bytes) -> bytes:
+        self._corrupted_sent += 1
+        match self._CORRUPTIONS[self._rng.integers(len(self._CORRUPTIONS))]:
+            case 'cut':
+                # rest of the line is lost, the next line is read together with the beginning of this one
+                self._cut = line[:self._rng.integers(1, len(line) - 2)]
+                return b''
+            case 'garbage':
+                return self._rng.integers(0, 256, self._rng.integers(1, len(line))).astype(np.uint8).tobytes() + b'\n'
+            case 'values':
+                return line.replace(b'\t', b'', 1)
+            case _:
+                return b'\r\n'
+
+
+def open_transport(port_name: str, **simulation_options) -> GlassesTransport:
+    """Transport for port name, 'sim' and 'sim:<recording.hdf5>' are simulated devices, see SimulatedTransport"""
+    if port_name == SIMULATED_PORT:
+        return SimulatedTransport(**simulation_options)
+    if port_name.startswith(SIMULATED_PORT + ':'):
+        return SimulatedTransport(port_name[len(SIMULATED_PORT) + 1:], **simulation_options)
+    return SerialTransport(port_name)
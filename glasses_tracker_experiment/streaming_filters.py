@@ -0,0 +1,162 @@
+"""
+Stateful low-pass filters of glasses sensor values, applied sample by sample as lines come from the device.
+
+Filters process one sample (C,) or a block (N, C) of all channels at once, with cost independent of the filtered
+history length. Sample rate is passed with every call, as the reader estimates it from line arrival times.
+
+MovingAverageFilter - mean of the last `window_sec` seconds. Same response as the former per-sample FFT filter
+    (`low_pass_filter` in benchmarks/glasses_filter_benchmark.py, over a 0.1 s buffer with 5 Hz band limit it keeps
+    only the DC bin for sample rates above 10 Hz, i.e. returns the buffer mean): outputs match within 1e-9 relative
+    to the signal values.
+    -3 dB at 0.443 / window_sec (4.4 Hz for 0.1 s), zeros at multiples of 1 / window_sec.
+ButterworthFilter - cascade of second order sections, `order` and `cutoff_hz` configurable. Not equal to the moving
+    average: with the defaults (4.43 Hz, order 2) it has the same -3 dB frequency and 10-90% rise time, stronger
+    attenuation above 10 Hz and 4% overshoot on steps. Outputs agree with the moving average on fixations and differ
+    during fast eye movements: by up to 10% of the values range at a steady sample rate, up to 25% when the rate
+    estimate jitters (both filters then change their response). See benchmarks/glasses_filter_benchmark.py.
+"""
+import numpy as np
+from scipy import signal
+
+
+class StreamingFilter:
+    def process(self, sample: np.ndarray, sample_rate: float) -> np.ndarray:
+        """Filtered value of the new sample (C,)"""
+        raise NotImplementedError()
+
+    def process_block(self, samples: np.ndarray, sample_rate: float) -> np.ndarray:
+        """Filtered values of consecutive samples (N, C), same as processing them one by one"""
+        return np.array([self.process(sample, sample_rate) for sample in samples]).reshape(np.shape(samples))
+
+    def reset(self):
+        raise NotImplementedError()
+
+
+class MovingAverageFilter(StreamingFilter):
+    """
+    Mean of the last ceil(window_sec * sample_rate) samples (fewer at the start), kept as a running sum
+    over a ring buffer. The sum is recomputed once per buffer length to drop accumulated rounding errors.
+    """
+
+    def __init__(self, window_sec: float = 0.1) -> None:
+        self._window_sec = window_sec
+        self.reset()
+
+    def reset(self):
+        self._buffer: np.ndarray = None # (capacity, C) ring
+        self._start = 0
+        self._count = 0
+        self._sum: np.ndarray = None
+        self._updates = 0 # since the sum was recomputed
+
+    def window(self, sample_rate: float) -> int:
+        # same expression as the buffer length of the former filter, to keep the same windows
+        return int(np.ceil(self._window_sec * sample_rate))
+
+    def process(self, sample, sample_rate):
+        sample = np.asarray(sample, float)
+        window = self.window(sample_rate)
+        if self._buffer is None:
+            self._buffer = np.empty((max(window, 16), *sample.shape))
+            self._sum = np.zeros(sample.shape)
+        if self._count == len(self._buffer):
+            self._grow(2 * len(self._buffer))
+
+        self._buffer[(self._start + self._count) % len(self._buffer)] = sample
+        self._count += 1
+        self._sum += sample
+        while self._count > window:
+            self._sum -= self._buffer[self._start]
+            self._start = (self._start + 1) % len(self._buffer)
+            self._count -= 1
+
+        self._updates += 1
+        if self._updates >= len(self._buffer):
+            self._sum = self._samples().sum(axis=0)
+            self._updates = 0
+        return self._sum / self._count
+
+    def process_block(self, samples, sample_rate):
+        samples = np.asarray(samples, float)
+        if len(samples) == 0:
+            return samples.copy()
+        window = self.window(sample_rate)
+        history = self._samples() if self._buffer is not None else np.empty((0, *samples.shape[1:]))
+        values = np.concatenate([history, samples])
+        sums = np.concatenate([np.zeros((1, *samples.shape[1:])), np.cumsum(values, axis=0)])
+        ends = np.arange(len(history), len(values)) + 1
+        starts = np.maximum(ends - window, 0)
+        filtered = (sums[ends] - sums[starts]) / (ends - starts).reshape(-1, *[1] * (samples.ndim - 1))
+
+        kept = values[-min(window, len(values)):]
+        capacity = max(window, 16, len(self._buffer) if self._buffer is not None else 0)
+        self._buffer = np.empty((capacity, *samples.shape[1:]))
+        self._buffer[:len(kept)] = kept
+        self._start, self._count = 0, len(kept)
+        self._sum = kept.sum(axis=0)
+        self._updates = 0
+        return filtered
+
+    def _samples(self):
+        return self._buffer[(self._start + np.arange(self._count)) % len(self._buffer)]
+
+    def _grow(self, capacity):
+        buffer = np.empty((capacity, *self._buffer.shape[1:]))
+        buffer[:self._count] = self._samples()
+        self._buffer, self._start = buffer, 0
+
+
+class ButterworthFilter(StreamingFilter):
+    """
+    Butterworth low-pass as second order sections in transposed direct form II, state (sections, 2, C).
+    Coefficients are redesigned when sample rate changes by more than `rate_tolerance`, the state is kept,
+    so jitter of the rate estimate doesn't cause a redesign per sample.
+    The state is initialized with the first sample as a steady state, so the output starts from it without a transient.
+    """
+
+    def __init__(self, cutoff_hz: float = 4.43, order: int = 2, rate_tolerance: float = 0.25) -> None:
+        self._cutoff_hz = cutoff_hz
+        self._order = order
+        self._rate_tolerance = rate_tolerance
+        self._sample_rate = None
+        self._sos: np.ndarray = None
+        self.reset()
+
+    def reset(self):
+        self._state: np.ndarray = None
+
+    def sos(self, sample_rate: float) -> np.ndarray:
+        if self._sample_rate is None or abs(sample_rate - self._sample_rate) > self._rate_tolerance * self._sample_rate:
+            # cutoff has to stay below Nyquist frequency
+            cutoff_hz = min(self._cutoff_hz, 0.45 * sample_rate)
+            self._sos = signal.butter(self._order, cutoff_hz, fs=sample_rate, output='sos')
+            self._sections = [tuple(map(float, section)) for section in self._sos]
+            self._sample_rate = sample_rate
+        return self._sos
+
+    def process(self, sample, sample_rate):
+        x = np.asarray(sample, float)
+        self.sos(sample_rate)
+        if self._state is None:
+            self._init_state(x)
+        state = self._state
+        for ind, (b0, b1, b2, _, a1, a2) in enumerate(self._sections):
+            y = b0 * x + state[ind, 0]
+            state[ind, 0] = b1 * x - a1 * y + state[ind, 1]
+            state[ind, 1] = b2 * x - a2 * y
+            x = y
+        return x
+
+    def process_block(self, samples, sample_rate):
+        samples = np.asarray(samples, float)
+        if len(samples) == 0:
+            return samples.copy()
+        sos = self.sos(sample_rate)
+        if self._state is None:
+            self._init_state(samples[0])
+        filtered, self._state = signal.sosfilt(sos, samples, axis=0, zi=self._state)
+        return filtered
+
+    def _init_state(self, first_sample: np.ndarray):
+        zi = signal.sosfilt_zi(self._sos) # (sections, 2) for unit input
+        self._state = zi.reshape(*zi.shape, *[1] * first_sample.ndim) * first_sample
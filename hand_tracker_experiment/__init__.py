@@ -8,13 +8,19 @@ from experiments_common.grid_commands_generator import GridCommandsGenerator, Gr
 from hand_tracker_experiment.aruco_markers_detector import ArucoMarkersDetector
 from hand_tracker_experiment.hand_data_saver import HandDataSaver
 from hand_tracker_experiment.ui_HandTrackerExperiment import Ui_HandTrackerExperiment
-from utils.camera_source import CameraSource, convert_cv_qimage, convert_qimage_cv, convert_qpixmap_cv
+from utils.camera_source import CameraSource, convert_cv_qimage, convert_qimage_cv, convert_qpixmap_cv, convert_qvideoframe_rgb, convert_rgb_qimage, FrameBuffer
 from forms.configure_experiment_widget import ConfigureExperimentWidget
 from utils.experiment_configs_model import CurrentConfig
 from forms.experiment_control_widget import ExperimentControlWidget
-from utils.threading import Worker
+from utils.threading import LatestFrameProcessor
+from utils.tracing import FrameTracer, LatencyOverlay
+from utils.roi_tracker import RoiTracker
+from utils.video_recorder import session_video_path
 from .draw_hand_landmarks import draw_landmarks_on_image
-from dataclasses import dataclass
+from .hand_scanner import HandScanner, HandScanResults
+from dataclasses import dataclass, replace
+from types import SimpleNamespace
+from experiments_common.landmark_backends import LandmarkBackend, LandmarkResult, MediapipeLandmarkBackend, landmark_objects
 
 import mediapipe as mp
 from mediapipe.tasks import python
@@ -27,50 +33,32 @@ from PyQt6.QtGui import QPixmap, QImage, QPalette, QColor
 from pathlib import Path
 
 
-
-FINGERS_TIPS = {
-  'THUMB': 4,
-  'INDEX': 8,
-  'MIDDLE': 12,
-  'RING': 16,
-  'PINKY': 20
-}
-
-@dataclass(frozen=True)
-class HandScanResults:
-    detection_results : object
-    finger_tip: np.ndarray
-    raw_image: np.ndarray
-    hand_visible: bool
-
-
 class HandTrackerExperiment(QWidget):
     window_closing = pyqtSignal(CurrentConfig)
     def __init__(self,  camera_source: CameraSource, cached_config: CurrentConfig, parent=None) -> None:
         super().__init__(parent)
         self.setup_ui()
 
-        base_options = python.BaseOptions(model_asset_path=str(Path(__file__).parent / 'hand_landmarker.task'))
-        from mediapipe.tasks.python.vision.core import vision_task_running_mode
-        run_video_mode = vision_task_running_mode.VisionTaskRunningMode.VIDEO
-        options = vision.HandLandmarkerOptions(base_options=base_options,
-                                            num_hands=1, running_mode=run_video_mode)
-        self.detector = vision.HandLandmarker.create_from_options(options)
+        # hand is searched in region of previous detection, pass roi_tracker=None to always process the full frame
+        self.hand_scanner = HandScanner(MediapipeLandmarkBackend('hand', video_mode=False), RoiTracker())
 
         self.camera_source = camera_source
         self._closing = False
         self._show_captured_image_only = False
         self._captured_image = None
-        self.worker: Worker = None
         self._hand_scan_results: HandScanResults = None
         self._making_command = False
+        self._tracer = FrameTracer()
+        # frames are processed in one persistent thread, newest captured frame replaces not yet processed one
+        self._frame_processor = LatestFrameProcessor(self.do_scan, self._release_frame, self)
+        self._frame_processor.result.connect(self._after_scan)
+        self._frame_processor.start()
+        self._latency_overlay = LatencyOverlay(self._tracer, self._ui.default_image, self._frame_processor.counters)
 
         self._commands_index = 0
         self._commands_controller = GridCommandsController()
         
         self._data_saver:HandDataSaver = None
-        self.thread_pool = QThreadPool()
-
         self._aruco_detector = ArucoMarkersDetector()
 
         self._drawer = GridExperimentDrawer()
@@ -112,8 +100,8 @@ class HandTrackerExperiment(QWidget):
         self.try_update_captured_image_timer.setSingleShot(True)
         self._update_captured_image()
 
-    def _create_commands_generator(self, n_commands=0):
-        return GridCommandsGenerator(n_commands, offset_b=0.3, offset_r=0.3)
+    def _create_commands_generator(self, n_commands=0, rows=3, cols=3):
+        return GridCommandsGenerator(n_commands, offset_b=0.3, offset_r=0.3, rows=rows, cols=cols)
 
     def setup_ui(self):
         self._ui = Ui_HandTrackerExperiment()
@@ -172,45 +160,27 @@ class HandTrackerExperiment(QWidget):
     @pyqtSlot(QVideoFrame, int)
     def _process_frame_image(self, frame: QVideoFrame, timestamp: int):
         if self._closing: return
-        if self.worker is not None:
-            if not self.worker.is_finished:
-                return
-        img = frame.toImage()
-        frame = convert_qimage_cv(img)
-        
-        self.worker = Worker(self.do_scan, frame, timestamp)
-        self.worker.signals.result.connect(self._after_scan)
-        self.thread_pool.start(self.worker)
-
-    def do_scan(self, frame: np.ndarray, timestamp: int):
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        detection_result = self.detector.detect_for_video(
-            mp.Image(mp.ImageFormat.SRGB, frame_rgb), timestamp)
-        if len(detection_result.hand_landmarks):
-            height, width, _ = frame.shape
-            for i in range(len(detection_result.hand_landmarks)):
-                landmark = detection_result.hand_landmarks[i][FINGERS_TIPS['INDEX']]
-                # landmark_world = detection_result.hand_world_landmarks[i][FINGERS_TIPS['INDEX']]
-                # print(landmark_world.z)
-                x, y = landmark.x * width, landmark.y * height
-                
-                
-                hand_scan_results = HandScanResults(detection_result,
-                                                         (x, y),
-                                                         frame,
-                                                         True)
-                break
-            else:
-                # print('else failure')
-                hand_scan_results = HandScanResults(None, None, frame, False)
-        else:
-            hand_scan_results = HandScanResults(None, None, frame, False)
+        frame_id = self.camera_source.frame_index()
+        self._tracer.begin_frame(frame_id, self.camera_source.captured_ns())
+        # buffer is reused by next frames after the image is displayed in _after_scan or the frame is dropped
+        frame_buffer = self.camera_source.frame_pool().acquire_for_frame(frame)
+        self._frame_processor.submit(frame_buffer, frame, timestamp, frame_id)
+
+    def _release_frame(self, frame_args: tuple):
+        frame_args[0].release()
+    
+    def do_scan(self, frame_buffer: FrameBuffer, video_frame: QVideoFrame, timestamp: int, frame_id: int):
+        frame = convert_qvideoframe_rgb(video_frame, frame_buffer.array)
+        self._tracer.mark(frame_id, 'convert')
+        hand_scan_results = self.hand_scanner.process(frame, timestamp)
+        self._tracer.mark(frame_id, 'detect')
         # print(hand_scan_results)
             # print('not found')
         return hand_scan_results
         
         
-    def _after_scan(self, hand_scan_results: HandScanResults):
+    def _after_scan(self, hand_scan_results: HandScanResults, frame_args: tuple):
+        frame_buffer, _, timestamp, frame_id = frame_args
         frame = hand_scan_results.raw_image
         
 
@@ -228,7 +198,9 @@ class HandTrackerExperiment(QWidget):
             finger_tip_pos = None
 
         if hand_scan_results.hand_visible and not self._show_captured_image_only:
-            frame = draw_landmarks_on_image(frame, hand_scan_results.detection_results)
+            drawn_landmarks = SimpleNamespace(hand_landmarks=[landmark_objects(hand_scan_results.detection_results.landmarks)],
+                                              handedness=[None])
+            frame = draw_landmarks_on_image(frame, drawn_landmarks, copy=False)
             cursor_pix = QPointF(hand_scan_results.finger_tip[0], hand_scan_results.finger_tip[1])
             self._commands_controller.set_cursor_center(cursor_pix)
             best_match_command = self._commands_controller.best_match_command(cursor_pix)
@@ -252,13 +224,16 @@ class HandTrackerExperiment(QWidget):
             best_match_command = None
             best_match_command_code = None
             best_match_command_pos = None
+        self._tracer.mark(frame_id, 'cursor')
 
         if not self._show_captured_image_only:
-            self._drawer.set_base_image(convert_cv_qimage(frame))
+            self._drawer.set_base_image(convert_rgb_qimage(frame))
+        frame_buffer.release()
+        self._tracer.mark(frame_id, 'draw')
 
         if hand_scan_results.hand_visible:
-            landmarks = [(landmark.x, landmark.y, landmark.z) for landmark in hand_scan_results.detection_results.hand_landmarks[0]]
-            world_landmarks = [(landmark.x, landmark.y, landmark.z) for landmark in hand_scan_results.detection_results.hand_world_landmarks[0]]
+            landmarks = hand_scan_results.detection_results.landmarks
+            world_landmarks = hand_scan_results.detection_results.world_landmarks
         else:
             landmarks = None
             world_landmarks = None
@@ -283,11 +258,14 @@ class HandTrackerExperiment(QWidget):
 
         if self._making_command:
             if self._data_saver is not None and self._data_saver.is_writing_person_data():
+                self._tracer.mark(frame_id, 'append')
                 self._data_saver.append_data(command_ind, command_code, target_rel, target_pix,
                                             best_match_command_code, best_match_command_pos,
                                             finger_tip_pos,
                                             landmarks, world_landmarks,
-                                            hand_scan_results.hand_visible)
+                                            hand_scan_results.hand_visible,
+                                            self._tracer.frame_latency_ms(frame_id),
+                                            timestamp)
 
 
     @pyqtSlot(CurrentConfig)
@@ -301,13 +279,17 @@ class HandTrackerExperiment(QWidget):
         self._drawer.showFullScreen()
         self._drawer.activateWindow()
 
-        self._commands_controller.set_grid_commands_generator(self._create_commands_generator(experiment_config.num_commands))
+        self._commands_controller.set_grid_commands_generator(self._create_commands_generator(experiment_config.num_commands,
+                                                                                              experiment_config.grid_rows,
+                                                                                              experiment_config.grid_cols))
 
         print(self._commands_controller.grid_commands_generator()._commands)
 
         target_size_pix = self._drawer.drawing_surface_size()
         view_size = self._drawer.view_size()
-        self._data_saver = HandDataSaver(experiment_config.save_path)
+        self._data_saver = HandDataSaver(experiment_config.save_path,
+                                         frame_latency_spans=len(self._tracer.spans()) - 1 if experiment_config.save_frame_latency else 0,
+                                         save_frame_timestamps=experiment_config.record_video)
         self._data_saver.create_person_dataset(self.camera_source.name(),
                                               experiment_config.person_name,
                                               experiment_config.test_id,
@@ -320,7 +302,11 @@ class HandTrackerExperiment(QWidget):
                                               view_size.height(),
                                               convert_qimage_cv(self._captured_image),
                                               self._aruco_detector.markers())
-        
+        self._data_saver.append_attrs(grid_rows=experiment_config.grid_rows, grid_cols=experiment_config.grid_cols,
+                                      roi_tracking=self.hand_scanner.roi_tracker is not None)
+        if experiment_config.record_video and isinstance(self.camera_source, CameraSource):
+            self.camera_source.start_recording(session_video_path(experiment_config.save_path, self._data_saver.record_name()))
+
 
     @pyqtSlot(int, int)
     def _progress_experiment(self, command_ind, max_commands):
@@ -347,11 +333,14 @@ class HandTrackerExperiment(QWidget):
             self.mb.addButton(QMessageBox.StandardButton.No)
             self.mb.setDefaultButton(QMessageBox.StandardButton.No)
             if self.mb.exec() == QMessageBox.StandardButton.Yes:
-                self._data_saver.stop_save(True)
+                self._stop_recording(True)
+                self._data_saver.stop_save(True, self._experiment_controller.command_onsets())
             else:
+                self._stop_recording(False)
                 self._data_saver.delete_current_record()
         else:
-            self._data_saver.stop_save(early_stop)
+            self._stop_recording(True)
+            self._data_saver.stop_save(early_stop, self._experiment_controller.command_onsets())
             self.mb = QMessageBox()
             self.mb.setIcon(QMessageBox.Icon.Information)
             self.mb.setWindowTitle('Готово')
@@ -359,6 +348,15 @@ class HandTrackerExperiment(QWidget):
             self.mb.exec()
         
 
+    def _stop_recording(self, save: bool):
+        recording = self.camera_source.stop_recording() if isinstance(self.camera_source, CameraSource) else None
+        if recording is None:
+            return
+        if save:
+            self._data_saver.save_video_recording(recording)
+        else:
+            recording.remove()
+
     def closeEvent(self, a0) -> None:
         self.disconnect(self.camera_connection)
         self._closing = True
@@ -368,6 +366,6 @@ class HandTrackerExperiment(QWidget):
         
         self._drawer.close()
         
-        self.thread_pool.waitForDone()
+        self._frame_processor.stop()
         self.window_closing.emit(self._ui.controls._ui.configs.experiment_config())
         return super().closeEvent(a0)
\ No newline at end of file
@@ -9,10 +9,11 @@ FONT_SIZE = 1
 FONT_THICKNESS = 1
 HANDEDNESS_TEXT_COLOR = (88, 205, 54) # vibrant green
 
-def draw_landmarks_on_image(rgb_image, detection_result):
+def draw_landmarks_on_image(rgb_image, detection_result, copy=True):
   hand_landmarks_list = detection_result.hand_landmarks
   handedness_list = detection_result.handedness
-  annotated_image = np.copy(rgb_image)
+  # with copy=False landmarks are drawn in place, e.g. on pooled frame buffer
+  annotated_image = np.copy(rgb_image) if copy else rgb_image
 
   # Loop through the detected hands to visualize.
   for idx in range(len(hand_landmarks_list)):
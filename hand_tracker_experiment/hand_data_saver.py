@@ -1,5 +1,6 @@
 from typing import List
-from experiments_common.data_saver import DataSaver, Field
+from experiments_common.data_saver import DataSaver, Field, DEFAULT_FIELD_STORAGE
+from dataclasses import replace
 import numpy as np
 import h5py
 
@@ -7,8 +8,15 @@ from hand_tracker_experiment.aruco_markers_detector import ArucoMarker
 
 
 class HandDataSaver(DataSaver):
-    def __init__(self, save_file) -> None:
+    def __init__(self, save_file, landmarks_as_float32: bool = True, frame_latency_spans: int = 0,
+                 save_frame_timestamps: bool = False) -> None:
         super().__init__(save_file, 'hand')
+        # number of per-frame latencies (see utils.tracing.FrameTracer.frame_latency_ms), not saved if 0
+        self._frame_latency_spans = frame_latency_spans
+        # timestamp_ms of the camera frame of each record, joins records with recorded video frames
+        self._save_frame_timestamps = save_frame_timestamps
+        # mediapipe returns landmarks in float32, so no precision is lost
+        self._landmarks_storage = replace(DEFAULT_FIELD_STORAGE, store_dtype=np.float32 if landmarks_as_float32 else None)
 
     def create_person_dataset(self, camera_name, person_name: str, person_test_id: str, show_cursor: bool, num_commands: int, sec_per_command: float, 
                               target_form_width: int, target_form_height: int,
@@ -26,7 +34,7 @@ class HandDataSaver(DataSaver):
                                       )
         markers_descriptions = [marker.to_json() for marker in markers]
         self.append_attrs(camera_name=camera_name, markers=markers_descriptions)
-        self.save_dataset('preview_image', preview_image, np.uint8)
+        self.save_dataset('preview_image', preview_image, np.uint8, compression='gzip')
                                 
     
     def _save_fields(self) -> List[Field]:
@@ -38,19 +46,28 @@ class HandDataSaver(DataSaver):
             Field('best_match_command_code', (1,), 'i8', -1),
             Field('best_match_command_pix', (2,), float),
             Field('finger_tip_pix', (2,), float),
-            Field('hand_landmarks', (21, 3), float),
-            Field('hand_world_landmarks', (21, 3), float),
+            Field('hand_landmarks', (21, 3), float, storage=self._landmarks_storage),
+            Field('hand_world_landmarks', (21, 3), float, storage=self._landmarks_storage),
             Field('hand_visible', (1,), 'i8')
         ]
+        if self._frame_latency_spans > 0:
+            fields.append(Field('frame_latency_ms', (self._frame_latency_spans,), np.float32))
+        if self._save_frame_timestamps:
+            fields.append(Field('frame_timestamp_ms', (1,), 'i8', -1))
         return fields
 
     def append_data(self, command_ind, command_code, target_rel, target_pix, 
                     best_match_command_code, best_match_command_pix,
                     finger_tip_pos,
                     hand_lanmarks, hand_world_landmarks,
-                    hand_visible):
-        self._append_data(command_ind, command_code, target_rel, target_pix,
-                          best_match_command_code, best_match_command_pix,
-                          finger_tip_pos,
-                          hand_lanmarks, hand_world_landmarks,
-                          1 if hand_visible else 0)
\ No newline at end of file
+                    hand_visible, frame_latency_ms=None, frame_timestamp_ms=None):
+        args = [command_ind, command_code, target_rel, target_pix,
+                best_match_command_code, best_match_command_pix,
+                finger_tip_pos,
+                hand_lanmarks, hand_world_landmarks,
+                1 if hand_visible else 0]
+        if self._frame_latency_spans > 0:
+            args.append(frame_latency_ms)
+        if self._save_frame_timestamps:
+            args.append(frame_timestamp_ms)
+        self._append_data(*args)
\ No newline at end of file
@@ -0,0 +1,48 @@
+from dataclasses import dataclass, replace
+import numpy as np
+
+from experiments_common.landmark_backends import LandmarkBackend, LandmarkResult, MediapipeLandmarkBackend, create_seed_backend
+from utils.roi_tracker import RoiTracker
+
+
+FINGERS_TIPS = {
+  'THUMB': 4,
+  'INDEX': 8,
+  'MIDDLE': 12,
+  'RING': 16,
+  'PINKY': 20
+}
+
+@dataclass(frozen=True)
+class HandScanResults:
+    detection_results : LandmarkResult # landmarks normalized to the frame
+    finger_tip: np.ndarray
+    raw_image: np.ndarray
+    hand_visible: bool
+
+
+class HandScanner:
+    def __init__(self, detector: LandmarkBackend|None = None, roi_tracker: RoiTracker|None = None) -> None:
+        # mediapipe tracking between video frames doesn't work with moving crops, so crops are detected as images
+        self.detector = MediapipeLandmarkBackend('hand', video_mode=roi_tracker is None) if detector is None else detector
+        # hand is searched in region of previous detection, None to always process the full frame
+        self.roi_tracker = roi_tracker
+        # landmark-only detectors get crops, full frames are processed by detector with palm detection
+        self.seed_detector = create_seed_backend(self.detector, roi_tracker)
+
+    def process(self, frame: np.ndarray, timestamp: int) -> HandScanResults:
+        # frame is RGB, as mediapipe expects
+        crop = None if self.roi_tracker is None else self.roi_tracker.crop(frame, timestamp)
+        detector = self.seed_detector if self.seed_detector is not None and crop.is_full_frame() else self.detector
+        detection_result = detector.detect(frame if crop is None else crop.image, timestamp)
+        if crop is not None and detection_result.found():
+            # landmarks are normalized to the crop, saved and drawn landmarks are normalized to the frame
+            detection_result = replace(detection_result, landmarks=crop.to_frame_normalized(detection_result.landmarks))
+        if crop is not None:
+            self.roi_tracker.update(crop, detection_result.landmarks, timestamp)
+        if detection_result.found():
+            height, width, _ = frame.shape
+            landmark = detection_result.landmarks[FINGERS_TIPS['INDEX']]
+            x, y = landmark[0] * width, landmark[1] * height
+            return HandScanResults(detection_result, (x, y), frame, True)
+        return HandScanResults(None, None, frame, False)
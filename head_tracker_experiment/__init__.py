@@ -4,16 +4,17 @@ from experiments_common.grid_commands_controller import GridCommandsController
 from experiments_common.grid_experiment_drawer import GridExperimentDrawer
 from experiments_common.grid_commands_generator import GridCommandsGenerator
 from head_tracker_experiment.head_data_saver import HeadDataSaver
-from core.virtual_camera import VirtualCamera
 
 from .processing.head_scanner import HeadScanResults, HeadScanner
-from utils.threading import Worker
+from utils.threading import LatestFrameProcessor
+from utils.tracing import FrameTracer, LatencyOverlay
+from utils.roi_tracker import RoiTracker
+from utils.video_recorder import session_video_path
 from .commands_drawer import CommandsDrawer
 from .ui_HeadTrackerExperiment import Ui_HeadTrackerExperiment
-from core.scene import Scene
-from .head_model import HeadModel
+from .head_scene import HeadScene
 from obj_models import LabStend
-from utils.camera_source import CameraSource, convert_qpixmap_cv, convert_cv_qpixmap, convert_qimage_cv, convert_cv_qimage
+from utils.camera_source import CameraSource, convert_qpixmap_cv, convert_cv_qpixmap, convert_qimage_cv, convert_cv_qimage, convert_qvideoframe_rgb, convert_rgb_qimage, FrameBuffer
 from utils.experiment_configs_model import CurrentConfig
 from PyQt6.QtGui import QImage, QPixmap, QPalette, QColor
 from PyQt6.QtCore import pyqtSlot, pyqtSignal, QTimer, QThreadPool, Qt, QPointF, QSize
@@ -70,14 +71,12 @@ class HeadTrackerExperiment(QWidget):
         self._making_command = False
         
         self._data_saver:HeadDataSaver = None
-        self.thread_pool = QThreadPool()
-
         self._commands_controller = GridCommandsController()
 
         self.setup_scene()
         self._ui.controls.set_config(cached_config)
         self.camera_source = camera_source
-        self.head_scanner = HeadScanner(True)
+        self.head_scanner = HeadScanner(True, RoiTracker())
 
         self._ui.controls.started.connect(self._start_experiment)
         self._ui.controls.finished.connect(self._stop_experiment)
@@ -86,10 +85,13 @@ class HeadTrackerExperiment(QWidget):
 
         self._closing = False
         self._data_saver = None
-        self.worker: Worker = None
         self._scan_results: HeadScanResults = None
-
-        self.thread_pool = QThreadPool()
+        self._tracer = FrameTracer()
+        # frames are processed in one persistent thread, newest captured frame replaces not yet processed one
+        self._frame_processor = LatestFrameProcessor(self.do_scan, self._release_frame, self)
+        self._frame_processor.result.connect(self._after_scan)
+        self._frame_processor.start()
+        self._latency_overlay = LatencyOverlay(self._tracer, self._ui.video_widget, self._frame_processor.counters)
 
         self._drawer = GridExperimentDrawer()
         self._drawer.resize(800, 600)    
@@ -110,8 +112,8 @@ class HeadTrackerExperiment(QWidget):
 
         self._show_cursor_toggled(cached_config.show_cursor)
 
-    def _create_commands_generator(self, n_commands=0):
-        return GridCommandsGenerator(n_commands)
+    def _create_commands_generator(self, n_commands=0, rows=3, cols=3):
+        return GridCommandsGenerator(n_commands, rows=rows, cols=cols)
 
     def _show_cursor_toggled(self, do_show):
         self._show_cursor = do_show
@@ -131,11 +133,15 @@ class HeadTrackerExperiment(QWidget):
         self._drawer.showFullScreen()
         self._drawer.activateWindow()
 
-        self._commands_controller.set_grid_commands_generator(self._create_commands_generator(experiment_config.num_commands))
+        self._commands_controller.set_grid_commands_generator(self._create_commands_generator(experiment_config.num_commands,
+                                                                                              experiment_config.grid_rows,
+                                                                                              experiment_config.grid_cols))
         
         target_size_pix = self._drawer.drawing_surface_size()
         view_size = self._drawer.view_size()
-        self._data_saver = HeadDataSaver(experiment_config.save_path)
+        self._data_saver = HeadDataSaver(experiment_config.save_path,
+                                         len(self._tracer.spans()) - 1 if experiment_config.save_frame_latency else 0,
+                                         experiment_config.record_video)
         self._data_saver.create_person_dataset(self.camera_source.name(),
                                                experiment_config.person_name,
                                               experiment_config.test_id,
@@ -147,6 +153,10 @@ class HeadTrackerExperiment(QWidget):
                                               view_size.width(),
                                               view_size.height()
                                               )
+        self._data_saver.append_attrs(grid_rows=experiment_config.grid_rows, grid_cols=experiment_config.grid_cols,
+                                      roi_tracking=self.head_scanner.roi_tracker is not None)
+        if experiment_config.record_video and isinstance(self.camera_source, CameraSource):
+            self.camera_source.start_recording(session_video_path(experiment_config.save_path, self._data_saver.record_name()))
         self._making_command = False
         
 
@@ -166,17 +176,29 @@ class HeadTrackerExperiment(QWidget):
             self.mb.addButton(QMessageBox.StandardButton.No)
             self.mb.setDefaultButton(QMessageBox.StandardButton.No)
             if self.mb.exec() == QMessageBox.StandardButton.Yes:
-                self._data_saver.stop_save(True)
+                self._stop_recording(True)
+                self._data_saver.stop_save(True, self._experiment_controller.command_onsets())
             else:
+                self._stop_recording(False)
                 self._data_saver.delete_current_record()
         else:
-            self._data_saver.stop_save(early_stop)
+            self._stop_recording(True)
+            self._data_saver.stop_save(early_stop, self._experiment_controller.command_onsets())
             self.mb = QMessageBox()
             self.mb.setIcon(QMessageBox.Icon.Information)
             self.mb.setWindowTitle('Готово')
             self.mb.setText(f'Эксперимент завершен\n{self._experiment_controller.num_commands_executed_successfully()}/{self._ui.controls.current_experiment_config().num_commands}')
             self.mb.exec()
 
+    def _stop_recording(self, save: bool):
+        recording = self.camera_source.stop_recording() if isinstance(self.camera_source, CameraSource) else None
+        if recording is None:
+            return
+        if save:
+            self._data_saver.save_video_recording(recording)
+        else:
+            recording.remove()
+
     @pyqtSlot(int, int)
     def _progress_experiment(self, command_ind, max_commands):
         self._making_command = True
@@ -186,73 +208,50 @@ class HeadTrackerExperiment(QWidget):
         self._experiment_controller.update_recording_command(com.code if com is not None else None)
 
     def setup_scene(self):
-        self.lab_stend = LabStend()
-        self.lab_stend.transform.move(-self.lab_stend.transform.get_up()*0.2)# + self.lab_stend.transform.get_right()*0.2)
-        self.head_model = HeadModel()
-        
-        self.virtual_camera = VirtualCamera()
-        self.virtual_camera.transform.set_position(self.virtual_camera.transform.get_up()*0.0915 + \
-                                                self.virtual_camera.transform.get_forward() * (-0.05) )
-        self.virtual_camera.transform.rotate(self.virtual_camera.transform.get_up(), 180)
-        print('self.virtual_camera.transform.get_forward(True)', self.virtual_camera.transform.get_forward(True))
-
-        self.virtual_camera.bind_node(self.head_model)
-
-        self.scene = Scene()
-        self.scene.bind_node(self.lab_stend)
-        self.scene.bind_node(self.virtual_camera)
+        self.head_scene = HeadScene()
 
     @pyqtSlot(QVideoFrame, int)
-    def _process_frame_image(self, frame: QVideoFrame, timestamp):
+    def _process_frame_image(self, frame: QVideoFrame, timestamp: int):
         if self._closing: return
-        if self.worker is not None:
-            if not self.worker.is_finished:
-                return
-        img = frame.toImage()
-        frame = cv2.cvtColor(convert_qimage_cv(img), cv2.COLOR_RGBA2RGB)
-        self.worker = Worker(self.do_scan, frame, timestamp)
-        self.worker.signals.result.connect(self._after_scan)
-        self.thread_pool.start(self.worker)
+        frame_id = self.camera_source.frame_index()
+        self._tracer.begin_frame(frame_id, self.camera_source.captured_ns())
+        # buffer is reused by next frames after the image is displayed in _after_scan or the frame is dropped
+        frame_buffer = self.camera_source.frame_pool().acquire_for_frame(frame)
+        self._frame_processor.submit(frame_buffer, frame, timestamp, frame_id)
+
+    def _release_frame(self, frame_args: tuple):
+        frame_args[0].release()
     
-    def do_scan(self, cv_image, timestamp):
-        scan_results = self.head_scanner.process(cv_image, timestamp)
+    def do_scan(self, frame_buffer: FrameBuffer, frame: QVideoFrame, timestamp: int, frame_id: int):
+        cv_image = convert_qvideoframe_rgb(frame, frame_buffer.array)
+        self._tracer.mark(frame_id, 'convert')
+        scan_results = self.head_scanner.process(cv_image, timestamp, True)
+        self._tracer.mark(frame_id, 'detect')
         return scan_results
 
-    def _after_scan(self, scan_results: HeadScanResults):
-        qimage = convert_cv_qimage(scan_results.processed_image)
+    def _after_scan(self, scan_results: HeadScanResults, frame_args: tuple):
+        frame_buffer, _, timestamp, frame_id = frame_args
+        qimage = convert_rgb_qimage(scan_results.processed_image)
         self._ui.video_widget.set_image_to_videowidget(qimage)
+        frame_buffer.release()
 
-        if scan_results.head_visible:
-            try:
-                self.head_model._update_transform_matrix(scan_results.head2cam_transform_mat)
-            except Exception as e:
-                print(scan_results.head2cam_transform_mat)
-                raise e
-        else:
-            self.head_model._update_head_not_visible()
+        self.head_scene.update_head(scan_results.head2cam_transform_mat if scan_results.head_visible else None)
         
         if scan_results.head_visible:
-            head_matrix = self.head_model.transform.get_matrix(True)
-            cast_result = self.scene.cast_rays_from_origin(self.head_model.transform.get_position(True), 
-                                            [self.head_model.transform.get_forward(True)])
-            if len(cast_result.nodes) == 1 and cast_result.nodes[0] == self.lab_stend:
-                intersection_3d = cast_result.points_3d[0]
-            else:
-                intersection_3d = None
+            head_matrix = self.head_scene.head_matrix()
+            intersection_3d = self.head_scene.screen_intersection()
         else:
             head_matrix = None
             intersection_3d = None
+        self._tracer.mark(frame_id, 'cursor')
             
         size = self._drawer.drawing_surface_size()
         width_pix, height_pix = size.width(), size.height()
-        vertices = self.lab_stend.screen_vertices
         command_ind, target_command = self._commands_controller.grid_commands_generator().current_target()
         if target_command is not None:
             command_code = target_command.code
             x, y = target_rel = target_command.x_rel, target_command.y_rel
-            hor = vertices['ru'] - vertices['lu']
-            vert = vertices['lb'] - vertices['lu']
-            target_3d = vertices['lu'] + x * hor + y * vert
+            target_3d = self.head_scene.screen_point(x, y)
             px, py = target_command.x_rel * width_pix, target_command.y_rel * height_pix
             target_pix = [px, py]
         else:
@@ -263,12 +262,7 @@ class HeadTrackerExperiment(QWidget):
             
 
         if intersection_3d is not None:
-            hit_vec = intersection_3d - vertices['lu']
-            hor_vec = vertices['ru'] - vertices['lu']
-            vert_vec = vertices['lb'] - vertices['lu']
-            x = hor_vec @ hit_vec / np.dot(hor_vec, hor_vec)
-            y = vert_vec @ hit_vec / np.dot(vert_vec, vert_vec)
-            px, py = x * width_pix, y * height_pix
+            px, py = self.head_scene.screen_position(intersection_3d, width_pix, height_pix)
             
             intersetion_pix = [px, py]
             if self._show_cursor:
@@ -287,10 +281,12 @@ class HeadTrackerExperiment(QWidget):
             best_match_command = None
             best_match_command_code = None
             best_match_command_pos = None
+        self._tracer.mark(frame_id, 'draw')
 
         if self._making_command:
             if self._data_saver is not None and self._data_saver.is_writing_person_data():
                 # print(command_code)
+                self._tracer.mark(frame_id, 'append')
                 self._data_saver.append_data(command_ind,
                                             command_code,
                                             target_rel,
@@ -301,7 +297,9 @@ class HeadTrackerExperiment(QWidget):
                                             intersetion_pix,
                                             intersection_3d,
                                             head_matrix,
-                                            scan_results.head_visible)
+                                            scan_results.head_visible,
+                                            self._tracer.frame_latency_ms(frame_id),
+                                            timestamp)
         
     def closeEvent(self, a0) -> None:
         self.disconnect(self.camera_connection)
@@ -311,6 +309,6 @@ class HeadTrackerExperiment(QWidget):
             self._stop_experiment(True)
         
         self._drawer.close()
-        self.thread_pool.waitForDone()
+        self._frame_processor.stop()
         self.window_closing.emit(self._ui.controls._ui.configs.experiment_config())
         return super().closeEvent(a0)
\ No newline at end of file
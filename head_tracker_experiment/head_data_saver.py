@@ -1,10 +1,15 @@
 from typing import List
 from experiments_common.data_saver import DataSaver, Field
+import numpy as np
 
 
 class HeadDataSaver(DataSaver):
-    def __init__(self, save_file) -> None:
+    def __init__(self, save_file, frame_latency_spans: int = 0, save_frame_timestamps: bool = False) -> None:
         super().__init__(save_file, 'head')
+        # number of per-frame latencies (see utils.tracing.FrameTracer.frame_latency_ms), not saved if 0
+        self._frame_latency_spans = frame_latency_spans
+        # timestamp_ms of the camera frame of each record, joins records with recorded video frames
+        self._save_frame_timestamps = save_frame_timestamps
 
     def create_person_dataset(self, camera_name, person_name: str, person_test_id: str, show_cursor: bool, num_commands: int, sec_per_command: float, 
                               target_form_width: int, target_form_height: int,
@@ -29,16 +34,25 @@ class HeadDataSaver(DataSaver):
             Field('head_transform', (4, 4), float),
             Field('head_visible', (1,), 'i8')
         ]
+        if self._frame_latency_spans > 0:
+            fields.append(Field('frame_latency_ms', (self._frame_latency_spans,), np.float32))
+        if self._save_frame_timestamps:
+            fields.append(Field('frame_timestamp_ms', (1,), 'i8', -1))
         return fields
 
     def append_data(self, command_ind, command_code, target_rel, target_pix, target_3d, 
                     best_match_command_code, best_match_command_pix,
                     intersetion_pix, intersection_3d, head_transform,
-                    head_visible):
-        self._append_data(command_ind, command_code, target_rel, target_pix, target_3d, 
-                          best_match_command_code, best_match_command_pix,
-                          intersetion_pix, intersection_3d, head_transform,
-                          1 if head_visible else 0)
+                    head_visible, frame_latency_ms=None, frame_timestamp_ms=None):
+        args = [command_ind, command_code, target_rel, target_pix, target_3d, 
+                best_match_command_code, best_match_command_pix,
+                intersetion_pix, intersection_3d, head_transform,
+                1 if head_visible else 0]
+        if self._frame_latency_spans > 0:
+            args.append(frame_latency_ms)
+        if self._save_frame_timestamps:
+            args.append(frame_timestamp_ms)
+        self._append_data(*args)
     
 
         
\ No newline at end of file
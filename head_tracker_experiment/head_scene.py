@@ -0,0 +1,61 @@
+from core.scene import Scene
+from core.virtual_camera import VirtualCamera
+from obj_models import LabStend
+from .head_model import HeadModel
+import numpy as np
+
+
+class HeadScene:
+    """
+    Lab stand with the screen and the head model seen by the virtual camera, the head forward ray is cast on the screen.
+    Used by HeadTrackerExperiment and by reprocess_videos.py, so recorded and reprocessed cursors are computed the same way.
+    """
+    def __init__(self) -> None:
+        self.lab_stend = LabStend()
+        self.lab_stend.transform.move(-self.lab_stend.transform.get_up()*0.2)# + self.lab_stend.transform.get_right()*0.2)
+        self.head_model = HeadModel()
+
+        self.virtual_camera = VirtualCamera()
+        self.virtual_camera.transform.set_position(self.virtual_camera.transform.get_up()*0.0915 + \
+                                                self.virtual_camera.transform.get_forward() * (-0.05) )
+        self.virtual_camera.transform.rotate(self.virtual_camera.transform.get_up(), 180)
+        self.virtual_camera.bind_node(self.head_model)
+
+        self.scene = Scene()
+        self.scene.bind_node(self.lab_stend)
+        self.scene.bind_node(self.virtual_camera)
+
+    def update_head(self, head2cam_transform_mat: np.ndarray|None):
+        """Head transform relative to the camera, None if the head is not visible"""
+        if head2cam_transform_mat is None:
+            self.head_model._update_head_not_visible()
+        else:
+            self.head_model._update_transform_matrix(head2cam_transform_mat)
+
+    def head_matrix(self) -> np.ndarray:
+        return self.head_model.transform.get_matrix(True)
+
+    def screen_intersection(self) -> np.ndarray|None:
+        """3d point where the head forward ray hits the screen, None if it misses"""
+        cast_result = self.scene.cast_rays_from_origin(self.head_model.transform.get_position(True),
+                                                       [self.head_model.transform.get_forward(True)])
+        if len(cast_result.nodes) == 1 and cast_result.nodes[0] == self.lab_stend:
+            return cast_result.points_3d[0]
+        return None
+
+    def screen_point(self, x_rel: float, y_rel: float) -> np.ndarray:
+        """3d point of the screen at relative position, (0, 0) is left upper corner, (1, 1) is right bottom one"""
+        vertices = self.lab_stend.screen_vertices
+        hor = vertices['ru'] - vertices['lu']
+        vert = vertices['lb'] - vertices['lu']
+        return vertices['lu'] + x_rel * hor + y_rel * vert
+
+    def screen_position(self, point_3d: np.ndarray, width_pix: float, height_pix: float):
+        """Pixel position (x, y) of the screen point on the drawing surface of `width_pix` x `height_pix`"""
+        vertices = self.lab_stend.screen_vertices
+        hit_vec = point_3d - vertices['lu']
+        hor_vec = vertices['ru'] - vertices['lu']
+        vert_vec = vertices['lb'] - vertices['lu']
+        x = hor_vec @ hit_vec / np.dot(hor_vec, hor_vec)
+        y = vert_vec @ hit_vec / np.dot(vert_vec, vert_vec)
+        return x * width_pix, y * height_pix
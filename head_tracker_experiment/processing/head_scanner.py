@@ -2,15 +2,18 @@ import numpy as np
 from core.transform import Transform
 
 from .face_geometry import PCF, get_metric_landmarks_of_refined
+from utils.roi_tracker import RoiCrop, RoiTracker
+from experiments_common.landmark_backends import LandmarkBackend, MediapipeLandmarkBackend, create_seed_backend, landmark_objects
+from types import SimpleNamespace
 import cv2
 from mediapipe import solutions
 from mediapipe.framework.formats import landmark_pb2
 from pathlib import Path
 
 
-def draw_landmarks_on_image(rgb_image, detection_result):
+def draw_landmarks_on_image(rgb_image, detection_result, copy=True):
   face_landmarks_list = detection_result.face_landmarks
-  annotated_image = np.copy(rgb_image)
+  annotated_image = np.copy(rgb_image) if copy else rgb_image
 
   # Loop through the detected faces to visualize.
   for idx in range(len(face_landmarks_list)):
@@ -51,6 +54,12 @@ import mediapipe as mp
 from scipy.spatial.transform.rotation import Rotation as R
 from dataclasses import dataclass
 
+# default perspective camera of mediapipe face geometry, facial_transformation_matrixes are computed for it.
+# Head pose is solved for this camera, so cursor positions match the ones of mediapipe transform matrices
+MEDIAPIPE_VERTICAL_FOV_DEG = 63.
+MEDIAPIPE_NEAR = 1.
+
+
 @dataclass(frozen=True)
 class HeadScanResults:
     processed_image: np.ndarray
@@ -59,21 +68,17 @@ class HeadScanResults:
 
 
 class HeadScanner:
-    def __init__(self, visualize=False):        
+    def __init__(self, visualize=False, roi_tracker: RoiTracker|None = None, backend: LandmarkBackend|None = None):        
         self.visualize = visualize
+        # face is searched in region of previous detection, see utils.roi_tracker
+        self.roi_tracker = roi_tracker
+        self._pose_pcf: PCF = None
 
-        import mediapipe as mp
-        from mediapipe.tasks import python
-        from mediapipe.tasks.python import vision
-        from mediapipe.tasks.python.vision.core import vision_task_running_mode
-        run_video_mode = vision_task_running_mode.VisionTaskRunningMode.VIDEO
         # STEP 2: Create an FaceLandmarker object.
-        base_options = python.BaseOptions(model_asset_path=str(Path(__file__).parent / 'face_landmarker.task'))
-        options = vision.FaceLandmarkerOptions(base_options=base_options,
-                                            output_face_blendshapes=False,
-                                            output_facial_transformation_matrixes=True,
-                                            num_faces=1, running_mode=run_video_mode)
-        self.detector =  vision.FaceLandmarker.create_from_options(options)
+        # mediapipe tracking between video frames doesn't work with moving crops, so crops are detected as images
+        self.backend = MediapipeLandmarkBackend('face', video_mode=roi_tracker is None) if backend is None else backend
+        # landmark-only backends get crops, full frames are processed by backend with face detection
+        self.seed_backend = create_seed_backend(self.backend, roi_tracker)
 
         self.camera_matrix =np.array([[1080.1,   0., 950.2],
                                 [  0.,1080.15, 475.0],
@@ -89,26 +94,42 @@ class HeadScanner:
     
     def draw_detected_landmarks(self, image):
         if self.visualize:
-            image[:] = draw_landmarks_on_image(image, self.detection_result)
-
-    def process(self, frame, timestamp): # image should be undistorted
+            # landmarks mapped to the full frame, detection result may refer to region of interest.
+            # Drawn in place, image is the pooled frame buffer which is displayed
+            draw_landmarks_on_image(image, SimpleNamespace(face_landmarks=[self.raw_landmarks]), copy=False)
+
+    def _frame_pcf(self, frame):
+        height, width = frame.shape[:2]
+        if self._pose_pcf is None or self._pose_pcf.width_px != width or self._pose_pcf.height_px != height:
+            fl_px = height / (2 * np.tan(np.radians(MEDIAPIPE_VERTICAL_FOV_DEG) / 2))
+            self._pose_pcf = PCF(width, height, fl_px, near=MEDIAPIPE_NEAR)
+        return self._pose_pcf
+
+    def process(self, frame, timestamp, is_rgb=False): # image should be undistorted
         # frame = frame
         # STEP 3: Load the input image.
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image = mp.Image(mp.ImageFormat.SRGB, frame_rgb)
+        # RGB frames (see utils.camera_source.convert_qvideoframe_rgb) are passed to mediapipe without conversion
+        frame_rgb = frame if is_rgb else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        crop: RoiCrop = None if self.roi_tracker is None else self.roi_tracker.crop(frame_rgb, timestamp)
 
         # STEP 4: Detect face landmarks from the input image.
-        self.detection_result = self.detector.detect_for_video(image, timestamp)
-
-        if self.detection_result.face_landmarks:
-            self.raw_landmarks = self.detection_result.face_landmarks[0]
-            landmarks = np.array([(lm.x,lm.y,lm.z) for lm in self.raw_landmarks])
+        backend = self.seed_backend if self.seed_backend is not None and crop.is_full_frame() else self.backend
+        self.detection_result = backend.detect(frame_rgb if crop is None else crop.image, timestamp)
+
+        if self.detection_result.found():
+            landmarks = self.detection_result.landmarks
+            if crop is not None:
+                landmarks = crop.to_frame_normalized(landmarks)
+                self.roi_tracker.update(crop, landmarks, timestamp)
+            self.raw_landmarks = landmark_objects(landmarks)
             # print(self.detection_result.facial_transformation_matrixes)
             landmarks = landmarks.T
 
 
             # landmarks_head_space, _, head2cam_transform_mat = get_metric_landmarks_of_refined(landmarks.copy(), self.pcf)
-            head2cam_transform_mat = self.detection_result.facial_transformation_matrixes[0]
+            # pose is solved for landmarks mapped to the frame on every frame: mediapipe solves it as if the crop was
+            # the whole camera image and landmark-only backends don't solve it, switching solvers makes the head jump
+            _, _, head2cam_transform_mat = get_metric_landmarks_of_refined(landmarks.copy(), self._frame_pcf(frame_rgb))
             # landmarks_head_space = landmarks_head_space.T / 100
 
             head2cam_transform_mat = head2cam_transform_mat.T
@@ -132,6 +153,8 @@ class HeadScanner:
             if self.visualize:
                 self.draw_detected_landmarks(frame)
         else:
+            if crop is not None:
+                self.roi_tracker.update(crop, None)
             self.raw_landmarks = None
             self.landmarks_head_space = None
             self.head2cam_transform_mat = None
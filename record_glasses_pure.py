@@ -1,16 +1,26 @@
-import serial, h5py, numpy as np
+import argparse
+import h5py, numpy as np
+
+from glasses_tracker_experiment.glasses_transport import open_transport, parse_line
+
+parser = argparse.ArgumentParser(description='Records raw glasses sensor data into `data` dataset')
+parser.add_argument('--port', default='COM4', help="serial port, 'sim' or 'sim:<recording.hdf5>' for simulated glasses")
+parser.add_argument('--num-samples', type=int, default=2000)
+parser.add_argument('--output', default='sample_record.hdf5')
+args = parser.parse_args()
 
 buff = []
-ser = serial.Serial('COM4', baudrate=115200)
+transport = open_transport(args.port)
+transport.open()
 
-while len(buff) < 2000:
-    print(len(buff))
-    line = ser.readline().decode().replace('\r', '').replace('\n', '')
-    # print(line,line.split('\t'))
-    vals = list(map(float, line.split('\t')[:3]))
+while len(buff) < args.num_samples and transport.is_open():
+    vals = parse_line(transport.read_line())
+    if vals is None:
+        continue
     buff.append(vals)
+    print(len(buff))
 
-with h5py.File('sample_record.hdf5', 'w') as f:
+with h5py.File(args.output, 'w') as f:
     f.create_dataset('data', data=np.array(buff))
 
-ser.close()
+transport.close()
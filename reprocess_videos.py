@@ -0,0 +1,384 @@
+"""
+Re-derives landmarks and cursor traces of recorded experiments from their session videos (see utils.video_recorder).
+
+Every head/hand record with `video_file` attribute is processed frame by frame by the pipeline of its experiment:
+HeadScanner with head ray cast on the lab stand screen, or HandScanner. Videos are processed in a process pool,
+each process creates its detector once and processes whole videos one after another.
+tflite/onnx backends run the landmark model on RoiTracker crops only, full frames (first frame, frames after the target
+is lost) are processed by mediapipe, whose landmarks seed the crops, so these backends require ROI tracking.
+
+Results are written to `/reprocessed/<experiment_tag>/<person>/<run_key>` groups, one row per video frame, of a separate
+results file (experiment_results.reprocessed.hdf5 for experiment_results.hdf5 by default), the save file is only read.
+Derived datasets have the same names and shapes as in HeadDataSaver/HandDataSaver, command datasets are copied
+from the record row of the same frame (by frame_timestamp_ms) and are default for frames recorded between commands.
+best_match_command_* datasets depend on the grid drawn by the experiment window and are not recomputed.
+
+Records with complete reprocessed groups are skipped, so an interrupted run is resumed by running it again.
+
+Run from the project root:
+    python reprocess_videos.py experiment_results.hdf5 --experiment head --workers 4
+    python reprocess_videos.py experiment_results.hdf5 --experiment hand --backend tflite --output hand_tflite.hdf5
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import h5py
+import numpy as np
+
+from analysis.runs import run_group_names
+from experiments_common.data_saver import DEFAULT_FIELD_STORAGE, Field
+from experiments_common.experiment_catalog import REPROCESSED_GROUP
+from experiments_common.landmark_backends import (FACE_LANDMARKER_TASK, FACE_LANDMARKS_MODEL, HAND_LANDMARKER_TASK,
+                                                  HAND_LANDMARKS_MODEL, LandmarkBackend, MediapipeLandmarkBackend,
+                                                  OnnxLandmarkBackend, TFLiteLandmarkBackend, extract_task_model)
+from utils.roi_tracker import RoiTracker
+
+
+# datasets derived from video, names and shapes are the same as in HeadDataSaver/HandDataSaver
+DERIVED_FIELDS = {
+    'head': [
+        Field('head_transform', (4, 4), float),
+        Field('head_visible', (1,), 'i8', 0),
+        Field('intersection_3d', (3,), float),
+        Field('intersection_pix', (2,), float),
+    ],
+    'hand': [
+        Field('finger_tip_pix', (2,), float),
+        Field('hand_landmarks', (21, 3), np.float32),
+        Field('hand_world_landmarks', (21, 3), np.float32),
+        Field('hand_visible', (1,), 'i8', 0),
+    ],
+}
+
+# datasets copied from the record row of the frame
+COMMAND_FIELDS = {
+    'head': [
+        Field('command_ind', (1,), 'i8', -1),
+        Field('command_code', (1,), 'i8', -1),
+        Field('target_rel', (2,), float),
+        Field('target_pix', (2,), float),
+        Field('target_3d', (3,), float),
+    ],
+    'hand': [
+        Field('command_ind', (1,), 'i8', -1),
+        Field('command_code', (1,), 'i8', -1),
+        Field('target_rel', (2,), float),
+        Field('target_pix', (2,), float),
+    ],
+}
+
+LANDMARKS_KIND = {'head': 'face', 'hand': 'hand'}
+
+
+@dataclass(frozen=True)
+class ReprocessJob:
+    group_name: str
+    video_path: str
+    frame_timestamps_ms: np.ndarray
+    scene_width: int
+    scene_height: int
+
+
+@dataclass(frozen=True)
+class ReprocessResult:
+    group_name: str
+    columns: Dict[str, np.ndarray]
+    frames_decoded: int
+    elapsed_sec: float
+    backend: str
+
+
+def create_backend(experiment_tag: str, backend: str = 'mediapipe', model_path=None,
+                   roi_tracking: bool = True) -> LandmarkBackend:
+    kind = LANDMARKS_KIND[experiment_tag]
+    if backend == 'mediapipe':
+        # crops of RoiTracker move between frames, mediapipe video tracking is used only for full frames
+        return MediapipeLandmarkBackend(kind, video_mode=not roi_tracking)
+    if backend == 'tflite':
+        if model_path is None:
+            model_path = extract_task_model(FACE_LANDMARKER_TASK if kind == 'face' else HAND_LANDMARKER_TASK,
+                                            FACE_LANDMARKS_MODEL if kind == 'face' else HAND_LANDMARKS_MODEL)
+        return TFLiteLandmarkBackend(model_path, kind, max_batch_size=1)
+    if backend == 'onnx':
+        if model_path is None:
+            raise ValueError('ONNX backend requires --model')
+        return OnnxLandmarkBackend(model_path, kind, max_batch_size=1)
+    raise ValueError(f'unknown backend {backend}')
+
+
+class HeadPipeline:
+    """HeadScanner and HeadScene of HeadTrackerExperiment, head forward ray is cast on the lab stand screen"""
+    def __init__(self, backend: LandmarkBackend, roi_tracking: bool = True) -> None:
+        # experiment modules import Qt and mediapipe, so only the pipeline of processed experiment is loaded
+        from head_tracker_experiment.head_scene import HeadScene
+        from head_tracker_experiment.processing.head_scanner import HeadScanner
+
+        self.scanner = HeadScanner(False, RoiTracker() if roi_tracking else None, backend)
+        self.head_scene = HeadScene()
+
+    def reset(self):
+        if self.scanner.roi_tracker is not None:
+            self.scanner.roi_tracker.reset()
+        # transform is smoothed over frames
+        self.scanner.head2cam_transform_mat = None
+
+    def process(self, frame: np.ndarray, timestamp: int, job: ReprocessJob) -> list:
+        """Values of DERIVED_FIELDS['head'], None for missing ones"""
+        scan_results = self.scanner.process(frame, timestamp, True)
+        if not scan_results.head_visible:
+            return [None, 0, None, None]
+        self.head_scene.update_head(scan_results.head2cam_transform_mat)
+        head_matrix = self.head_scene.head_matrix()
+        intersection_3d = self.head_scene.screen_intersection()
+        if intersection_3d is None:
+            return [head_matrix, 1, None, None]
+        return [head_matrix, 1, intersection_3d,
+                list(self.head_scene.screen_position(intersection_3d, job.scene_width, job.scene_height))]
+
+
+class HandPipeline:
+    def __init__(self, backend: LandmarkBackend, roi_tracking: bool = True) -> None:
+        from hand_tracker_experiment.hand_scanner import HandScanner
+        self.scanner = HandScanner(backend, RoiTracker() if roi_tracking else None)
+
+    def reset(self):
+        if self.scanner.roi_tracker is not None:
+            self.scanner.roi_tracker.reset()
+
+    def process(self, frame: np.ndarray, timestamp: int, job: ReprocessJob) -> list:
+        """Values of DERIVED_FIELDS['hand'], None for missing ones"""
+        scan_results = self.scanner.process(frame, timestamp)
+        if not scan_results.hand_visible:
+            return [None, None, None, 0]
+        detection_results = scan_results.detection_results
+        return [scan_results.finger_tip, detection_results.landmarks, detection_results.world_landmarks, 1]
+
+
+PIPELINES = {'head': HeadPipeline, 'hand': HandPipeline}
+
+# state of pool process
+_pipeline = None
+_experiment_tag = None
+_backend_name = None
+_next_timestamp_ms = 0
+
+
+def _init_worker(experiment_tag: str, backend: str, model_path, roi_tracking: bool):
+    global _pipeline, _experiment_tag, _backend_name
+    cv2.setNumThreads(1)
+    landmark_backend = create_backend(experiment_tag, backend, model_path, roi_tracking)
+    _pipeline = PIPELINES[experiment_tag](landmark_backend, roi_tracking)
+    _experiment_tag = experiment_tag
+    _backend_name = landmark_backend.name()
+
+
+def _reprocess_video(job: ReprocessJob) -> ReprocessResult:
+    global _next_timestamp_ms
+    start = time.perf_counter()
+    fields = DERIVED_FIELDS[_experiment_tag]
+    num_frames = len(job.frame_timestamps_ms)
+    columns = {field.name: np.full((num_frames, *field.data_shape), field.default_value, field.dtype) for field in fields}
+    _pipeline.reset()
+    # mediapipe in video mode requires increasing timestamps over all videos of the process
+    offset_ms = _next_timestamp_ms - int(job.frame_timestamps_ms[0]) if num_frames > 0 else 0
+
+    capture = cv2.VideoCapture(job.video_path)
+    frame_rgb = None
+    frames_decoded = 0
+    try:
+        while frames_decoded < num_frames:
+            ok, frame_bgr = capture.read()
+            if not ok:
+                break
+            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, frame_rgb)
+            timestamp = int(job.frame_timestamps_ms[frames_decoded]) + offset_ms
+            values = _pipeline.process(frame_rgb, timestamp, job)
+            for field, value in zip(fields, values):
+                if value is not None:
+                    columns[field.name][frames_decoded] = np.reshape(value, field.data_shape)
+            frames_decoded += 1
+            _next_timestamp_ms = timestamp + 1000
+    finally:
+        capture.release()
+    return ReprocessResult(job.group_name, columns, frames_decoded, time.perf_counter() - start, _backend_name)
+
+
+def _record_command_columns(group: h5py.Group, experiment_tag: str, frame_timestamps_ms: np.ndarray) -> Dict[str, np.ndarray]|None:
+    """Command datasets of the record rows joined to video frames, None if rows have no frame timestamps"""
+    if 'frame_timestamp_ms' not in group:
+        return None
+    row_timestamps = group['frame_timestamp_ms'][()].reshape(-1)
+    order = np.argsort(row_timestamps, kind='stable')
+    sorted_timestamps = row_timestamps[order]
+    pos = np.clip(np.searchsorted(sorted_timestamps, frame_timestamps_ms), 0, max(len(sorted_timestamps) - 1, 0))
+    matched = np.zeros(len(frame_timestamps_ms), bool)
+    if len(sorted_timestamps) > 0:
+        matched = sorted_timestamps[pos] == frame_timestamps_ms
+    rows = order[pos[matched]] if len(sorted_timestamps) > 0 else np.zeros(0, int)
+
+    columns = {}
+    for field in COMMAND_FIELDS[experiment_tag]:
+        column = np.full((len(frame_timestamps_ms), *field.data_shape), field.default_value, field.dtype)
+        if field.name in group and len(rows) > 0:
+            column[matched] = group[field.name][()][rows]
+        columns[field.name] = column
+    return columns
+
+
+def collect_jobs(save_file, experiment_tag: str, person: str|None = None):
+    """Jobs for records with video and their command columns"""
+    save_file = Path(save_file)
+    filters = {'experiment_tag': experiment_tag}
+    if person is not None:
+        filters['person'] = person
+    jobs, commands = [], {}
+    with h5py.File(str(save_file), 'r') as _file:
+        for group_name in run_group_names(save_file, **filters):
+            group = _file[group_name]
+            if 'video_file' not in group.attrs or 'video_frame_timestamp_ms' not in group:
+                continue
+            video_path = save_file.parent / group.attrs['video_file']
+            if not video_path.exists():
+                print('video not found', group_name, video_path)
+                continue
+            frame_timestamps_ms = group['video_frame_timestamp_ms'][()].reshape(-1)
+            jobs.append(ReprocessJob(group_name, str(video_path), frame_timestamps_ms,
+                                     int(group.attrs.get('scene_width', 1920)), int(group.attrs.get('scene_height', 1080))))
+            commands[group_name] = _record_command_columns(group, experiment_tag, frame_timestamps_ms)
+    return jobs, commands
+
+
+def completed_groups(output_file) -> set:
+    if not os.path.exists(output_file):
+        return set()
+    completed = set()
+    with h5py.File(str(output_file), 'r') as _file:
+        if REPROCESSED_GROUP not in _file:
+            return completed
+        def visit(name, item):
+            # names are relative to reprocessed group, i.e. names of source records
+            if isinstance(item, h5py.Group) and item.attrs.get('complete', 0) == 1:
+                completed.add('/' + name)
+        _file[REPROCESSED_GROUP].visititems(visit)
+    return completed
+
+
+def write_result(output: h5py.File, source: h5py.File, job: ReprocessJob, result: ReprocessResult,
+                 command_columns: Dict[str, np.ndarray]|None, roi_tracking: bool):
+    group_name = f'/{REPROCESSED_GROUP}{job.group_name}'
+    if group_name in output:
+        # left incomplete by interrupted run or overwritten
+        del output[group_name]
+    group = output.create_group(group_name)
+    source_group = source[job.group_name]
+    for key, val in source_group.attrs.items():
+        group.attrs[key] = val
+
+    storage = DEFAULT_FIELD_STORAGE
+    def create(name, data):
+        group.create_dataset(name, data=data, compression=storage.compression,
+                             compression_opts=storage.compression_opts, shuffle=storage.shuffle)
+    create('timestamp_sec', source_group['video_frame_time_sec'][()].reshape(-1, 1))
+    create('frame_timestamp_ms', job.frame_timestamps_ms.reshape(-1, 1))
+    for name, column in (command_columns or {}).items():
+        create(name, column)
+    for name, column in result.columns.items():
+        create(name, column)
+
+    group.attrs['source_group'] = job.group_name
+    group.attrs['reprocessed_at'] = datetime.now().isoformat()
+    group.attrs['backend'] = result.backend
+    group.attrs['roi_tracking'] = roi_tracking
+    group.attrs['frames_decoded'] = result.frames_decoded
+    group.attrs['commands_joined'] = 1 if command_columns is not None else 0
+    group.attrs['complete'] = 1
+    output.flush()
+
+
+def default_output_file(save_file) -> Path:
+    save_file = Path(save_file)
+    return save_file.with_name(save_file.stem + '.reprocessed' + save_file.suffix)
+
+
+def reprocess(save_file, experiment_tag: str, output_file=None, max_workers: int|None = None, backend: str = 'mediapipe',
+              model_path=None, roi_tracking: bool = True, person: str|None = None, overwrite: bool = False) -> List[str]:
+    """
+    Reprocess videos of records, `max_workers=0` processes them in current process.
+    Returns names of written groups
+    """
+    output_file = output_file or default_output_file(save_file)
+    if os.path.abspath(output_file) == os.path.abspath(save_file):
+        raise ValueError(f'{output_file}: reprocessed groups are not written to the save file')
+    if backend != 'mediapipe' and not roi_tracking:
+        raise ValueError(f'{backend} backend has no detection stage, it requires ROI tracking')
+    jobs, commands = collect_jobs(save_file, experiment_tag, person)
+    if not overwrite:
+        completed = completed_groups(output_file)
+        skipped = [job for job in jobs if job.group_name in completed]
+        jobs = [job for job in jobs if job.group_name not in completed]
+        if len(skipped) > 0:
+            print(f'{len(skipped)} records are already reprocessed')
+    total_frames = sum(len(job.frame_timestamps_ms) for job in jobs)
+    print(f'{len(jobs)} records, {total_frames} frames to reprocess')
+    if len(jobs) == 0:
+        return []
+
+    written = []
+    frames_done = 0
+    start = time.perf_counter()
+    with h5py.File(str(output_file), 'a') as output, h5py.File(str(save_file), 'r') as source:
+        jobs_by_name = {job.group_name: job for job in jobs}
+
+        def done(result: ReprocessResult):
+            nonlocal frames_done
+            job = jobs_by_name[result.group_name]
+            write_result(output, source, job, result, commands[job.group_name], roi_tracking)
+            written.append(job.group_name)
+            frames_done += len(job.frame_timestamps_ms)
+            elapsed = time.perf_counter() - start
+            rate = frames_done / elapsed
+            print(f'[{len(written)}/{len(jobs)}] {job.group_name}: {result.frames_decoded} frames, '
+                  f'{result.frames_decoded / result.elapsed_sec:.1f} frames/s | '
+                  f'total {rate:.1f} frames/s, left {(total_frames - frames_done) / rate:.0f} s')
+
+        if max_workers == 0:
+            _init_worker(experiment_tag, backend, model_path, roi_tracking)
+            for job in jobs:
+                done(_reprocess_video(job))
+        else:
+            with ProcessPoolExecutor(max_workers, initializer=_init_worker,
+                                     initargs=(experiment_tag, backend, model_path, roi_tracking)) as executor:
+                futures = {executor.submit(_reprocess_video, job): job for job in jobs}
+                for future in as_completed(futures):
+                    try:
+                        done(future.result())
+                    except Exception as e:
+                        print('failed', futures[future].group_name, repr(e))
+
+    elapsed = time.perf_counter() - start
+    print(f'{len(written)} records, {frames_done} frames in {elapsed:.1f} s ({frames_done / elapsed:.1f} frames/s)')
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('save_file')
+    parser.add_argument('--experiment', choices=list(PIPELINES), default='head')
+    parser.add_argument('--person')
+    parser.add_argument('--output', help='results file for reprocessed groups, <name>.reprocessed.hdf5 next to save_file if not given')
+    parser.add_argument('--workers', type=int, help='number of processes, 0 to process in current process')
+    parser.add_argument('--backend', choices=['mediapipe', 'tflite', 'onnx'], default='mediapipe')
+    parser.add_argument('--model', help='landmark model of tflite/onnx backend, extracted from mediapipe .task bundle if not given')
+    parser.add_argument('--no-roi', action='store_true', help='process full frames instead of region of previous detection, mediapipe backend only')
+    parser.add_argument('--overwrite', action='store_true', help='reprocess records with complete reprocessed groups')
+    args = parser.parse_args()
+
+    reprocess(args.save_file, args.experiment, args.output, args.workers, args.backend, args.model,
+              not args.no_roi, args.person, args.overwrite)
@@ -0,0 +1,84 @@
+import unittest
+
+from experiments_common.dwell_detector import DwellDetector
+
+
+# timestamps are multiples of STEP, exact in binary, so window boundaries don't depend on rounding
+WINDOW_SEC = 10.
+STEP = 0.25
+# samples until the window spans min_period_ratio * WINDOW_SEC, i.e. 9.5 s
+SAMPLES_TO_DWELL = 39
+
+
+class DwellDetectorTest(unittest.TestCase):
+    def feed(self, detector: DwellDetector, codes, start: float = 0.):
+        """Samples of `codes` every STEP seconds from `start`, results of add"""
+        return [detector.add(code, start + ind * STEP) for ind, code in enumerate(codes)]
+
+    def detector(self, target_code: int|None = 4):
+        detector = DwellDetector(WINDOW_SEC)
+        detector.reset(target_code)
+        return detector
+
+    def test_dwell_reached(self):
+        detector = self.detector()
+        detected = self.feed(detector, [4] * SAMPLES_TO_DWELL)
+        self.assertEqual(detected, [False] * (SAMPLES_TO_DWELL - 1) + [True])
+        self.assertEqual(detector.density(), 1.)
+        self.assertEqual(detector.period(), 9.5)
+
+    def test_no_target(self):
+        detector = self.detector(None)
+        self.assertFalse(any(self.feed(detector, [4] * 100)))
+        self.assertEqual(len(detector), 0)
+
+    def test_low_density(self):
+        detector = self.detector()
+        # every fourth sample is another command, density 0.75
+        self.assertFalse(any(self.feed(detector, [4, 4, 4, 1] * 30)))
+
+    def test_density_threshold(self):
+        detector = self.detector()
+        # 4 of 40 samples in the window are other commands, density 0.9
+        self.assertTrue(self.feed(detector, [1] * 4 + [4] * 36)[-1])
+
+    def test_old_samples_leave_window(self):
+        detector = self.detector()
+        self.assertFalse(any(self.feed(detector, [1] * 40)))
+        detected = self.feed(detector, [4] * 40, start=40 * STEP)
+        # other commands are dropped after WINDOW_SEC, density reaches 0.9 at the 36th sample
+        self.assertEqual(detected, [False] * 35 + [True] * 5)
+        self.assertEqual(len(detector), 40)
+        self.assertEqual(detector.density(), 1.)
+
+    def test_target_switch(self):
+        detector = self.detector()
+        self.feed(detector, [4] * 30)
+        detector.reset(7)
+        self.assertEqual(detector.target_code(), 7)
+        self.assertEqual(len(detector), 0)
+        # samples of the previous target don't count for the new one
+        self.assertFalse(any(self.feed(detector, [4] * 100, start=30 * STEP)))
+        detector.reset(7)
+        self.assertEqual(self.feed(detector, [7] * SAMPLES_TO_DWELL, start=130 * STEP)[-1], True)
+
+    def test_reset(self):
+        detector = self.detector()
+        self.feed(detector, [4] * 30)
+        detector.reset()
+        self.assertIsNone(detector.target_code())
+        self.assertEqual((len(detector), detector.density(), detector.period()), (0, 0., 0.))
+        self.assertFalse(detector.add(4, 30 * STEP))
+
+    def test_set_window_sec(self):
+        detector = self.detector()
+        self.feed(detector, [4] * 30)
+        detector.set_window_sec(WINDOW_SEC / 2)
+        # target is kept, samples are dropped
+        self.assertEqual((detector.target_code(), len(detector)), (4, 0))
+        detected = self.feed(detector, [4] * 20, start=30 * STEP)
+        self.assertEqual(detected.index(True), 19)
+
+
+if __name__ == '__main__':
+    unittest.main()
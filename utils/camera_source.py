@@ -6,6 +6,7 @@ from PyQt6.QtMultimedia import QVideoSink, QMediaCaptureSession, QCameraDevice,
 from PyQt6.QtCore import QObject, pyqtSlot, pyqtSignal, QByteArray, QBuffer, QSize
 from PyQt6.QtGui import QPixmap, QImage
 import cv2, numpy as np, sys
+import threading
 import time
 
 
@@ -37,6 +38,174 @@ def convert_qimage_cv(qimage: QImage):
 
     return img#[:, :, :3].copy()
 
+def convert_rgb_qimage(rgb_image: np.ndarray):
+    """Wrap contiguous RGB image into QImage without color conversion"""
+    h, w, ch = rgb_image.shape
+    return QImage(rgb_image.data, w, h, ch * w, QImage.Format.Format_RGB888)
+
+
+# byte offsets of R, G, B channels in 4 bytes per pixel formats, which can be viewed without conversion
+_PACKED_RGB_OFFSETS = {
+    QVideoFrameFormat.PixelFormat.Format_RGBA8888: (0, 1, 2),
+    QVideoFrameFormat.PixelFormat.Format_RGBX8888: (0, 1, 2),
+    QVideoFrameFormat.PixelFormat.Format_BGRA8888: (2, 1, 0),
+    QVideoFrameFormat.PixelFormat.Format_BGRA8888_Premultiplied: (2, 1, 0),
+    QVideoFrameFormat.PixelFormat.Format_BGRX8888: (2, 1, 0),
+    QVideoFrameFormat.PixelFormat.Format_ARGB8888: (1, 2, 3),
+    QVideoFrameFormat.PixelFormat.Format_ARGB8888_Premultiplied: (1, 2, 3),
+    QVideoFrameFormat.PixelFormat.Format_XRGB8888: (1, 2, 3),
+    QVideoFrameFormat.PixelFormat.Format_ABGR8888: (3, 2, 1),
+    QVideoFrameFormat.PixelFormat.Format_XBGR8888: (3, 2, 1),
+}
+
+
+def _rgb_view(plane: np.ndarray, offsets):
+    """(h, w, 3) RGB view of (h, w, 4) packed pixels"""
+    start = offsets[0]
+    if offsets[1] > start:
+        return plane[:, :, start:start + 3]
+    return plane[:, :, start:(start - 3 if start >= 3 else None):-1]
+
+
+def _orient_view(image: np.ndarray, mirrored: bool, rotation_angle: QVideoFrame.RotationAngle):
+    """Apply frame mirroring and clockwise rotation the same way QVideoFrame.toImage does, as views"""
+    if mirrored:
+        image = image[:, ::-1]
+    match rotation_angle:
+        case QVideoFrame.RotationAngle.Rotation90:
+            image = np.rot90(image, -1)
+        case QVideoFrame.RotationAngle.Rotation180:
+            image = image[::-1, ::-1]
+        case QVideoFrame.RotationAngle.Rotation270:
+            image = np.rot90(image, 1)
+    return image
+
+
+def convert_qvideoframe_rgb(frame: QVideoFrame, out: np.ndarray|None = None) -> np.ndarray:
+    """
+    Contiguous (h, w, 3) uint8 RGB image of video frame, as mediapipe expects.
+
+    Packed RGB formats are read from mapped frame plane as a stride-aware view and copied once into `out`
+    (allocated if None or of other shape). Other formats (YUV, MJPEG, ...) are converted by `frame.toImage()`.
+    """
+    offsets = _PACKED_RGB_OFFSETS.get(frame.pixelFormat())
+    if offsets is None or not frame.map(QVideoFrame.MapMode.ReadOnly):
+        return _convert_qimage_rgb(frame.toImage(), out)
+    try:
+        h, w, stride = frame.height(), frame.width(), frame.bytesPerLine(0)
+        ptr = frame.bits(0)
+        ptr.setsize(frame.mappedBytes(0))
+        plane = np.frombuffer(ptr, np.uint8, count=stride * h).reshape(h, stride)[:, :w * 4].reshape(h, w, 4)
+        image = _orient_view(_rgb_view(plane, offsets), frame.mirrored(), frame.rotationAngle())
+        if out is None or out.shape != image.shape:
+            out = np.empty(image.shape, np.uint8)
+        np.copyto(out, image)
+    finally:
+        frame.unmap()
+    return out
+
+
+def rgb_frame_shape(frame: QVideoFrame) -> typing.Tuple[int, int, int]:
+    """Shape of image returned by convert_qvideoframe_rgb for the frame"""
+    if frame.rotationAngle() in (QVideoFrame.RotationAngle.Rotation90, QVideoFrame.RotationAngle.Rotation270):
+        return frame.width(), frame.height(), 3
+    return frame.height(), frame.width(), 3
+
+
+class FrameBuffer:
+    """Reference counted image buffer of FramePool, returns to the pool when the last reference is released"""
+    def __init__(self, pool: 'FramePool', array: np.ndarray, generation: int) -> None:
+        self.array = array
+        self._pool = pool
+        self._generation = generation
+        self._ref_count = 0
+
+    def retain(self):
+        with self._pool._lock:
+            self._ref_count += 1
+        return self
+
+    def release(self):
+        with self._pool._lock:
+            self._ref_count -= 1
+            if self._ref_count > 0:
+                return
+        self._pool._recycle(self)
+
+
+class FramePool:
+    """
+    Preallocated uint8 image buffers of current camera format, reused for conversion, detection and display of frames.
+
+    Buffers are reallocated only when frame shape changes (camera format or rotation), buffers of previous
+    shape still in use are dropped on release. When all buffers are in use, a new one is allocated.
+    """
+    def __init__(self, num_buffers: int = 3) -> None:
+        self._num_buffers = num_buffers
+        self._lock = threading.Lock()
+        self._shape = None
+        self._generation = 0
+        self._free: typing.List[np.ndarray] = []
+        self._num_allocations = 0
+
+    def shape(self):
+        return self._shape
+
+    def num_allocations(self):
+        """Number of buffers allocated since pool creation"""
+        return self._num_allocations
+
+    def reset(self, shape: typing.Tuple[int, ...]|None = None):
+        with self._lock:
+            self._generation += 1
+            self._shape = None if shape is None else tuple(shape)
+            self._free = []
+            if self._shape is not None:
+                self._free = [np.empty(self._shape, np.uint8) for _ in range(self._num_buffers)]
+                self._num_allocations += self._num_buffers
+
+    def set_camera_format(self, camera_format: QCameraFormat):
+        resolution = camera_format.resolution()
+        if resolution.isEmpty():
+            self.reset()
+        else:
+            self.reset((resolution.height(), resolution.width(), 3))
+
+    def acquire(self, shape: typing.Tuple[int, ...]) -> FrameBuffer:
+        """Buffer of `shape` with one reference, release it when the frame is no longer used"""
+        shape = tuple(shape)
+        if shape != self._shape:
+            self.reset(shape)
+        with self._lock:
+            if len(self._free) > 0:
+                array = self._free.pop()
+            else:
+                array = np.empty(shape, np.uint8)
+                self._num_allocations += 1
+            buffer = FrameBuffer(self, array, self._generation)
+        return buffer.retain()
+
+    def acquire_for_frame(self, frame: QVideoFrame) -> FrameBuffer:
+        return self.acquire(rgb_frame_shape(frame))
+
+    def _recycle(self, buffer: FrameBuffer):
+        with self._lock:
+            if buffer._generation == self._generation and len(self._free) < self._num_buffers:
+                self._free.append(buffer.array)
+
+
+def _convert_qimage_rgb(qimage: QImage, out: np.ndarray|None = None) -> np.ndarray:
+    qimage = qimage.convertToFormat(QImage.Format.Format_RGB888)
+    h, w, stride = qimage.height(), qimage.width(), qimage.bytesPerLine()
+    ptr = qimage.constBits()
+    ptr.setsize(qimage.sizeInBytes())
+    image = np.frombuffer(ptr, np.uint8, count=stride * h).reshape(h, stride)[:, :w * 3].reshape(h, w, 3)
+    if out is None or out.shape != image.shape:
+        out = np.empty(image.shape, np.uint8)
+    np.copyto(out, image)
+    return out
+
+
 def convert_cv_qpixmap(cv_img):
 
     
@@ -97,14 +266,19 @@ class CameraSource(QObject):
         self.camera = QCamera(camera_device)
         self.capture_session.setCamera(self.camera)
         self.capture_session.videoSink().videoFrameChanged.connect(self._frame_changed)
+        self._frame_pool = FramePool()
+        self.camera.cameraFormatChanged.connect(self._camera_format_changed)
         self.camera.errorOccurred.connect(self._error_registered)
         self.camera.errorChanged.connect(lambda: print('error changed', self.camera.error()))
 
         self._run_start = time.time()
         self._time_captured = time.time()
+        self._captured_ns = time.perf_counter_ns()
+        self._frame_index = -1
         self._video_frame = None
         self._do_mirror = False
         self._capture_rotation_angle = QVideoFrame.RotationAngle.Rotation0
+        self._recorder = None
 
     @pyqtSlot(QCamera.Error, str)
     def _error_registered(self, err: QCamera.Error, err_str: str):
@@ -154,6 +328,16 @@ class CameraSource(QObject):
             self.camera.stop()
         self.camera = QCamera(camera_device)
         self.capture_session.setCamera(self.camera)
+        self.camera.cameraFormatChanged.connect(self._camera_format_changed)
+        self._camera_format_changed()
+
+    @pyqtSlot()
+    def _camera_format_changed(self):
+        self._frame_pool.set_camera_format(self.camera.cameraFormat())
+
+    def frame_pool(self):
+        """Pool of RGB buffers for frames of this source, see convert_qvideoframe_rgb"""
+        return self._frame_pool
 
     def video_frame_timestamp_ms(self) -> typing.Tuple[QVideoFrame|None, int]:
         return [self._video_frame, self.timestamp_ms()]
@@ -161,9 +345,37 @@ class CameraSource(QObject):
     def video_frame(self):
         return self._video_frame
 
+    def frame_index(self):
+        """Number of the last captured frame since source creation"""
+        return self._frame_index
+
+    def captured_ns(self):
+        """time.perf_counter_ns of the last frame capture"""
+        return self._captured_ns
+
     def timestamp_ms(self):
         return int((self._time_captured - self._run_start)*1000)
 
+    def start_recording(self, path, fourcc: str = 'MJPG'):
+        """Record captured frames into video file, see utils.video_recorder.VideoRecorder"""
+        # video_recorder imports frame conversion from this module
+        from utils.video_recorder import VideoRecorder
+        self.stop_recording()
+        fps = self.camera.cameraFormat().maxFrameRate() or 30.
+        self._recorder = VideoRecorder(path, fps, fourcc)
+        self._recorder.start()
+        return self._recorder
+
+    def stop_recording(self):
+        """VideoRecording with timestamps of written frames, None if frames were not recorded"""
+        if self._recorder is None:
+            return None
+        recorder, self._recorder = self._recorder, None
+        return recorder.stop()
+
+    def recorder(self):
+        return self._recorder
+
     def start(self):
         self._run_start = time.time()
         self.camera.start()
@@ -176,6 +388,7 @@ class CameraSource(QObject):
         self.camera.setActive(False)
     
     def stop(self):
+        self.stop_recording()
         print('self.camera.error() ', self.camera.error() )
         if self.camera.error() == QCamera.Error.NoError:
             try:
@@ -210,7 +423,11 @@ class CameraSource(QObject):
         frame.setMirrored(self._do_mirror)
         frame.setRotationAngle(self._capture_rotation_angle)
         self._time_captured = time.time()
+        self._captured_ns = time.perf_counter_ns()
+        self._frame_index += 1
         self._video_frame = QVideoFrame(frame)
+        if self._recorder is not None:
+            self._recorder.add_frame(self._video_frame, self.timestamp_ms(), self._time_captured)
         self.frame_captured.emit(self._video_frame)
         self.frame_captured[QVideoFrame, int].emit(self._video_frame, self.timestamp_ms())
     
@@ -28,6 +28,10 @@ class CurrentConfig:
     command_time: float
     command_capture_time: float
     show_cursor: bool
+    grid_rows: int = 3
+    grid_cols: int = 3
+    save_frame_latency: bool = False # per-frame latencies as `frame_latency_ms` field of head/hand records
+    record_video: bool = False # raw camera video of head/hand records beside results file, see DataSaver.save_video_recording
 
 
 class ExperimentConfigsModel(QObject):
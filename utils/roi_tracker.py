@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True)
+class RoiCrop:
+    image: np.ndarray # contiguous, possibly downscaled crop passed to detector
+    x0: int # crop rectangle in frame pixels
+    y0: int
+    width: int
+    height: int
+    frame_width: int
+    frame_height: int
+
+    def is_full_frame(self):
+        return self.x0 == 0 and self.y0 == 0 and self.width == self.frame_width and self.height == self.frame_height
+
+    def to_frame_normalized(self, landmarks: np.ndarray) -> np.ndarray:
+        """
+        Maps (N, 2|3) landmarks normalized to crop image into landmarks normalized to the frame.
+        z is normalized by image width as in mediapipe, so it's rescaled as x
+        """
+        landmarks = np.array(landmarks, float)
+        landmarks[:, 0] = (self.x0 + landmarks[:, 0] * self.width) / self.frame_width
+        landmarks[:, 1] = (self.y0 + landmarks[:, 1] * self.height) / self.frame_height
+        if landmarks.shape[1] > 2:
+            landmarks[:, 2] *= self.width / self.frame_width
+        return landmarks
+
+
+class RoiTracker:
+    """
+    Region of interest for landmark detectors.
+
+    Crop is a square around bounding box of landmarks found on the previous frame, enlarged by `margin`
+    of its side at each border and moved by velocity of the box center, predicted for the time passed since then.
+    Crop is downscaled so that its side is at most `target_size`. When landmarks are lost, the full frame is used.
+    """
+    def __init__(self, target_size: int = 256, margin: float = 0.3, min_size: int = 96,
+                 velocity_smoothing: float = 0.5) -> None:
+        self._target_size = target_size
+        self._margin = margin
+        self._min_size = min_size
+        self._velocity_smoothing = velocity_smoothing
+        self.reset()
+
+    def reset(self):
+        self._center: np.ndarray|None = None # last box center and side in frame pixels
+        self._side = 0.
+        self._velocity = np.zeros(2) # pixels per ms
+        self._timestamp_ms = None
+
+    def is_tracking(self):
+        return self._center is not None
+
+    def crop(self, frame: np.ndarray, timestamp_ms: int|None = None) -> RoiCrop:
+        frame_height, frame_width = frame.shape[:2]
+        if self._center is None:
+            return RoiCrop(frame, 0, 0, frame_width, frame_height, frame_width, frame_height)
+
+        center = self._center
+        if timestamp_ms is not None and self._timestamp_ms is not None:
+            center = center + self._velocity * (timestamp_ms - self._timestamp_ms)
+        side = int(round(max(self._side * (1 + 2 * self._margin), self._min_size)))
+        if side >= min(frame_width, frame_height):
+            return RoiCrop(frame, 0, 0, frame_width, frame_height, frame_width, frame_height)
+        x0 = int(np.clip(round(center[0] - side / 2), 0, frame_width - side))
+        y0 = int(np.clip(round(center[1] - side / 2), 0, frame_height - side))
+
+        region = frame[y0:y0 + side, x0:x0 + side]
+        if side > self._target_size:
+            image = cv2.resize(region, (self._target_size, self._target_size), interpolation=cv2.INTER_AREA)
+        else:
+            image = np.ascontiguousarray(region)
+        return RoiCrop(image, x0, y0, side, side, frame_width, frame_height)
+
+    def update(self, crop: RoiCrop, landmarks: np.ndarray|None, timestamp_ms: int|None = None):
+        """`landmarks` are (N, 2|3) normalized to the frame (see RoiCrop.to_frame_normalized), None if target was lost"""
+        if landmarks is None or len(landmarks) == 0:
+            self.reset()
+            return
+        xy = np.asarray(landmarks, float)[:, :2] * [crop.frame_width, crop.frame_height]
+        low, high = xy.min(axis=0), xy.max(axis=0)
+        center = (low + high) / 2
+        if self._center is not None and timestamp_ms is not None and self._timestamp_ms is not None \
+                and timestamp_ms > self._timestamp_ms:
+            velocity = (center - self._center) / (timestamp_ms - self._timestamp_ms)
+            self._velocity = self._velocity_smoothing * self._velocity + (1 - self._velocity_smoothing) * velocity
+        else:
+            self._velocity = np.zeros(2)
+        self._center = center
+        self._side = float(max(high - low))
+        self._timestamp_ms = timestamp_ms
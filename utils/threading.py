@@ -1,6 +1,7 @@
 from PyQt6.QtCore import QRunnable, pyqtSignal, QObject, pyqtSlot
 
 
+import threading
 import traceback, sys
 
 class WorkerSignals(QObject):
@@ -77,4 +78,123 @@ class Worker(QRunnable):
             except RuntimeError:
                 pass
             self.is_finished = True
-            self.is_running = False
\ No newline at end of file
+            self.is_running = False
+
+class LatestFrameProcessor(QObject):
+    '''
+    Persistent processing thread with single-slot "latest frame" mailbox.
+
+    `submit(*args)` puts arguments into the mailbox replacing not yet taken ones, so the thread always
+    processes the newest frame and never queues up. Arguments of replaced frames and results older than
+    the last delivered one are passed to `on_dropped`, e.g. to release frame buffers.
+
+    result
+        (fn result, submitted args tuple), emitted in the thread of this object, in submission order
+    error
+        tuple (exctype, value, traceback.format_exc() )
+    '''
+    result = pyqtSignal(object, tuple)
+    error = pyqtSignal(tuple)
+    _processed = pyqtSignal(int, object, tuple)
+
+    def __init__(self, fn, on_dropped=None, parent=None):
+        super().__init__(parent)
+        self.fn = fn
+        self.on_dropped = on_dropped
+        self._cond = threading.Condition()
+        self._pending = None # (sequence number, args)
+        self._sequence = 0
+        self._last_delivered = 0
+        self._running = False
+        self._thread: threading.Thread = None
+        self._num_captured = 0
+        self._num_processed = 0
+        self._num_dropped = 0
+        self._num_stale = 0
+        self._processed.connect(self._deliver)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='LatestFrameProcessor', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        '''Stops the thread after current frame, pending frame is dropped'''
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, None
+            self._cond.notify_all()
+        if pending is not None:
+            self._drop(pending[1])
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        return self._running
+
+    def submit(self, *args) -> int:
+        '''Returns sequence number of submitted frame'''
+        with self._cond:
+            self._sequence += 1
+            self._num_captured += 1
+            replaced, self._pending = self._pending, (self._sequence, args)
+            self._cond.notify()
+            sequence = self._sequence
+        if replaced is not None:
+            self._drop(replaced[1])
+        return sequence
+
+    def counters(self):
+        return {
+            'captured': self._num_captured,
+            'processed': self._num_processed,
+            'dropped': self._num_dropped,
+            'stale': self._num_stale,
+        }
+
+    def _drop(self, args):
+        with self._cond:
+            self._num_dropped += 1
+        if self.on_dropped is not None:
+            self.on_dropped(args)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                sequence, args = self._pending
+                self._pending = None
+            try:
+                result = self.fn(*args)
+            except:
+                traceback.print_exc()
+                exctype, value = sys.exc_info()[:2]
+                self._drop(args)
+                try:
+                    self.error.emit((exctype, value, traceback.format_exc()))
+                except RuntimeError:
+                    pass
+                continue
+            with self._cond:
+                self._num_processed += 1
+            try:
+                self._processed.emit(sequence, result, args)
+            except RuntimeError:
+                return
+
+    @pyqtSlot(int, object, tuple)
+    def _deliver(self, sequence, result, args):
+        if sequence <= self._last_delivered or not self._running:
+            self._num_stale += 1
+            if self.on_dropped is not None:
+                self.on_dropped(args)
+            return
+        self._last_delivered = sequence
+        self.result.emit(result, args)
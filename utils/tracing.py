@@ -0,0 +1,125 @@
+from typing import Callable, Dict, Tuple
+from PyQt6.QtCore import QTimer, Qt
+from PyQt6.QtWidgets import QLabel, QWidget
+import numpy as np
+import threading
+import time
+
+
+# stages of processing of one camera frame:
+#   capture - frame came from camera, convert - frame converted to numpy image, detect - detector finished,
+#   cursor - cursor position computed (ray casting for head), draw - drawer updated, append - sample passed to data saver
+FRAME_SPANS = ('capture', 'convert', 'detect', 'cursor', 'draw', 'append')
+
+
+class FrameTracer:
+    """
+    Span timestamps (time.perf_counter_ns) of last `capacity` frames in a fixed-size ring, keyed by frame timestamp.
+    Marks may come from different threads. Disabled tracer does nothing.
+    """
+    def __init__(self, spans: Tuple[str] = FRAME_SPANS, capacity: int = 512, enabled: bool = True) -> None:
+        self._spans = tuple(spans)
+        self._span_inds = {span: i for i, span in enumerate(self._spans)}
+        self._times = np.zeros((capacity, len(self._spans)), np.int64) # 0 - span was not reached
+        self._frame_ids = np.full(capacity, -1, np.int64)
+        self._frame_slots: Dict[int, int] = {}
+        self._next_slot = 0
+        self._enabled = enabled
+        self._lock = threading.Lock()
+
+    def spans(self):
+        return self._spans
+
+    def is_enabled(self):
+        return self._enabled
+
+    def set_enabled(self, value: bool):
+        self._enabled = bool(value)
+
+    def begin_frame(self, frame_id: int, capture_ns: int|None = None):
+        """Start tracing of frame, first span is marked at `capture_ns` or now"""
+        if not self._enabled:
+            return
+        now = time.perf_counter_ns() if capture_ns is None else capture_ns
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % len(self._frame_ids)
+            self._frame_slots.pop(int(self._frame_ids[slot]), None)
+            self._frame_ids[slot] = frame_id
+            self._frame_slots[frame_id] = slot
+            self._times[slot] = 0
+            self._times[slot, 0] = now
+
+    def mark(self, frame_id: int, span: str):
+        if not self._enabled:
+            return
+        now = time.perf_counter_ns()
+        with self._lock:
+            slot = self._frame_slots.get(frame_id)
+            if slot is not None:
+                self._times[slot, self._span_inds[span]] = now
+
+    def frame_latency_ms(self, frame_id: int) -> np.ndarray:
+        """Time of each span after the first one since frame capture, nan for spans not reached yet"""
+        latency = np.full(len(self._spans) - 1, np.nan)
+        with self._lock:
+            slot = self._frame_slots.get(frame_id)
+            if slot is None:
+                return latency
+            times = self._times[slot].copy()
+        reached = times[1:] > 0
+        latency[reached] = (times[1:][reached] - times[0]) / 1e6
+        return latency
+
+    def latencies_ms(self, span: str) -> np.ndarray:
+        """Latency from capture to `span` of frames in the ring which reached the span"""
+        ind = self._span_inds[span]
+        with self._lock:
+            times = self._times[:, [0, ind]].copy()
+        reached = (times[:, 0] > 0) & (times[:, 1] > 0)
+        return (times[reached, 1] - times[reached, 0]) / 1e6
+
+    def percentiles_ms(self, span: str, q=(50, 95)) -> np.ndarray|None:
+        latencies = self.latencies_ms(span)
+        if len(latencies) == 0:
+            return None
+        return np.percentile(latencies, q)
+
+
+class LatencyOverlay(QLabel):
+    """
+    Label drawn over `parent` widget showing p50/p95 of capture -> detect and capture -> append latencies
+    and frame counters (e.g. LatestFrameProcessor.counters) if given
+    """
+    def __init__(self, tracer: FrameTracer, parent: QWidget, frame_counters: Callable[[], dict]|None = None,
+                 update_interval_ms: int = 500) -> None:
+        super().__init__(parent)
+        self._tracer = tracer
+        self._frame_counters = frame_counters
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setStyleSheet('background-color: rgba(0, 0, 0, 140); color: white; padding: 4px;')
+        self.move(8, 8)
+        self._timer = QTimer(self)
+        self._timer.setInterval(update_interval_ms)
+        self._timer.timeout.connect(self._update_text)
+        self._timer.start()
+        self._update_text()
+
+    def _span_text(self, title, span):
+        percentiles = self._tracer.percentiles_ms(span)
+        if percentiles is None:
+            return f'{title}: -'
+        return f'{title}: p50 {percentiles[0]:.0f} мс, p95 {percentiles[1]:.0f} мс'
+
+    def _update_text(self):
+        self.setVisible(self._tracer.is_enabled())
+        if not self._tracer.is_enabled():
+            return
+        lines = [self._span_text('детекция', 'detect'), self._span_text('до записи', 'append')]
+        if self._frame_counters is not None:
+            counters = self._frame_counters()
+            lines.append(f'кадры: получено {counters["captured"]}, обработано {counters["processed"]}, '
+                         f'пропущено {counters["dropped"]}')
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+        self.raise_()
@@ -0,0 +1,289 @@
+import enum
+import queue
+import threading
+import time
+import typing
+from pathlib import Path
+
+import cv2, numpy as np
+from PyQt6.QtCore import QObject, QSize, QTimer, Qt, pyqtSignal, pyqtSlot
+from PyQt6.QtMultimedia import QVideoFrame, QVideoFrameFormat
+
+from utils.camera_source import FramePool
+
+
+class PlaybackMode(enum.Enum):
+    REALTIME = 'realtime' # frames are emitted at their video timestamps
+    FAST = 'fast' # frames are emitted as soon as they are decoded
+    STEP = 'step' # one frame is emitted per step() call
+
+
+_ROTATIONS = [QVideoFrame.RotationAngle.Rotation0, QVideoFrame.RotationAngle.Rotation90,
+              QVideoFrame.RotationAngle.Rotation180, QVideoFrame.RotationAngle.Rotation270]
+
+
+def convert_bgr_qvideoframe(bgr_image: np.ndarray) -> QVideoFrame:
+    """BGRX video frame with a copy of OpenCV BGR image, convert_qvideoframe_rgb reads it without conversion"""
+    h, w = bgr_image.shape[:2]
+    frame = QVideoFrame(QVideoFrameFormat(QSize(w, h), QVideoFrameFormat.PixelFormat.Format_BGRX8888))
+    frame.map(QVideoFrame.MapMode.WriteOnly)
+    try:
+        stride = frame.bytesPerLine(0)
+        ptr = frame.bits(0)
+        ptr.setsize(frame.mappedBytes(0))
+        plane = np.frombuffer(ptr, np.uint8, count=stride * h).reshape(h, stride)[:, :w * 4].reshape(h, w, 4)
+        plane[:, :, :3] = bgr_image
+        plane[:, :, 3] = 255
+    finally:
+        frame.unmap()
+    return frame
+
+
+class VideoFileSource(QObject):
+    """
+    Frames of a recorded video with the same signals and methods as CameraSource, so experiments run on recordings.
+
+    Frames are decoded by OpenCV (FFmpeg) in a background thread into a short queue and emitted from the thread
+    owning the source. Timestamps of emitted frames are their positions in the video (milliseconds), so trackers
+    see the same timing in every mode:
+    REALTIME - frames are emitted at video rate, as a camera would capture them;
+    FAST - frames are emitted as soon as they are decoded;
+    STEP - a frame is emitted on each step() call, e.g. after the previous frame is processed.
+    """
+    frame_captured = pyqtSignal((QVideoFrame,), (QVideoFrame, int)) # frame, timestamp(milliseconds)
+    video_rotation_angle_changed = pyqtSignal(QVideoFrame.RotationAngle)
+    error_ocured = pyqtSignal(str)
+    playback_finished = pyqtSignal()
+
+    def __init__(self, video_path: str|Path, mode: PlaybackMode = PlaybackMode.REALTIME, loop: bool = False,
+                 prefetch: int = 4, parent=None) -> None:
+        super().__init__(parent)
+        self.video_path = Path(video_path)
+        self._mode = mode
+        self._loop = loop
+        self._prefetch = prefetch
+
+        capture = cv2.VideoCapture(str(self.video_path))
+        self._available = capture.isOpened()
+        self._fps = (capture.get(cv2.CAP_PROP_FPS) if self._available else 0) or 30.
+        self._num_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) if self._available else 0
+        capture.release()
+
+        self._frames: queue.Queue = queue.Queue(prefetch)
+        self._stop_event = threading.Event()
+        self._decoder: threading.Thread|None = None
+        self._pending = None
+        self._running = False
+        self._play_start_ns = 0 # perf_counter_ns corresponding to video position _play_start_ms
+        self._play_start_ms = 0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._emit_due_frame)
+        self._output_connection = None
+
+        self._frame_pool = FramePool()
+        self._captured_ns = time.perf_counter_ns()
+        self._timestamp_ms = 0
+        self._frame_index = -1
+        self._video_frame = None
+        self._do_mirror = False
+        self._capture_rotation_angle = QVideoFrame.RotationAngle.Rotation0
+        if not self._available:
+            print('Video file is not available', self.video_path)
+
+    def name(self):
+        return self.video_path.stem
+
+    def mode(self):
+        return self._mode
+
+    def set_mode(self, mode: PlaybackMode):
+        self._mode = mode
+        if self._running:
+            self._play_start_ns, self._play_start_ms = time.perf_counter_ns(), self._timestamp_ms
+            self._timer.stop()
+            if mode != PlaybackMode.STEP:
+                self._timer.start(0)
+
+    def fps(self):
+        return self._fps
+
+    def num_frames(self):
+        return self._num_frames
+
+    def rotate_clockwise(self):
+        self.set_rotation_angle(_ROTATIONS[(_ROTATIONS.index(self._capture_rotation_angle) + 1) % 4])
+
+    def rotate_counter_clockwise(self):
+        self.set_rotation_angle(_ROTATIONS[(_ROTATIONS.index(self._capture_rotation_angle) - 1) % 4])
+
+    def set_mirrored(self, value: bool):
+        self._do_mirror = value
+
+    def is_mirrored(self):
+        return self._do_mirror
+
+    def frame_pool(self):
+        """Pool of RGB buffers for frames of this source, see convert_qvideoframe_rgb"""
+        return self._frame_pool
+
+    def video_frame_timestamp_ms(self) -> typing.Tuple[QVideoFrame|None, int]:
+        return [self._video_frame, self.timestamp_ms()]
+
+    def video_frame(self):
+        return self._video_frame
+
+    def frame_index(self):
+        """Number of the last emitted frame since source creation"""
+        return self._frame_index
+
+    def captured_ns(self):
+        """time.perf_counter_ns of the last frame emission"""
+        return self._captured_ns
+
+    def timestamp_ms(self):
+        """Position of the last emitted frame in the video, continued over replays"""
+        return self._timestamp_ms
+
+    def start(self):
+        """Play the video from the beginning"""
+        self.stop()
+        if not self._available:
+            self.error_ocured.emit(f'Не удалось открыть видеофайл {self.video_path}')
+            return
+        # timestamps of replayed video continue previous ones, as mediapipe requires increasing timestamps
+        offset_ms = 0 if self._frame_index < 0 else self._timestamp_ms + int(1000 / self._fps)
+        self._stop_event = threading.Event()
+        self._frames = queue.Queue(self._prefetch)
+        self._decoder = threading.Thread(target=self._decode, args=(self._stop_event, self._frames, offset_ms),
+                                         name='VideoFileSource', daemon=True)
+        self._decoder.start()
+        self._running = True
+        self._play_start_ns, self._play_start_ms = time.perf_counter_ns(), offset_ms
+        if self._mode != PlaybackMode.STEP:
+            self._timer.start(0)
+
+    def continue_(self):
+        if self._decoder is None:
+            self.start()
+            return
+        self._running = True
+        self._play_start_ns, self._play_start_ms = time.perf_counter_ns(), self._timestamp_ms
+        if self._mode != PlaybackMode.STEP:
+            self._timer.start(0)
+
+    def suspend(self):
+        self._timer.stop()
+
+    def stop(self):
+        self._timer.stop()
+        self._running = False
+        self._pending = None
+        if self._decoder is not None:
+            self._stop_event.set()
+            # unblock decoder waiting for free place in the queue
+            while self._decoder.is_alive():
+                try:
+                    self._frames.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            self._decoder = None
+
+    def step(self, timeout: float = 1.) -> bool:
+        """Emit the next frame (blocks until it is decoded), False at the end of the video"""
+        if self._decoder is None:
+            self.start()
+        if self._pending is None:
+            try:
+                self._pending = self._frames.get(timeout=timeout)
+            except queue.Empty:
+                return True
+        return self._emit_pending()
+
+    def is_available(self):
+        return self._available
+
+    def is_running(self):
+        return self._running
+
+    def set_video_output(self, output):
+        if self._output_connection is not None:
+            self.disconnect(self._output_connection)
+            self._output_connection = None
+        if output is not None:
+            self._output_connection = self.frame_captured[QVideoFrame].connect(output.videoSink().setVideoFrame)
+
+    def set_rotation_angle(self, rotation_angle: QVideoFrame.RotationAngle):
+        assert isinstance(rotation_angle, QVideoFrame.RotationAngle)
+        self._capture_rotation_angle = rotation_angle
+        self.video_rotation_angle_changed.emit(self._capture_rotation_angle)
+
+    def rotation_angle(self):
+        return self._capture_rotation_angle
+
+    def _decode(self, stop_event: threading.Event, frames: queue.Queue, offset_ms: int):
+        capture = cv2.VideoCapture(str(self.video_path))
+        last_ms = offset_ms - 1
+        index = 0
+        try:
+            while not stop_event.is_set():
+                ok, bgr_image = capture.read()
+                if not ok:
+                    if self._loop and index > 0:
+                        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        offset_ms, index = last_ms + int(1000 / self._fps), 0
+                        continue
+                    frames.put(None)
+                    return
+                # some backends don't report positions, then they are computed from frame rate
+                position_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+                if index > 0 and position_ms <= 0:
+                    position_ms = index * 1000 / self._fps
+                timestamp_ms = max(offset_ms + int(position_ms), last_ms + 1)
+                last_ms = timestamp_ms
+                index += 1
+                frames.put((timestamp_ms, convert_bgr_qvideoframe(bgr_image)))
+        finally:
+            capture.release()
+
+    @pyqtSlot()
+    def _emit_due_frame(self):
+        if not self._running or self._mode == PlaybackMode.STEP:
+            return
+        if self._pending is None:
+            try:
+                self._pending = self._frames.get_nowait()
+            except queue.Empty:
+                # decoding is slower than playback
+                self._timer.start(1)
+                return
+        if self._pending is not None and self._mode == PlaybackMode.REALTIME:
+            due_ns = self._play_start_ns + (self._pending[0] - self._play_start_ms) * 1_000_000
+            wait_ms = (due_ns - time.perf_counter_ns()) / 1e6
+            if wait_ms >= 1:
+                self._timer.start(int(wait_ms))
+                return
+        if self._emit_pending():
+            self._timer.start(0)
+
+    def _emit_pending(self) -> bool:
+        item, self._pending = self._pending, None
+        if item is None:
+            self._timer.stop()
+            self._running = False
+            self._decoder = None
+            self.playback_finished.emit()
+            return False
+
+        timestamp_ms, frame = item
+        frame.setMirrored(self._do_mirror)
+        frame.setRotationAngle(self._capture_rotation_angle)
+        self._timestamp_ms = timestamp_ms
+        self._captured_ns = time.perf_counter_ns()
+        self._frame_index += 1
+        self._video_frame = frame
+        self.frame_captured.emit(self._video_frame)
+        self.frame_captured[QVideoFrame, int].emit(self._video_frame, timestamp_ms)
+        return True
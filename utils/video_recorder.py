@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2, numpy as np
+from PyQt6.QtMultimedia import QVideoFrame
+
+from utils.camera_source import convert_qvideoframe_rgb
+
+
+@dataclass(frozen=True)
+class VideoRecorderStats:
+    queue_depth: int
+    max_queue_depth: int
+    frames_written: int
+    frames_dropped: int # encoder queue was full
+    frames_failed: int # conversion or encoding failed, e.g. frame size changed during recording
+
+
+@dataclass(frozen=True)
+class VideoRecording:
+    path: Path
+    fourcc: str
+    fps: float
+    frame_timestamps_ms: np.ndarray # CameraSource.timestamp_ms of each written frame
+    frame_times_sec: np.ndarray # time.time() of capture of each written frame, same clock as timestamp_sec of records
+    stats: VideoRecorderStats
+
+    def remove(self):
+        if self.path.exists():
+            os.remove(self.path)
+
+
+class VideoRecorder:
+    """
+    Encodes camera frames into a video file in a dedicated thread.
+
+    Frames are queued as they are captured, conversion to BGR and encoding are done by the encoder thread.
+    The queue is bounded by `max_queue_size`, when encoder falls behind new frames are dropped and counted,
+    so capture never waits for the encoder. MJPG codec is used by default, it is available in any OpenCV build
+    and doesn't depend on hardware encoders.
+    """
+    _STOP = object()
+
+    def __init__(self, path: str|Path, fps: float = 30., fourcc: str = 'MJPG', quality: int = 90,
+                 max_queue_size: int = 32) -> None:
+        self._path = Path(path)
+        self._fps = fps
+        self._fourcc = fourcc
+        self._quality = quality
+        self._queue = queue.Queue(max_queue_size)
+        self._thread: threading.Thread|None = None
+        self._lock = threading.Lock()
+        self._frame_timestamps_ms = []
+        self._frame_times_sec = []
+        self._max_queue_depth = 0
+        self._frames_dropped = 0
+        self._frames_failed = 0
+
+    def path(self):
+        return self._path
+
+    def start(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='VideoRecorder', daemon=True)
+        self._thread.start()
+
+    def is_recording(self):
+        return self._thread is not None
+
+    def add_frame(self, frame: QVideoFrame, timestamp_ms: int, time_sec: float) -> bool:
+        """Queue frame for encoding without waiting, False if it was dropped"""
+        if self._thread is None:
+            return False
+        try:
+            self._queue.put_nowait((QVideoFrame(frame), timestamp_ms, time_sec))
+        except queue.Full:
+            with self._lock:
+                self._frames_dropped += 1
+            return False
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return True
+
+    def stats(self) -> VideoRecorderStats:
+        with self._lock:
+            return VideoRecorderStats(self._queue.qsize(), self._max_queue_depth, len(self._frame_timestamps_ms),
+                                      self._frames_dropped, self._frames_failed)
+
+    def stop(self, timeout: float|None = None) -> VideoRecording:
+        """Encode queued frames and close the file"""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            timestamps_ms = np.array(self._frame_timestamps_ms, np.int64)
+            times_sec = np.array(self._frame_times_sec, np.float64)
+        return VideoRecording(self._path, self._fourcc, self._fps, timestamps_ms, times_sec, self.stats())
+
+    def _run(self):
+        writer: cv2.VideoWriter = None
+        rgb_image, bgr_image = None, None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    return
+                frame, timestamp_ms, time_sec = item
+                try:
+                    rgb_image = convert_qvideoframe_rgb(frame, rgb_image)
+                    if writer is None:
+                        height, width = rgb_image.shape[:2]
+                        writer = cv2.VideoWriter(str(self._path), cv2.VideoWriter_fourcc(*self._fourcc), self._fps,
+                                                 (width, height))
+                        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self._quality)
+                        bgr_image = np.empty_like(rgb_image)
+                    if rgb_image.shape != bgr_image.shape:
+                        raise ValueError(f'frame size changed during recording {rgb_image.shape} != {bgr_image.shape}')
+                    cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR, bgr_image)
+                    writer.write(bgr_image)
+                except Exception as e:
+                    print('video recorder error', e)
+                    with self._lock:
+                        self._frames_failed += 1
+                    continue
+                with self._lock:
+                    self._frame_timestamps_ms.append(timestamp_ms)
+                    self._frame_times_sec.append(time_sec)
+        finally:
+            if writer is not None:
+                writer.release()
+
+
+def session_video_path(save_file: str|Path, record_name: str, extension: str = '.avi') -> Path:
+    """Video file of experiment record `record_name` (HDF5 group name) in directory beside `save_file`"""
+    save_file = Path(save_file)
+    return save_file.parent / f'{save_file.stem}_videos' / (record_name.strip('/').replace('/', '_') + extension)